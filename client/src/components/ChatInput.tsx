@@ -85,6 +85,7 @@ export default function ChatInput({
       message,
       userId: userId,
       sessionId: sessionId,
+      scenarioId: localStorage.getItem("scenarioId") || undefined,
       audio: audioBlob || undefined,
       image: whiteboardBlob || undefined,
     });
@@ -95,6 +96,7 @@ export default function ChatInput({
       message,
       userId: userId,
       sessionId: sessionId,
+      scenarioId: localStorage.getItem("scenarioId") || undefined,
       audio: audioBlob || undefined,
       image: whiteboardBlob || undefined,
     });
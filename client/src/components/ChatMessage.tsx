@@ -51,6 +51,18 @@ export default function ChatMessage({ message }: { message: AgentResponse }) {
       return;
     }
 
+    if (message.audio_url && !message.audio) {
+      if (audioRef.current) {
+        audioRef.current.pause();
+      }
+      const audio = new Audio(message.audio_url);
+      audioRef.current = audio;
+      audio.onended = () => setIsPlaying(false);
+      audio.onerror = () => setIsPlaying(false);
+      audio.play().then(() => setIsPlaying(true));
+      return;
+    }
+
     if (message.audio && !audioUrl) {
       try {
         const base64Data = message.audio.replace(/\s/g, "");
@@ -149,7 +161,7 @@ export default function ChatMessage({ message }: { message: AgentResponse }) {
                     <div className="media-content">
                       <div className="content">
                         <ReactMarkdown>{message.content}</ReactMarkdown>
-                        {message.audio && (
+                        {(message.audio || message.audio_url) && (
                           <button
                             className={`button is-small ${
                               isPlaying ? "is-danger" : "is-info"
@@ -0,0 +1,41 @@
+/**
+ * G.711 μ-law codec for the live websocket, 8 bits per sample instead of 16
+ */
+
+const BIAS = 0x84;
+const CLIP = 32635;
+
+// Decoded sample of every μ-law byte
+const DECODE_TABLE = new Int16Array(256);
+for (let i = 0; i < 256; i++) {
+  const code = ~i & 0xff;
+  const magnitude = (((code & 0x0f) << 3) + BIAS) << ((code >> 4) & 0x07);
+  DECODE_TABLE[i] = code & 0x80 ? BIAS - magnitude : magnitude - BIAS;
+}
+
+// Encodes an ArrayBuffer of 16-bit PCM into μ-law bytes.
+export function encodeMulaw(pcmBuffer) {
+  const samples = new Int16Array(pcmBuffer);
+  const encoded = new Uint8Array(samples.length);
+  for (let i = 0; i < samples.length; i++) {
+    let sample = samples[i];
+    const sign = sample < 0 ? 0x80 : 0;
+    // Like the G.711 reference, negative magnitudes round up to a multiple of 4
+    sample = sample < 0 ? -(sample >> 2) << 2 : sample;
+    sample = Math.min(sample, CLIP) + BIAS;
+    const exponent = Math.max(31 - Math.clz32(sample >> 7), 0);
+    const mantissa = (sample >> (exponent + 3)) & 0x0f;
+    encoded[i] = ~(sign | (exponent << 4) | mantissa) & 0xff;
+  }
+  return encoded.buffer;
+}
+
+// Decodes μ-law bytes into an ArrayBuffer of 16-bit PCM.
+export function decodeMulaw(mulawBuffer) {
+  const codes = new Uint8Array(mulawBuffer);
+  const samples = new Int16Array(codes.length);
+  for (let i = 0; i < codes.length; i++) {
+    samples[i] = DECODE_TABLE[codes[i]];
+  }
+  return samples.buffer;
+}
@@ -3,6 +3,7 @@ export interface AgentRequest {
   message: string;
   sessionId: string;
   userId: string;
+  scenarioId?: string; // The scenario selected by this user
   audio?: Blob;
   image?: Blob;
 }
@@ -13,6 +14,7 @@ export interface AgentResponse {
   author: string;
   message_id: string | null;
   audio?: string; // Base64 encoded audio data
+  audio_url?: string; // URL of audio synthesized on demand
   markdown_text?: string; // Markdown formatted feedback text
   imageObjectUrl?: string; // Optional local URL for a user-attached image
   imageDataUrl?: string; // Optional data URL for a user-attached image
@@ -1,5 +1,6 @@
 export interface CreateSessionRequest {
   user_id: string;
+  scenario_id?: string;
 }
 
 export interface GetAllSessionsForUserRequest {
@@ -28,6 +29,7 @@ export interface ConversationTurn {
   author: string;
   message_id: string;
   audio?: string;
+  audio_url?: string;
 }
 
 export interface ConversationResponse {
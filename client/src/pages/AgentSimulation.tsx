@@ -98,7 +98,10 @@ export default function AgentSimulation() {
       setConversation([]);
       setLatestFeedback("");
 
-      const result = await createSession({ user_id: userId }).unwrap();
+      const result = await createSession({
+        user_id: userId,
+        scenario_id: localStorage.getItem("scenarioId") || undefined,
+      }).unwrap();
       console.log("Create session result:", result);
 
       if (result && result.sessions && result.sessions.length > 0) {
@@ -18,7 +18,10 @@ export default function ScenarioSelection() {
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
-    setScenario(scenarios[selectedScenario].id.toString());
+    const scenarioId = scenarios[selectedScenario].id.toString();
+    // Requests name the scenario, the server wide selection is only a fallback
+    localStorage.setItem("scenarioId", scenarioId);
+    setScenario(scenarioId);
     navigate(`/scenario-introduction`);
   };
 
@@ -5,6 +5,8 @@ import { useState, useRef } from "react";
 import { startAudioPlayerWorklet } from "../helpers/audio-player.js";
 // @ts-expect-error - Audio recorder worklet
 import { startAudioRecorderWorklet } from "../helpers/audio-recorder.js";
+// @ts-expect-error - μ-law codec
+import { decodeMulaw, encodeMulaw } from "../helpers/mulaw.js";
 
 interface WebSocketMessage {
   mime_type?: string;
@@ -12,8 +14,12 @@ interface WebSocketMessage {
   turn_complete?: boolean;
   interrupted?: boolean;
   error?: string;
+  audio_format?: { codec: string; input_rate: number; output_rate: number };
 }
 
+// Codec requested when connecting, the server may fall back to pcm16
+const REQUESTED_CODEC = "mulaw";
+
 // Generate sessionId once outside component (like in app.js)
 const sessionId = Math.floor(Math.random() * 1000000).toString();
 
@@ -34,13 +40,21 @@ export default function WebSocketAgentSimulation() {
   const bufferTimerRef = useRef<number | null>(null);
   const currentMessageRef = useRef<string>("");
   const currentMessageIdRef = useRef<string | null>(null);
+  // Null until the server announces the codec it picked
+  const codecRef = useRef<string | null>(null);
 
   // WebSocket connection function (not memoized to avoid dependency issues)
   const connectWebSocket = (audioMode = isAudio) => {
-    const wsUrl = `ws://localhost:8000/agent/ws/${userId}/${sessionId}?is_audio=${audioMode}`;
+    // Binary protocol: audio travels as raw frames, everything else as JSON
+    const scenarioId = localStorage.getItem("scenarioId");
+    const wsUrl =
+      `ws://localhost:8000/agent/ws/${userId}/${sessionId}?is_audio=${audioMode}&protocol=binary&codec=${REQUESTED_CODEC}` +
+      (scenarioId ? `&scenario_id=${scenarioId}` : "");
+    codecRef.current = null;
     console.log("Connecting to WebSocket:", wsUrl);
 
     const ws = new WebSocket(wsUrl);
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
       console.log("WebSocket connection opened successfully.");
@@ -48,9 +62,23 @@ export default function WebSocketAgentSimulation() {
     };
 
     ws.onmessage = (event) => {
+      // Binary frames are always audio
+      if (event.data instanceof ArrayBuffer) {
+        audioPlayerNodeRef.current?.port.postMessage(
+          codecRef.current === "mulaw" ? decodeMulaw(event.data) : event.data
+        );
+        return;
+      }
+
       const messageFromServer: WebSocketMessage = JSON.parse(event.data);
       console.log("[AGENT TO CLIENT]", messageFromServer);
 
+      // The server tells which codec it picked
+      if (messageFromServer.audio_format) {
+        codecRef.current = messageFromServer.audio_format.codec;
+        return;
+      }
+
       // Check if the turn is complete
       if (messageFromServer.turn_complete) {
         console.log("Turn completed, resetting currentMessageId");
@@ -73,16 +101,6 @@ export default function WebSocketAgentSimulation() {
         return;
       }
 
-      // If it's audio, play it
-      if (
-        messageFromServer.mime_type === "audio/pcm" &&
-        audioPlayerNodeRef.current
-      ) {
-        audioPlayerNodeRef.current.port.postMessage(
-          base64ToArray(messageFromServer.data!)
-        );
-      }
-
       // If it's text, display it
       // TODO: make this a separate component that displays the messages
       if (messageFromServer.mime_type === "text/plain") {
@@ -161,28 +179,6 @@ export default function WebSocketAgentSimulation() {
     }
   };
 
-  // TODO: move utility functions to a separate file
-  // Audio utility functions
-  const base64ToArray = (base64: string): ArrayBuffer => {
-    const binaryString = window.atob(base64);
-    const len = binaryString.length;
-    const bytes = new Uint8Array(len);
-    for (let i = 0; i < len; i++) {
-      bytes[i] = binaryString.charCodeAt(i);
-    }
-    return bytes.buffer;
-  };
-
-  const arrayBufferToBase64 = (buffer: ArrayBuffer): string => {
-    let binary = "";
-    const bytes = new Uint8Array(buffer);
-    const len = bytes.byteLength;
-    for (let i = 0; i < len; i++) {
-      binary += String.fromCharCode(bytes[i]);
-    }
-    return window.btoa(binary);
-  };
-
   // Audio recorder handler
   const audioRecorderHandler = (pcmData: ArrayBuffer) => {
     // Add audio data to buffer
@@ -196,7 +192,8 @@ export default function WebSocketAgentSimulation() {
 
   // Send buffered audio data every 0.2 seconds
   const sendBufferedAudio = () => {
-    if (audioBufferRef.current.length === 0) {
+    // Hold the audio until the server tells how to encode it
+    if (audioBufferRef.current.length === 0 || codecRef.current === null) {
       return;
     }
 
@@ -214,11 +211,17 @@ export default function WebSocketAgentSimulation() {
       offset += chunk.length;
     }
 
-    // Send the combined audio data
-    sendMessage({
-      mime_type: "audio/pcm",
-      data: arrayBufferToBase64(combinedBuffer.buffer),
-    });
+    // Send the combined audio data as a binary frame
+    if (
+      websocketRef.current &&
+      websocketRef.current.readyState === WebSocket.OPEN
+    ) {
+      websocketRef.current.send(
+        codecRef.current === "mulaw"
+          ? encodeMulaw(combinedBuffer.buffer)
+          : combinedBuffer.buffer
+      );
+    }
     console.log("[CLIENT TO AGENT] sent %s bytes", combinedBuffer.byteLength);
 
     // Clear the buffer
@@ -18,6 +18,7 @@ const agentAPI = createApi({
               user_id: agentRequest.userId,
               session_id: agentRequest.sessionId,
               message: agentRequest.message,
+              scenario_id: agentRequest.scenarioId,
             },
           };
         },
@@ -32,6 +33,9 @@ const agentAPI = createApi({
           formData.append("message", agentRequest.message);
           formData.append("user_id", agentRequest.userId);
           formData.append("session_id", agentRequest.sessionId);
+          if (agentRequest.scenarioId) {
+            formData.append("scenario_id", agentRequest.scenarioId);
+          }
 
           if (agentRequest.audio) {
             formData.append("audio", agentRequest.audio, "recording.webm");
@@ -81,7 +85,8 @@ const agentAPI = createApi({
           sessionId: string;
         }) => {
           return {
-            url: `/conversation/${userId}/${sessionId}`,
+            // Audio is fetched per turn when played instead of inlined
+            url: `/conversation/${userId}/${sessionId}?include_audio=false`,
             method: "GET",
           };
         },
@@ -92,6 +97,7 @@ const agentAPI = createApi({
             author: string;
             message_id: string;
             audio: string | null;
+            audio_url: string | null;
           }>;
         }) => {
           console.log("Conversation response:", response);
@@ -102,6 +108,7 @@ const agentAPI = createApi({
               author: turn.author,
               message_id: turn.message_id,
               audio: turn.audio || undefined,
+              audio_url: turn.audio_url ? host + turn.audio_url : undefined,
             })),
           };
         },
@@ -116,6 +123,7 @@ const agentAPI = createApi({
               user_id: agentRequest.userId,
               session_id: agentRequest.sessionId,
               message: agentRequest.message,
+              scenario_id: agentRequest.scenarioId,
             },
           };
         },
@@ -127,6 +135,9 @@ const agentAPI = createApi({
           formData.append("message", agentRequest.message);
           formData.append("user_id", agentRequest.userId);
           formData.append("session_id", agentRequest.sessionId);
+          if (agentRequest.scenarioId) {
+            formData.append("scenario_id", agentRequest.scenarioId);
+          }
 
           if (agentRequest.audio) {
             formData.append("audio", agentRequest.audio, "recording.webm");
@@ -65,4 +65,11 @@ def load_root_agent(file_path: str = "server/orm/root_agent.yaml") -> Agent:
     )
 
 
-streaming_root_agent = load_root_agent()
+def __getattr__(name: str):
+    # The ADK CLI looks up the agent by name, it is built on that first lookup
+    # instead of whenever the module is imported
+    if name == "streaming_root_agent":
+        global streaming_root_agent
+        streaming_root_agent = load_root_agent()
+        return streaming_root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -18,4 +18,10 @@ def load_feedback_agent(file_path: str = "server/orm/feedback_agent.yaml") -> Ag
     )
 
 
-feedback_agent = load_feedback_agent()
+def __getattr__(name: str):
+    # Built on first lookup instead of whenever the module is imported
+    if name == "feedback_agent":
+        global feedback_agent
+        feedback_agent = load_feedback_agent()
+        return feedback_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
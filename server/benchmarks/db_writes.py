@@ -0,0 +1,275 @@
+"""Benchmarks concurrent turn writes to the session database.
+
+Usage:
+    python -m server.benchmarks.db_writes --sessions 50 --turns 10
+
+Run from the repository root. Every mode gets a new database file, creates the
+sessions and then runs their turns concurrently, each turn appending the
+events of a model turn. An admin thread keeps updating a scenario at the same
+time, like the admin routes. The modes are:
+
+    separate  The storage before the unified layer: ADK and the app models on
+              engines of their own with the default journal, events written on
+              the event loop
+    unified   One engine with WAL and the tuned pragmas, events and admin
+              writes committed in batches by the database writer
+
+A probe measures how late a short sleep wakes up throughout the run, which is
+how long the event loop was blocked by the writes.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import BaseSessionService
+from google.adk.sessions.database_session_service import DatabaseSessionService
+from google.genai import types
+from pydantic import BaseModel
+from sqlalchemy import Engine
+from sqlmodel import Session, SQLModel, create_engine
+
+from server.benchmarks.load_test import LatencyRecorder, OperationStats
+from server.dependencies.database import DatabaseWriter, create_storage_engine
+from server.models.agent_model import Scenario
+from server.service.session_service import StorageSessionService
+
+APP_NAME = "db-writes-benchmark"
+MODES = ("separate", "unified")
+PROBE_INTERVAL_SECONDS = 0.01
+
+
+class ModeReport(BaseModel):
+    mode: str
+    wall_seconds: float
+    events_per_second: float
+    admin_writes: int
+    admin_errors: int
+    operations: list[OperationStats]
+
+
+class BenchmarkReport(BaseModel):
+    settings: dict
+    modes: list[ModeReport]
+
+
+class Storage(BaseModel, arbitrary_types_allowed=True):
+    """The session service of a mode and how the admin thread writes"""
+
+    session_service: BaseSessionService
+    admin_write: Callable[[Callable[[Session], None]], None]
+    engines: list[Engine]
+    writer: DatabaseWriter | None = None
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.stop()
+        for db_engine in self.engines:
+            db_engine.dispose()
+
+
+def create_storage(mode: str, db_path: str) -> Storage:
+    url = f"sqlite:///{db_path}"
+    if mode == "separate":
+        app_engine = create_engine(url, connect_args={"check_same_thread": False})
+        session_service = DatabaseSessionService(db_url=url)
+
+        def admin_write(write: Callable[[Session], None]) -> None:
+            with Session(app_engine) as session:
+                write(session)
+                session.commit()
+
+        return Storage(
+            session_service=session_service,
+            admin_write=admin_write,
+            engines=[app_engine, session_service.db_engine],
+        )
+
+    db_engine = create_storage_engine(url)
+    writer = DatabaseWriter(db_engine)
+    writer.start()
+    return Storage(
+        session_service=StorageSessionService(db_engine, writer),
+        admin_write=lambda write: writer.submit(write).result(),
+        engines=[db_engine],
+        writer=writer,
+    )
+
+
+def turn_events(turn: int, events_per_turn: int) -> list[Event]:
+    """The events of a turn, the user message first and the state change last"""
+    events = []
+    for index in range(events_per_turn):
+        author = "user" if index == 0 else "root_agent"
+        text = f"Turn {turn}, event {index}: " + "words of the turn " * 20
+        events.append(
+            Event(
+                invocation_id=f"turn-{turn}",
+                author=author,
+                content=types.Content(
+                    role="user" if author == "user" else "model",
+                    parts=[types.Part.from_text(text=text)],
+                ),
+                actions=EventActions(
+                    state_delta={"turn": turn} if index == events_per_turn - 1 else {}
+                ),
+            )
+        )
+    return events
+
+
+async def run_session(
+    storage: Storage,
+    index: int,
+    args: argparse.Namespace,
+    recorder: LatencyRecorder,
+) -> None:
+    session = await storage.session_service.create_session(
+        app_name=APP_NAME, user_id=f"teacher-{index}", session_id=f"session-{index}"
+    )
+    for turn in range(args.turns):
+        async with recorder.measure("turn"):
+            for event in turn_events(turn, args.events_per_turn):
+                async with recorder.measure("append_event"):
+                    await storage.session_service.append_event(session, event)
+        await asyncio.sleep(args.think_ms / 1000)
+
+
+def run_admin(storage: Storage, stop: threading.Event, counts: dict) -> None:
+    """Keeps renaming a scenario until stopped, like an admin editing it"""
+
+    def rename(session: Session) -> None:
+        scenario = session.get(Scenario, 1)
+        scenario.name = f"Benchmark scenario {counts['writes']}"
+        session.add(scenario)
+
+    while not stop.is_set():
+        try:
+            storage.admin_write(rename)
+            counts["writes"] += 1
+        except Exception:
+            counts["errors"] += 1
+        time.sleep(0.001)
+
+
+async def probe_event_loop(recorder: LatencyRecorder, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+        recorder.add("loop_delay", time.perf_counter() - start - PROBE_INTERVAL_SECONDS)
+
+
+def create_scenario(db_path: str) -> None:
+    setup_engine = create_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(setup_engine)
+    with Session(setup_engine) as session:
+        session.add(
+            Scenario(
+                id=1,
+                name="Benchmark scenario",
+                description="",
+                overview="",
+                system_instructions="",
+                initial_prompt="",
+            )
+        )
+        session.commit()
+    setup_engine.dispose()
+
+
+async def run_mode(mode: str, args: argparse.Namespace) -> ModeReport:
+    with tempfile.TemporaryDirectory(prefix="server-db-writes-") as work_dir:
+        db_path = os.path.join(work_dir, "db_writes.db")
+        create_scenario(db_path)
+        storage = create_storage(mode, db_path)
+        recorder = LatencyRecorder()
+        admin_counts = {"writes": 0, "errors": 0}
+        stop_admin = threading.Event()
+        stop_probe = asyncio.Event()
+        admin = threading.Thread(
+            target=run_admin, args=(storage, stop_admin, admin_counts)
+        )
+        probe = asyncio.create_task(probe_event_loop(recorder, stop_probe))
+        admin.start()
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(
+                *(
+                    run_session(storage, index, args, recorder)
+                    for index in range(args.sessions)
+                ),
+                return_exceptions=True,
+            )
+            wall_seconds = time.perf_counter() - start
+        finally:
+            stop_admin.set()
+            stop_probe.set()
+            admin.join()
+            await probe
+            storage.close()
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        print(f"{mode}: {len(failed)} sessions failed, first error: {failed[0]!r}")
+    events = len(recorder.latencies.get("append_event", []))
+    return ModeReport(
+        mode=mode,
+        wall_seconds=wall_seconds,
+        events_per_second=events / wall_seconds,
+        admin_writes=admin_counts["writes"],
+        admin_errors=admin_counts["errors"],
+        operations=recorder.get_stats(wall_seconds),
+    )
+
+
+def print_report(report: BenchmarkReport) -> None:
+    header = (
+        f"{'mode':<10}{'operation':<14}{'count':>7}{'errors':>7}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for mode in report.modes:
+        for stats in mode.operations:
+            print(
+                f"{mode.mode:<10}{stats.operation:<14}{stats.count:>7}"
+                f"{stats.errors:>7}{stats.p50_ms:>10.1f}{stats.p95_ms:>10.1f}"
+                f"{stats.p99_ms:>10.1f}{stats.max_ms:>10.1f}"
+            )
+    print()
+    for mode in report.modes:
+        print(
+            f"{mode.mode:<10}{mode.events_per_second:>8.0f} events per second in "
+            f"{mode.wall_seconds:.1f}s, {mode.admin_writes} admin writes, "
+            f"{mode.admin_errors} failed"
+        )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10, help="Turns each")
+    parser.add_argument("--events-per-turn", type=int, default=4)
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between turns")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    modes = [asyncio.run(run_mode(mode, args)) for mode in args.modes]
+    report = BenchmarkReport(settings=vars(args), modes=modes)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            report_file.write(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import asyncio
+import collections
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import re
+from typing import AsyncGenerator, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.adk.models.google_llm import Gemini
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+from pydantic import BaseModel, Field
+from websockets.exceptions import ConnectionClosedOK
+
+from server.service.audio_codecs import (
+    MODEL_INPUT_RATE,
+    MODEL_OUTPUT_RATE,
+    SAMPLE_WIDTH,
+)
+
+TRANSFER_TOOL = "transfer_to_agent"
+# Targets are listed like this in the instruction ADK adds for transfers
+TARGET_AGENT = re.compile(r"^Agent name: (\S+)$", re.MULTILINE)
+# Sub agents are told about their parent, only root agents transfer
+PARENT_AGENT = "Your parent agent is"
+# Every agent is told its own name in the instruction ADK adds
+AGENT_NAME = re.compile(r'Your internal name is "([^"]+)"')
+
+WORDS = (
+    "the class could try solving it with a table first because each step "
+    "shows how the two sides of the equation stay balanced while we move terms "
+    "I think the answer changes when the number is negative so we should check "
+    "our work with a drawing and explain why the pattern keeps repeating"
+).split()
+SENTENCE_WORDS = 12
+# Roughly how long a token takes to speak in the audio of a live response
+SPOKEN_SECONDS_PER_TOKEN = 0.25
+
+
+class FakeLlmSettings(BaseModel):
+    """Latency and size of the fake responses, read from FAKE_LLM_* variables"""
+
+    first_token_ms: float = Field(
+        default_factory=lambda: float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", 300))
+    )
+    tokens_per_second: float = Field(
+        default_factory=lambda: float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", 50))
+    )
+    response_tokens: int = Field(
+        default_factory=lambda: int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", 40))
+    )
+    chunk_tokens: int = Field(
+        default_factory=lambda: int(os.getenv("FAKE_LLM_CHUNK_TOKENS", 8))
+    )
+    # Audio a live session has to receive before the model answers
+    live_turn_ms: int = Field(
+        default_factory=lambda: int(os.getenv("FAKE_LLM_LIVE_TURN_MS", 1000))
+    )
+
+
+def fake_text_chunks(seed: str, settings: FakeLlmSettings) -> list[str]:
+    """Returns the chunks of a deterministic response to the seed text"""
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    tokens = []
+    for i in range(settings.response_tokens):
+        word = WORDS[(digest[i % len(digest)] + i) % len(WORDS)]
+        end = "." if (i + 1) % SENTENCE_WORDS == 0 else ""
+        tokens.append(f"{word}{end} ")
+    tokens[-1] = tokens[-1].rstrip(". ") + ". "
+    return [
+        "".join(tokens[start : start + settings.chunk_tokens])
+        for start in range(0, len(tokens), settings.chunk_tokens)
+    ]
+
+
+async def paced_chunks(
+    chunks: list[str], settings: FakeLlmSettings
+) -> AsyncGenerator[str, None]:
+    """Yields the chunks after the first token latency, at the token rate"""
+    await asyncio.sleep(settings.first_token_ms / 1000)
+    for chunk in chunks:
+        tokens = len(chunk.split())
+        await asyncio.sleep(tokens / settings.tokens_per_second)
+        yield chunk
+
+
+class ScriptedOutput(BaseModel):
+    """A recorded model output, the text of an answer or the target of a transfer"""
+
+    text: Optional[str] = None
+    transfer: Optional[str] = None
+    # Seconds the output took in the recorded session
+    delay: float = 0.0
+
+
+class FakeLlmScript:
+    """Recorded outputs the fake model plays back instead of its generated text.
+
+    The script maps a user message to the outputs of every agent that answered
+    it, in the order they were recorded. Messages that are sent again get the
+    next recorded output, once the outputs run out the model falls back to
+    generated text.
+    """
+
+    def __init__(self, outputs: dict[str, dict[str, list[ScriptedOutput]]]):
+        self.outputs = outputs
+        self._played: collections.Counter[tuple[str, str]] = collections.Counter()
+
+    @classmethod
+    def load(cls, path: str) -> "FakeLlmScript":
+        with open(path, encoding="utf-8") as script_file:
+            raw = json.load(script_file)
+        return cls(
+            {
+                message: {
+                    agent: [ScriptedOutput(**output) for output in outputs]
+                    for agent, outputs in agents.items()
+                }
+                for message, agents in raw.items()
+            }
+        )
+
+    def next_output(
+        self, llm_request: LlmRequest, agent: str
+    ) -> Optional[ScriptedOutput]:
+        """Returns the next recorded output of the agent for the request, if any"""
+        for content in reversed(llm_request.contents):
+            if content.role != "user" or not content.parts:
+                continue
+            text = "".join(part.text or "" for part in content.parts)
+            outputs = self.outputs.get(text, {}).get(agent)
+            if outputs is None:
+                continue
+            played = self._played[(text, agent)]
+            if played >= len(outputs):
+                return None
+            self._played[(text, agent)] += 1
+            return outputs[played]
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_script() -> Optional[FakeLlmScript]:
+    """Returns the script of FAKE_LLM_SCRIPT, shared by every fake model"""
+    path = os.getenv("FAKE_LLM_SCRIPT")
+    return FakeLlmScript.load(path) if path else None
+
+
+def last_user_text(llm_request: LlmRequest) -> str:
+    for content in reversed(llm_request.contents):
+        if content.role == "user" and content.parts:
+            text = "".join(part.text or "" for part in content.parts)
+            if text:
+                return text
+    return ""
+
+
+def system_instruction(llm_request: LlmRequest) -> str:
+    config = llm_request.config
+    return str((config and config.system_instruction) or "")
+
+
+def transfer_response(target: str) -> LlmResponse:
+    return LlmResponse(
+        content=types.ModelContent(
+            parts=[
+                types.Part.from_function_call(
+                    name=TRANSFER_TOOL, args={"agent_name": target}
+                )
+            ]
+        )
+    )
+
+
+class FakeLlm(BaseLlm):
+    """Stands in for Gemini so the server runs without any Google API.
+
+    Answers with deterministic text derived from the last user message, after a
+    first token latency and at a fixed token rate. Root agents with sub agents
+    transfer to one of them, picked from the message, so multi agent turns do
+    the same runner and session work as with the real model. With a script in
+    FAKE_LLM_SCRIPT, recorded outputs are played back instead. Live sessions
+    answer with text or 24 kHz PCM audio once enough audio was received.
+    """
+
+    settings: FakeLlmSettings = Field(default_factory=FakeLlmSettings)
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return Gemini.supported_models()
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        scripted = self._scripted_output(llm_request)
+        if scripted:
+            await asyncio.sleep(scripted.delay)
+            if scripted.transfer:
+                yield transfer_response(scripted.transfer)
+            else:
+                yield LlmResponse(
+                    content=types.ModelContent(
+                        parts=[types.Part.from_text(text=scripted.text or "")]
+                    )
+                )
+            return
+
+        text = last_user_text(llm_request)
+        target = self._transfer_target(llm_request, text)
+        if target:
+            await asyncio.sleep(self.settings.first_token_ms / 1000)
+            yield transfer_response(target)
+            return
+
+        seed = f"{llm_request.model}:{text}"
+        response_text = ""
+        async for chunk in paced_chunks(
+            fake_text_chunks(seed, self.settings), self.settings
+        ):
+            response_text += chunk
+            if stream:
+                yield LlmResponse(
+                    content=types.ModelContent(
+                        parts=[types.Part.from_text(text=chunk)]
+                    ),
+                    partial=True,
+                )
+        yield LlmResponse(
+            content=types.ModelContent(
+                parts=[types.Part.from_text(text=response_text.strip())]
+            )
+        )
+
+    @contextlib.asynccontextmanager
+    async def connect(self, llm_request: LlmRequest):
+        modalities = llm_request.live_connect_config.response_modalities or []
+        connection = FakeLlmConnection(
+            self.settings, audio=types.Modality.AUDIO in modalities
+        )
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+    def _scripted_output(self, llm_request: LlmRequest) -> Optional[ScriptedOutput]:
+        script = get_script()
+        if script is None:
+            return None
+        instruction = system_instruction(llm_request)
+        agent = AGENT_NAME.search(instruction)
+        if not agent:
+            return None
+        output = script.next_output(llm_request, agent.group(1))
+        # Transfers to agents the scenario no longer has fall back as well
+        if output and output.transfer:
+            if output.transfer not in TARGET_AGENT.findall(instruction):
+                return None
+        return output
+
+    def _transfer_target(self, llm_request: LlmRequest, text: str) -> Optional[str]:
+        if TRANSFER_TOOL not in llm_request.tools_dict:
+            return None
+        instruction = system_instruction(llm_request)
+        if PARENT_AGENT in instruction:
+            return None
+        targets = TARGET_AGENT.findall(instruction)
+        if not targets:
+            return None
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return targets[digest[0] % len(targets)]
+
+
+class FakeLlmConnection(BaseLlmConnection):
+    """Live connection of the fake model, answers in the background like Gemini"""
+
+    def __init__(self, settings: FakeLlmSettings, audio: bool):
+        self.settings = settings
+        self.audio = audio
+        self._responses: asyncio.Queue[Optional[LlmResponse]] = asyncio.Queue()
+        self._turn_bytes = (
+            MODEL_INPUT_RATE * SAMPLE_WIDTH * settings.live_turn_ms // 1000
+        )
+        self._received_bytes = 0
+        self._audio_turns = 0
+        self._turn: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def send_history(self, history: list[types.Content]):
+        pass
+
+    async def send_content(self, content: types.Content):
+        text = "".join(part.text or "" for part in content.parts or [])
+        if text:
+            self._start_turn(text)
+
+    async def send_realtime(self, blob: types.Blob):
+        self._received_bytes += len(blob.data or b"")
+        if self._received_bytes >= self._turn_bytes:
+            self._received_bytes = 0
+            self._audio_turns += 1
+            self._start_turn(f"audio turn {self._audio_turns}")
+
+    async def receive(self) -> AsyncGenerator[LlmResponse, None]:
+        while True:
+            response = await self._responses.get()
+            if response is None:
+                raise ConnectionClosedOK(None, None)
+            yield response
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._turn and not self._turn.done():
+            self._turn.cancel()
+        self._responses.put_nowait(None)
+
+    def _start_turn(self, seed: str) -> None:
+        # A new turn interrupts the answer that is still being generated
+        if self._turn and not self._turn.done():
+            self._turn.cancel()
+            self._responses.put_nowait(LlmResponse(interrupted=True))
+        self._turn = asyncio.create_task(self._answer(seed))
+
+    async def _answer(self, seed: str) -> None:
+        text = ""
+        async for chunk in paced_chunks(
+            fake_text_chunks(seed, self.settings), self.settings
+        ):
+            if self.audio:
+                seconds = len(chunk.split()) * SPOKEN_SECONDS_PER_TOKEN
+                pcm = bytes(int(MODEL_OUTPUT_RATE * seconds) * SAMPLE_WIDTH)
+                part = types.Part.from_bytes(
+                    data=pcm, mime_type=f"audio/pcm;rate={MODEL_OUTPUT_RATE}"
+                )
+                self._responses.put_nowait(
+                    LlmResponse(content=types.ModelContent(parts=[part]))
+                )
+            else:
+                text += chunk
+                self._responses.put_nowait(
+                    LlmResponse(
+                        content=types.ModelContent(
+                            parts=[types.Part.from_text(text=chunk)]
+                        ),
+                        partial=True,
+                    )
+                )
+        if text:
+            self._responses.put_nowait(
+                LlmResponse(
+                    content=types.ModelContent(
+                        parts=[types.Part.from_text(text=text.strip())]
+                    )
+                )
+            )
+        self._responses.put_nowait(LlmResponse(turn_complete=True))
+
+
+def register_fake_llm() -> None:
+    """Routes every Gemini model name to FakeLlm, call it before agents are built"""
+    LLMRegistry.register(FakeLlm)
+    LLMRegistry.resolve.cache_clear()
@@ -0,0 +1,439 @@
+"""Load test of the server with concurrent virtual teachers.
+
+Usage:
+    python -m server.benchmarks.load_test --teachers 20 --turns 5
+
+Run from the repository root. Starts server.benchmarks.serve in a subprocess
+with the fake backends, unless --url points at a server that is already
+running. Every virtual teacher creates a session, runs turns against
+/agent/request with every other message uploaded as audio, reads the session
+and scenario routes in between, and then speaks a few turns over the live
+websocket. A probe requests a route without any I/O throughout the run, its
+latency shows how long the event loop was blocked.
+
+The report has the p50, p95 and p99 latency and the throughput per operation,
+and the resident memory of the server process.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import httpx
+import numpy as np
+import psutil
+import websockets
+from pydantic import BaseModel
+
+from server.service.audio_codecs import MODEL_INPUT_RATE
+
+SCENARIO_ID = 1
+ROOT_AGENT_NAME = "root_agent"
+# A route that does no I/O, its latency is the event loop delay
+PROBE_PATH = "/agent/audio-codecs"
+PROBE_INTERVAL_SECONDS = 0.1
+MEMORY_INTERVAL_SECONDS = 0.5
+SERVER_START_TIMEOUT_SECONDS = 60
+SERVER_STOP_TIMEOUT_SECONDS = 10
+WS_FRAME_MS = 100
+WS_RESPONSE_TIMEOUT_SECONDS = 60
+BYTES_PER_MB = 1024 * 1024
+
+
+class OperationStats(BaseModel):
+    operation: str
+    count: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    max_ms: float
+    per_second: float
+
+
+class MemoryStats(BaseModel):
+    start_mb: float
+    peak_mb: float
+    end_mb: float
+
+
+class BenchmarkReport(BaseModel):
+    settings: dict
+    wall_seconds: float
+    requests_per_second: float
+    operations: list[OperationStats]
+    memory: Optional[MemoryStats] = None
+
+
+class LatencyRecorder:
+    """Collects the latencies and errors of every operation"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def add(self, operation: str, seconds: float) -> None:
+        self.latencies.setdefault(operation, []).append(seconds)
+
+    def add_error(self, operation: str) -> None:
+        self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    @contextlib.asynccontextmanager
+    async def measure(self, operation: str):
+        """Records the time of the block, or an error if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.add_error(operation)
+            raise
+        self.add(operation, time.perf_counter() - start)
+
+    def get_stats(self, wall_seconds: float) -> list[OperationStats]:
+        stats = []
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            latencies = np.array(self.latencies.get(operation, [0.0])) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            count = len(self.latencies.get(operation, []))
+            stats.append(
+                OperationStats(
+                    operation=operation,
+                    count=count,
+                    errors=self.errors.get(operation, 0),
+                    p50_ms=p50,
+                    p95_ms=p95,
+                    p99_ms=p99,
+                    mean_ms=latencies.mean(),
+                    max_ms=latencies.max(),
+                    per_second=count / wall_seconds,
+                )
+            )
+        return stats
+
+
+class MemorySampler:
+    """Samples the resident memory of the server process in the background"""
+
+    def __init__(self, pid: int):
+        self.process = psutil.Process(pid)
+        self.samples: list[int] = []
+
+    async def run(self) -> None:
+        while True:
+            with contextlib.suppress(psutil.Error):
+                self.samples.append(self.process.memory_info().rss)
+            await asyncio.sleep(MEMORY_INTERVAL_SECONDS)
+
+    def get_stats(self) -> Optional[MemoryStats]:
+        if not self.samples:
+            return None
+        return MemoryStats(
+            start_mb=self.samples[0] / BYTES_PER_MB,
+            peak_mb=max(self.samples) / BYTES_PER_MB,
+            end_mb=self.samples[-1] / BYTES_PER_MB,
+        )
+
+
+def speech_frame(frame_ms: int = WS_FRAME_MS) -> bytes:
+    """A loud 220 Hz tone, well above the voice activity threshold"""
+    samples = MODEL_INPUT_RATE * frame_ms // 1000
+    tone = np.sin(np.arange(samples) * 2 * np.pi * 220 / MODEL_INPUT_RATE) * 8000
+    return tone.astype("<i2").tobytes()
+
+
+class VirtualTeacher:
+    """Rehearses a scenario like a teacher using the app"""
+
+    def __init__(
+        self,
+        index: int,
+        client: httpx.AsyncClient,
+        ws_url: str,
+        recorder: LatencyRecorder,
+        args: argparse.Namespace,
+    ):
+        self.user_id = f"teacher-{index}"
+        self.client = client
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.args = args
+        self.session_id: Optional[str] = None
+
+    async def run(self) -> None:
+        try:
+            await self._create_session()
+            for turn in range(self.args.turns):
+                await self._request_turn(turn)
+                await self._read_session()
+                await self._read_scenarios()
+            if self.args.ws_turns:
+                await self._live_session()
+        except Exception as e:
+            print(f"{self.user_id} stopped: {e!r}", file=sys.stderr)
+
+    async def _create_session(self) -> None:
+        async with self.recorder.measure("session.create"):
+            response = await self.client.post(
+                "/session/create",
+                json={"user_id": self.user_id, "scenario_id": SCENARIO_ID},
+            )
+            response.raise_for_status()
+        self.session_id = response.json()["sessions"][0]["id"]
+
+    async def _request_turn(self, turn: int) -> None:
+        message = f"Turn {turn} of {self.user_id}, who can explain the next step?"
+        data = {
+            "agent_name": ROOT_AGENT_NAME,
+            "message": message,
+            "user_id": self.user_id,
+            "session_id": self.session_id,
+            "scenario_id": str(SCENARIO_ID),
+        }
+        # The local speech to text backend transcribes text uploads as the text
+        files = None
+        operation = "agent.request"
+        if turn % 2:
+            files = {"audio": ("turn.webm", message.encode("utf-8"), "audio/webm")}
+            operation = "agent.request_audio"
+        async with self.recorder.measure(operation):
+            response = await self.client.post("/agent/request", data=data, files=files)
+            response.raise_for_status()
+
+    async def _read_session(self) -> None:
+        params = {"user_id": self.user_id, "session_id": self.session_id}
+        async with self.recorder.measure("session.content_page"):
+            response = await self.client.get(
+                "/session/get-session-content-page", params=params
+            )
+            response.raise_for_status()
+        async with self.recorder.measure("session.current"):
+            response = await self.client.get(
+                "/session/get-current-session", params=params
+            )
+            response.raise_for_status()
+
+    async def _read_scenarios(self) -> None:
+        async with self.recorder.measure("scenario.get_all"):
+            response = await self.client.get("/scenario/get-all")
+            response.raise_for_status()
+        async with self.recorder.measure("scenario.current"):
+            response = await self.client.get("/scenario/get-current-scenario")
+            response.raise_for_status()
+
+    async def _live_session(self) -> None:
+        """Speaks turns over the websocket and times the answers.
+
+        ws.first_audio is the time from the end of the speech to the first audio
+        of the answer, ws.turn is the time until the answer is complete.
+        """
+        url = (
+            f"{self.ws_url}/agent/ws/{self.user_id}/{self.session_id}"
+            f"?is_audio=true&protocol=binary&scenario_id={SCENARIO_ID}"
+        )
+        frame = speech_frame()
+        frames_per_turn = max(self.args.live_turn_ms // WS_FRAME_MS, 1)
+        frame_seconds = WS_FRAME_MS / 1000 / self.args.ws_speed
+
+        async with self.recorder.measure("ws.connect"):
+            websocket = await websockets.connect(url)
+        async with websocket:
+            for _ in range(self.args.ws_turns):
+                for _ in range(frames_per_turn):
+                    await websocket.send(frame)
+                    await asyncio.sleep(frame_seconds)
+
+                spoken = time.perf_counter()
+                first_audio = True
+                try:
+                    while True:
+                        message = await asyncio.wait_for(
+                            websocket.recv(), WS_RESPONSE_TIMEOUT_SECONDS
+                        )
+                        if isinstance(message, bytes):
+                            if first_audio:
+                                self.recorder.add(
+                                    "ws.first_audio", time.perf_counter() - spoken
+                                )
+                                first_audio = False
+                        elif json.loads(message).get("turn_complete"):
+                            break
+                except Exception:
+                    self.recorder.add_error("ws.turn")
+                    raise
+                self.recorder.add("ws.turn", time.perf_counter() - spoken)
+
+
+async def probe_event_loop(client: httpx.AsyncClient, recorder: LatencyRecorder):
+    while True:
+        with contextlib.suppress(httpx.HTTPError):
+            async with recorder.measure("probe.event_loop"):
+                response = await client.get(PROBE_PATH)
+                response.raise_for_status()
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+
+
+def fake_backend_environment(args: argparse.Namespace) -> dict[str, str]:
+    """The latencies of the fake model and speech backends from the arguments"""
+    return {
+        "FAKE_LLM_FIRST_TOKEN_MS": str(args.llm_first_token_ms),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "FAKE_LLM_RESPONSE_TOKENS": str(args.llm_response_tokens),
+        "FAKE_LLM_LIVE_TURN_MS": str(args.live_turn_ms),
+        "STT_LOCAL_LATENCY_MS": str(args.stt_latency_ms),
+        "TTS_LOCAL_LATENCY_MS": str(args.tts_latency_ms),
+    }
+
+
+def start_server(port: int, environment: dict[str, str]) -> subprocess.Popen:
+    """Starts server.benchmarks.serve with the environment on top of this one"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "server.benchmarks.serve", "--port", str(port)],
+        env={**os.environ, **environment},
+    )
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(SERVER_STOP_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def wait_for_server(
+    client: httpx.AsyncClient, server: Optional[subprocess.Popen]
+) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if server and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        with contextlib.suppress(httpx.HTTPError):
+            response = await client.get(PROBE_PATH)
+            if response.status_code == 200:
+                return
+        await asyncio.sleep(0.25)
+    raise TimeoutError("Server did not start")
+
+
+async def run_benchmark(args: argparse.Namespace) -> BenchmarkReport:
+    server = (
+        None if args.url else start_server(args.port, fake_backend_environment(args))
+    )
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    ws_url = base_url.replace("http", "ws", 1)
+    limits = httpx.Limits(max_connections=args.teachers * 2 + 2)
+    recorder = LatencyRecorder()
+    background = []
+    try:
+        async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=args.timeout
+        ) as client:
+            await wait_for_server(client, server)
+            pid = server.pid if server else args.pid
+            sampler = MemorySampler(pid) if pid else None
+            if sampler:
+                background.append(asyncio.create_task(sampler.run()))
+            background.append(asyncio.create_task(probe_event_loop(client, recorder)))
+
+            async with recorder.measure("scenario.set"):
+                response = await client.post(
+                    "/scenario/set-scenario-data", json={"scenario_id": SCENARIO_ID}
+                )
+                response.raise_for_status()
+
+            async def start_teacher(index: int) -> None:
+                await asyncio.sleep(args.ramp_seconds * index / args.teachers)
+                await VirtualTeacher(index, client, ws_url, recorder, args).run()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(start_teacher(i) for i in range(args.teachers)))
+            wall_seconds = time.perf_counter() - start
+    finally:
+        for task in background:
+            task.cancel()
+        if server:
+            stop_server(server)
+
+    operations = recorder.get_stats(wall_seconds)
+    return BenchmarkReport(
+        settings=vars(args),
+        wall_seconds=wall_seconds,
+        requests_per_second=sum(
+            stats.count
+            for stats in operations
+            if not stats.operation.startswith(("probe.", "ws."))
+        )
+        / wall_seconds,
+        operations=operations,
+        memory=sampler.get_stats() if sampler else None,
+    )
+
+
+def print_report(report: BenchmarkReport) -> None:
+    header = (
+        f"{'operation':<24}{'count':>7}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}{'per s':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for stats in report.operations:
+        print(
+            f"{stats.operation:<24}{stats.count:>7}{stats.errors:>7}"
+            f"{stats.p50_ms:>10.1f}{stats.p95_ms:>10.1f}{stats.p99_ms:>10.1f}"
+            f"{stats.max_ms:>10.1f}{stats.per_second:>9.2f}"
+        )
+    print(
+        f"\n{report.settings['teachers']} teachers in {report.wall_seconds:.1f}s, "
+        f"{report.requests_per_second:.1f} HTTP requests per second"
+    )
+    if report.memory:
+        print(
+            f"Server memory: {report.memory.start_mb:.0f} MB at start, "
+            f"{report.memory.peak_mb:.0f} MB peak, {report.memory.end_mb:.0f} MB "
+            "at the end"
+        )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=4, help="HTTP turns each")
+    parser.add_argument("--ws-turns", type=int, default=2, help="Live turns each")
+    parser.add_argument(
+        "--ws-speed", type=float, default=1.0, help="Speed of speaking, 1 is real time"
+    )
+    parser.add_argument(
+        "--ramp-seconds", type=float, default=2.0, help="Time to start all teachers"
+    )
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50)
+    parser.add_argument("--llm-response-tokens", type=int, default=40)
+    parser.add_argument("--live-turn-ms", type=int, default=1000)
+    parser.add_argument("--stt-latency-ms", type=float, default=200)
+    parser.add_argument("--tts-latency-ms", type=float, default=150)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--url", help="Benchmark a running server instead")
+    parser.add_argument("--pid", type=int, help="Process of the --url server")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            report_file.write(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
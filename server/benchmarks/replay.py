@@ -0,0 +1,547 @@
+"""Replays captured sessions offline and compares latency between builds.
+
+Usage:
+    CAPTURE_DIR=captures uvicorn server.main:app
+    python -m server.benchmarks.replay run captures/capture-....jsonl.gz \\
+        --speed 2 --json candidate.json
+    python -m server.benchmarks.replay compare base.json candidate.json
+
+Run from the repository root. run starts server.benchmarks.serve with the fake
+backends set up from the capture: the model plays back the recorded outputs of
+every agent, with their recorded delays, speech to text returns the recorded
+transcripts and both speech backends take their median recorded time. The
+/agent/request calls and websocket frames of the capture are then sent again
+at their recorded offsets, divided by --speed. Requests of one session are
+sent in order, each after the previous one was answered.
+
+The report puts the recorded latency of every operation next to the replayed
+one. compare diffs the p50, p95 and p99 of two reports written with --json and
+exits with 1 if an operation got slower than the threshold.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import statistics
+import sys
+import tempfile
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+import httpx
+import websockets
+from pydantic import BaseModel
+
+from server.benchmarks.load_test import (
+    BenchmarkReport,
+    LatencyRecorder,
+    MemorySampler,
+    OperationStats,
+    start_server,
+    stop_server,
+    wait_for_server,
+)
+from server.service.audio_codecs import MulawCodec
+from server.service.capture_service import decode_bytes, read_capture
+from server.service.frame_protocol import TEXT_MIME_TYPE
+
+# Give the replayed live session time to answer what it was sent last
+WS_DRAIN_SECONDS = 5.0
+# Websocket parameters that depend on the recording client, not the session
+CLIENT_WS_PARAMS = ("protocol", "codec", "input_rate", "output_rate")
+
+
+class CapturedRequest(BaseModel):
+    """An /agent/request call of the capture"""
+
+    t: float
+    operation: str
+    data: dict[str, str]
+    audio: Optional[dict] = None
+    image: Optional[dict] = None
+
+
+class CapturedFrame(BaseModel):
+    """A message the client sent over a captured websocket"""
+
+    t: float
+    text: Optional[str] = None
+    pcm: Optional[bytes] = None
+
+
+class CapturedSocket(BaseModel):
+    """A live websocket session of the capture"""
+
+    t: float
+    user_id: str
+    session_id: str
+    params: dict[str, str]
+    frames: list[CapturedFrame]
+    turns: int
+
+
+class Capture(BaseModel):
+    """The traffic of a capture and what the fake backends need to replay it"""
+
+    requests: list[CapturedRequest]
+    sockets: list[CapturedSocket]
+    # Recorded outputs by user message and agent, see FakeLlmScript
+    script: dict[str, dict[str, list[dict]]]
+    transcripts: dict[str, str]
+    stt_latency_ms: float
+    tts_latency_ms: float
+    recorded: dict[str, list[float]]
+    seconds: float
+
+
+def request_operation(request: dict) -> str:
+    if request.get("audio"):
+        return "agent.request_audio"
+    if request.get("image"):
+        return "agent.request_image"
+    return "agent.request"
+
+
+def turn_latencies(records: list[dict]) -> list[float]:
+    """Times from the last client message to each completed turn of a websocket"""
+    latencies = []
+    last_in = None
+    for record in records:
+        if record["kind"] == "ws_in":
+            last_in = record["t"]
+        elif record["kind"] == "ws_out" and record.get("turn_complete"):
+            if last_in is not None:
+                latencies.append(record["t"] - last_in)
+                last_in = None
+    return latencies
+
+
+def load_capture(path: str) -> Capture:
+    """Reads a capture file and derives the script and transcripts for replay
+
+    Raises:
+        ValueError: If the file is not a capture of a supported version
+    """
+    groups: dict[str, list[dict]] = {}
+    for record in read_capture(path):
+        groups.setdefault(record["id"], []).append(record)
+
+    mulaw = MulawCodec()
+    requests, sockets = [], []
+    script: dict[str, dict[str, list[dict]]] = {}
+    transcripts: dict[str, str] = {}
+    stt_seconds, tts_seconds = [], []
+    recorded: dict[str, list[float]] = {}
+    end = 0.0
+    for records in groups.values():
+        end = max(end, records[-1]["t"])
+        by_kind: dict[str, list[dict]] = {}
+        for record in records:
+            by_kind.setdefault(record["kind"], []).append(record)
+        stt_seconds += [record["seconds"] for record in by_kind.get("stt", [])]
+        tts_seconds += [record["seconds"] for record in by_kind.get("tts", [])]
+
+        if "request" in by_kind:
+            request = by_kind["request"][0]
+            operation = request_operation(request)
+            requests.append(
+                CapturedRequest(
+                    t=request["t"],
+                    operation=operation,
+                    data={
+                        name: str(request[name])
+                        for name in (
+                            "agent_name",
+                            "message",
+                            "user_id",
+                            "session_id",
+                            "scenario_id",
+                        )
+                        if request.get(name) is not None
+                    },
+                    audio=request.get("audio"),
+                    image=request.get("image"),
+                )
+            )
+            if "response" in by_kind:
+                recorded.setdefault(operation, []).append(
+                    by_kind["response"][0]["seconds"]
+                )
+
+            message = request["message"]
+            stt = by_kind.get("stt", [{}])[0]
+            if stt.get("transcript"):
+                message = stt["transcript"]
+                if request.get("audio"):
+                    audio = decode_bytes(request["audio"]["data"])
+                    transcripts[hashlib.sha256(audio).hexdigest()] = message
+            previous = 0.0
+            for event in by_kind.get("runner_event", []):
+                script.setdefault(message, {}).setdefault(event["author"], []).append(
+                    {
+                        "text": event.get("text"),
+                        "transfer": event.get("transfer"),
+                        "delay": max(event["seconds"] - previous, 0.0),
+                    }
+                )
+                previous = event["seconds"]
+
+        elif "ws_open" in by_kind:
+            ws_open = by_kind["ws_open"][0]
+            frames = []
+            for record in by_kind.get("ws_in", []):
+                audio = record.get("audio")
+                frames.append(
+                    CapturedFrame(
+                        t=record["t"],
+                        text=record.get("text"),
+                        pcm=mulaw.decode(decode_bytes(audio["data"]))
+                        if audio
+                        else None,
+                    )
+                )
+            recorded.setdefault("ws.turn", []).extend(turn_latencies(records))
+            sockets.append(
+                CapturedSocket(
+                    t=ws_open["t"],
+                    user_id=ws_open["user_id"],
+                    session_id=ws_open["session_id"],
+                    params={
+                        name: value
+                        for name, value in ws_open["params"].items()
+                        if name not in CLIENT_WS_PARAMS
+                    },
+                    frames=frames,
+                    turns=sum(
+                        1
+                        for record in by_kind.get("ws_out", [])
+                        if record.get("turn_complete")
+                    ),
+                )
+            )
+
+    start = min([item.t for item in [*requests, *sockets]], default=0.0)
+    return Capture(
+        requests=sorted(requests, key=lambda request: request.t),
+        sockets=sockets,
+        script=script,
+        transcripts=transcripts,
+        stt_latency_ms=statistics.median(stt_seconds) * 1000 if stt_seconds else 0,
+        tts_latency_ms=statistics.median(tts_seconds) * 1000 if tts_seconds else 0,
+        recorded=recorded,
+        seconds=max(end - start, 0.001),
+    )
+
+
+class Replayer:
+    """Sends the traffic of a capture again at its recorded offsets"""
+
+    def __init__(
+        self,
+        capture: Capture,
+        client: httpx.AsyncClient,
+        ws_url: str,
+        recorder: LatencyRecorder,
+        speed: float,
+    ):
+        self.capture = capture
+        self.client = client
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.speed = speed
+        self.start = min(
+            [item.t for item in [*capture.requests, *capture.sockets]], default=0.0
+        )
+        self.replay_start = 0.0
+
+    async def run(self) -> None:
+        self.replay_start = time.perf_counter()
+        sessions: dict[str, list[CapturedRequest]] = {}
+        for request in self.capture.requests:
+            sessions.setdefault(request.data.get("session_id", ""), []).append(request)
+        await asyncio.gather(
+            *(self._replay_session(requests) for requests in sessions.values()),
+            *(self._replay_socket(socket) for socket in self.capture.sockets),
+        )
+
+    async def _wait_until(self, t: float) -> None:
+        offset = (t - self.start) / self.speed
+        delay = self.replay_start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _replay_session(self, requests: list[CapturedRequest]) -> None:
+        for request in requests:
+            await self._wait_until(request.t)
+            files = {
+                name: (name, decode_bytes(upload["data"]), upload["content_type"])
+                for name, upload in (("audio", request.audio), ("image", request.image))
+                if upload
+            }
+            with contextlib.suppress(httpx.HTTPError):
+                async with self.recorder.measure(request.operation):
+                    response = await self.client.post(
+                        "/agent/request", data=request.data, files=files or None
+                    )
+                    response.raise_for_status()
+
+    async def _replay_socket(self, socket: CapturedSocket) -> None:
+        """Sends the frames of a websocket and times the completed turns
+
+        ws.turn is the time from the last frame sent to the turn completing,
+        measured like the recorded one.
+        """
+        await self._wait_until(socket.t)
+        params = {**socket.params, "protocol": "binary"}
+        url = (
+            f"{self.ws_url}/agent/ws/{socket.user_id}/{socket.session_id}"
+            f"?{urlencode(params)}"
+        )
+        last_sent: Optional[float] = None
+        turns = 0
+
+        async def receive(websocket) -> None:
+            nonlocal last_sent, turns
+            async for message in websocket:
+                if isinstance(message, bytes):
+                    continue
+                if json.loads(message).get("turn_complete"):
+                    turns += 1
+                    if last_sent is not None:
+                        self.recorder.add("ws.turn", time.perf_counter() - last_sent)
+                        last_sent = None
+
+        try:
+            async with self.recorder.measure("ws.connect"):
+                websocket = await websockets.connect(url)
+        except Exception as e:
+            print(f"{socket.session_id} could not connect: {e!r}", file=sys.stderr)
+            return
+        async with websocket:
+            receiver = asyncio.create_task(receive(websocket))
+            try:
+                for frame in socket.frames:
+                    await self._wait_until(frame.t)
+                    if frame.pcm is not None:
+                        await websocket.send(frame.pcm)
+                    else:
+                        await websocket.send(
+                            json.dumps(
+                                {"mime_type": TEXT_MIME_TYPE, "data": frame.text}
+                            )
+                        )
+                    last_sent = time.perf_counter()
+                # Wait for the answers, as long as they keep arriving
+                deadline = time.perf_counter() + WS_DRAIN_SECONDS
+                while turns < socket.turns and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.05)
+            except websockets.ConnectionClosed:
+                self.recorder.add_error("ws.turn")
+            finally:
+                receiver.cancel()
+                await asyncio.gather(receiver, return_exceptions=True)
+
+
+def write_replay_setup(capture: Capture, work_dir: str) -> dict[str, str]:
+    """Writes the script and transcripts, returns the environment of the server"""
+    script_path = f"{work_dir}/script.json"
+    transcripts_path = f"{work_dir}/transcripts.json"
+    with open(script_path, "w", encoding="utf-8") as script_file:
+        json.dump(capture.script, script_file)
+    with open(transcripts_path, "w", encoding="utf-8") as transcripts_file:
+        json.dump(capture.transcripts, transcripts_file)
+    return {
+        "FAKE_LLM_SCRIPT": script_path,
+        "STT_LOCAL_TRANSCRIPTS": transcripts_path,
+        "STT_LOCAL_LATENCY_MS": str(capture.stt_latency_ms),
+        "TTS_LOCAL_LATENCY_MS": str(capture.tts_latency_ms),
+    }
+
+
+async def run_replay(
+    args: argparse.Namespace, capture: Capture
+) -> tuple[BenchmarkReport, list[OperationStats]]:
+    """Replays the capture, returns the report and the recorded latencies"""
+    work_dir = tempfile.mkdtemp(prefix="server-replay-")
+    server = (
+        None
+        if args.url
+        else start_server(args.port, write_replay_setup(capture, work_dir))
+    )
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    recorder = LatencyRecorder()
+    sampler = None
+    background = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+            await wait_for_server(client, server)
+            if server:
+                sampler = MemorySampler(server.pid)
+                background.append(asyncio.create_task(sampler.run()))
+            response = await client.post(
+                "/scenario/set-scenario-data", json={"scenario_id": args.scenario_id}
+            )
+            response.raise_for_status()
+
+            start = time.perf_counter()
+            await Replayer(
+                capture,
+                client,
+                base_url.replace("http", "ws", 1),
+                recorder,
+                args.speed,
+            ).run()
+            wall_seconds = time.perf_counter() - start
+    finally:
+        for task in background:
+            task.cancel()
+        if server:
+            stop_server(server)
+
+    operations = recorder.get_stats(wall_seconds)
+    recorded_latencies = LatencyRecorder()
+    recorded_latencies.latencies = capture.recorded
+    report = BenchmarkReport(
+        settings={"capture": args.capture, "speed": args.speed},
+        wall_seconds=wall_seconds,
+        requests_per_second=sum(
+            stats.count for stats in operations if not stats.operation.startswith("ws.")
+        )
+        / wall_seconds,
+        operations=operations,
+        memory=sampler.get_stats() if sampler else None,
+    )
+    return report, recorded_latencies.get_stats(capture.seconds)
+
+
+def print_replay(report: BenchmarkReport, recorded: list[OperationStats]) -> None:
+    recorded_by_operation = {stats.operation: stats for stats in recorded}
+    header = (
+        f"{'operation':<22}{'count':>7}{'errors':>7}{'p50 ms':>18}{'p95 ms':>18}"
+        f"{'p99 ms':>18}"
+    )
+    print(f"{'':<36}{'recorded / replayed':^54}")
+    print(header)
+    print("-" * len(header))
+    for stats in report.operations:
+        before = recorded_by_operation.get(stats.operation)
+
+        def pair(name: str) -> str:
+            value = getattr(stats, name)
+            if before is None:
+                return f"{'-':>8} / {value:<7.0f}"
+            return f"{getattr(before, name):>8.0f} / {value:<7.0f}"
+
+        print(
+            f"{stats.operation:<22}{stats.count:>7}{stats.errors:>7}"
+            f"{pair('p50_ms'):>18}{pair('p95_ms'):>18}{pair('p99_ms'):>18}"
+        )
+    print(
+        f"\nReplayed {report.settings['capture']} at {report.settings['speed']}x "
+        f"in {report.wall_seconds:.1f}s"
+    )
+
+
+def compare_reports(
+    base: BenchmarkReport,
+    candidate: BenchmarkReport,
+    threshold: float,
+    min_ms: float,
+) -> list[str]:
+    """Prints the latency change per operation, returns the ones that regressed
+
+    An operation regressed if its p95 grew by more than the threshold, a
+    fraction of the base p95, and by more than min_ms.
+    """
+    base_by_operation = {stats.operation: stats for stats in base.operations}
+    header = f"{'operation':<22}{'p50 ms':>22}{'p95 ms':>22}{'p99 ms':>22}"
+    print(header)
+    print("-" * len(header))
+    regressions = []
+    for stats in candidate.operations:
+        before = base_by_operation.get(stats.operation)
+        if before is None:
+            continue
+
+        def change(name: str) -> str:
+            old, new = getattr(before, name), getattr(stats, name)
+            percent = (new - old) / old * 100 if old else 0.0
+            return f"{old:.0f} -> {new:.0f} ({percent:+.0f}%)"
+
+        print(
+            f"{stats.operation:<22}{change('p50_ms'):>22}{change('p95_ms'):>22}"
+            f"{change('p99_ms'):>22}"
+        )
+        growth = stats.p95_ms - before.p95_ms
+        if growth > min_ms and growth > before.p95_ms * threshold:
+            regressions.append(stats.operation)
+    return regressions
+
+
+def read_report(path: str) -> BenchmarkReport:
+    with open(path, encoding="utf-8") as report_file:
+        return BenchmarkReport.model_validate_json(report_file.read())
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Replay a capture against the server")
+    run.add_argument("capture", help="A capture file written with CAPTURE_DIR")
+    run.add_argument(
+        "--speed", type=float, default=1.0, help="Speed of the replay, 1 is real time"
+    )
+    run.add_argument(
+        "--scenario-id",
+        type=int,
+        default=1,
+        help="Scenario selected for requests that did not pass one",
+    )
+    run.add_argument("--port", type=int, default=8101)
+    run.add_argument("--url", help="Replay against a running server instead")
+    run.add_argument("--timeout", type=float, default=120.0)
+    run.add_argument("--json", help="Also write the report to this file")
+
+    compare = commands.add_parser("compare", help="Compare two replay reports")
+    compare.add_argument("base")
+    compare.add_argument("candidate")
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Growth of the p95 that counts as a regression, 0.1 is 10%%",
+    )
+    compare.add_argument(
+        "--min-ms", type=float, default=5.0, help="Ignore p95 growth below this"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    if args.command == "compare":
+        regressions = compare_reports(
+            read_report(args.base),
+            read_report(args.candidate),
+            args.threshold,
+            args.min_ms,
+        )
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    capture = load_capture(args.capture)
+    report, recorded = asyncio.run(run_replay(args, capture))
+    print_replay(report, recorded)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            report_file.write(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Runs the server against the fake model, speech to text and text to speech.
+
+Usage:
+    python -m server.benchmarks.serve --port 8100
+
+Run from the repository root. Settings the environment does not set are
+defaulted to the local backends and a throwaway database and audio cache, so the
+server never calls a Google API. The latencies come from FAKE_LLM_*,
+STT_LOCAL_LATENCY_MS and TTS_LOCAL_LATENCY_MS.
+"""
+
+import argparse
+import os
+import tempfile
+
+import uvicorn
+
+from server.benchmarks.fake_llm import register_fake_llm
+
+
+def configure_environment(work_dir: str) -> None:
+    """Defaults the settings the benchmark server needs, set variables win
+
+    Args:
+        work_dir: Directory for the database and the audio cache
+    """
+    os.environ.setdefault("DB_PATH", os.path.join(work_dir, "benchmark.db"))
+    os.environ.setdefault("TTS_CACHE_DIR", os.path.join(work_dir, "tts-cache"))
+    os.environ.setdefault("STT_BACKEND", "local")
+    os.environ.setdefault("TTS_BACKEND", "local")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--work-dir", help="Directory for the database, a temporary one by default"
+    )
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="server-benchmark-")
+    configure_environment(work_dir)
+    # Agents are built after startup, so they resolve to the fake model
+    register_fake_llm()
+
+    from server.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Measures the cold import and boot time of the server against a budget.
+
+Usage:
+    python -m server.benchmarks.startup --runs 5 --import-budget-ms 9000
+
+Run from the repository root. Every run is a fresh interpreter, like a new
+instance after a scale out. The import time is how long importing server.main
+takes, the boot time how long server.benchmarks.serve takes from the start of
+the process until it answers a request, with the fake backends and a new
+database each run. The slowest imports of an extra, profiled run are listed,
+so a regression points at the module that caused it.
+
+Exits with 1 if the median import or boot time exceeds its budget.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from pydantic import BaseModel
+
+from server.benchmarks.load_test import start_server, stop_server, wait_for_server
+
+# Prints the import time of server.main, -X importtime writes to stderr
+IMPORT_SCRIPT = (
+    "import time; start = time.perf_counter(); import server.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+class StartupStats(BaseModel):
+    runs_ms: list[float]
+    median_ms: float
+    max_ms: float
+    budget_ms: float
+
+    @property
+    def over_budget(self) -> bool:
+        return self.median_ms > self.budget_ms
+
+
+class SlowImport(BaseModel):
+    module: str
+    self_ms: float
+    cumulative_ms: float
+
+
+class StartupReport(BaseModel):
+    imports: StartupStats
+    boot: StartupStats
+    slowest_imports: list[SlowImport]
+
+
+def get_stats(runs_seconds: list[float], budget_ms: float) -> StartupStats:
+    runs_ms = [seconds * 1000 for seconds in runs_seconds]
+    return StartupStats(
+        runs_ms=runs_ms,
+        median_ms=statistics.median(runs_ms),
+        max_ms=max(runs_ms),
+        budget_ms=budget_ms,
+    )
+
+
+def benchmark_environment(work_dir: str) -> dict[str, str]:
+    """A fresh database and the local backends, so no run reuses the last one"""
+    return {
+        "DB_PATH": os.path.join(work_dir, "startup.db"),
+        "TTS_CACHE_DIR": os.path.join(work_dir, "tts-cache"),
+        "STT_BACKEND": "local",
+        "TTS_BACKEND": "local",
+        "SECRET_KEY": "benchmark",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def parse_import_times(stderr: str) -> list[SlowImport]:
+    """Parses the -X importtime lines, self and cumulative time in microseconds"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        imports.append(
+            SlowImport(
+                module=module.strip(),
+                self_ms=int(self_us) / 1000,
+                cumulative_ms=int(cumulative_us) / 1000,
+            )
+        )
+    return imports
+
+
+def measure_import(profile: bool = False) -> tuple[float, list[SlowImport]]:
+    """Imports server.main in a new interpreter
+
+    Args:
+        profile: Also time every import, which slows the import down
+
+    Returns:
+        The import time and the time of every import when profiled
+    """
+    options = ["-X", "importtime"] if profile else []
+    with tempfile.TemporaryDirectory(prefix="server-startup-") as work_dir:
+        result = subprocess.run(
+            [sys.executable, *options, "-c", IMPORT_SCRIPT],
+            env={**os.environ, **benchmark_environment(work_dir)},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return float(result.stdout.strip().splitlines()[-1]), parse_import_times(
+        result.stderr
+    )
+
+
+async def measure_boot(port: int) -> float:
+    with tempfile.TemporaryDirectory(prefix="server-startup-") as work_dir:
+        start = time.perf_counter()
+        server = start_server(port, benchmark_environment(work_dir))
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+                await wait_for_server(client, server)
+            return time.perf_counter() - start
+        finally:
+            stop_server(server)
+
+
+def run_benchmark(args: argparse.Namespace) -> StartupReport:
+    import_seconds = [measure_import()[0] for _ in range(args.runs)]
+    boot_seconds = [asyncio.run(measure_boot(args.port)) for _ in range(args.runs)]
+    _, import_times = measure_import(profile=True)
+    return StartupReport(
+        imports=get_stats(import_seconds, args.import_budget_ms),
+        boot=get_stats(boot_seconds, args.boot_budget_ms),
+        slowest_imports=sorted(
+            import_times, key=lambda slow_import: slow_import.self_ms, reverse=True
+        )[: args.top],
+    )
+
+
+def print_report(report: StartupReport) -> None:
+    for name, stats in (("import", report.imports), ("boot", report.boot)):
+        runs = ", ".join(f"{run_ms:.0f}" for run_ms in stats.runs_ms)
+        status = "OVER BUDGET" if stats.over_budget else "ok"
+        print(
+            f"{name:<7} median {stats.median_ms:>7.0f} ms, max {stats.max_ms:>7.0f} "
+            f"ms, budget {stats.budget_ms:>7.0f} ms  {status}  ({runs})"
+        )
+    print(f"\n{'slowest imports':<60}{'self ms':>10}{'total ms':>10}")
+    for slow_import in report.slowest_imports:
+        print(
+            f"{slow_import.module:<60}{slow_import.self_ms:>10.1f}"
+            f"{slow_import.cumulative_ms:>10.1f}"
+        )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--import-budget-ms",
+        type=float,
+        default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 9000)),
+    )
+    parser.add_argument(
+        "--boot-budget-ms",
+        type=float,
+        default=float(os.getenv("STARTUP_BOOT_BUDGET_MS", 10000)),
+    )
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports shown")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            report_file.write(report.model_dump_json(indent=2))
+    if report.imports.over_budget or report.boot.over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
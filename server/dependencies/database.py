@@ -1,19 +1,170 @@
+import asyncio
+import concurrent.futures
+import logging
 import os
-from typing import Annotated
+import queue
+import threading
+import time
+from typing import Annotated, Callable, TypeVar
 
 from fastapi import Depends
+from sqlalchemy import Engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from server.metrics import DB_WRITE_BATCH_SIZE, DB_WRITE_DURATION
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+M = TypeVar("M", bound=SQLModel)
+
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_CACHE_SIZE_KB = 16384
+DEFAULT_MMAP_SIZE = 128 * 1024 * 1024
+DEFAULT_WRITE_BATCH_SIZE = 64
 
 sqlite_file_name = os.getenv("DB_PATH")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
+async_sqlite_url = f"sqlite+aiosqlite:///{sqlite_file_name}"
+
+
+class PoolMetrics:
+    """Thread safe counters for the time spent waiting on pool checkouts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_checkout(self, wait_seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "total_wait_seconds": self.total_wait_seconds,
+                "mean_wait_seconds": self.total_wait_seconds / attempts
+                if attempts
+                else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+session_pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    metrics = session_pool_metrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+def get_pool_options() -> dict:
+    """Engine options for the connection pool of the app and the ADK sessions"""
+    busy_timeout_ms = int(os.getenv("DB_BUSY_TIMEOUT_MS", DEFAULT_BUSY_TIMEOUT_MS))
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("SESSION_DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("SESSION_DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("SESSION_DB_POOL_TIMEOUT", 30)),
+        # How long a statement waits for the lock of another writer
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": busy_timeout_ms / 1000,
+        },
+    }
+
+
+def get_sqlite_pragmas() -> dict[str, str | int]:
+    """The pragmas every connection to the database is opened with"""
+    return {
+        # Readers do not block the writer and the writer does not block readers
+        "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+        # With WAL a commit only syncs at checkpoints, and stays durable on a crash
+        # of the process, only a power loss may undo the last commits
+        "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+        "cache_size": -int(os.getenv("DB_CACHE_SIZE_KB", DEFAULT_CACHE_SIZE_KB)),
+        "mmap_size": int(os.getenv("DB_MMAP_SIZE", DEFAULT_MMAP_SIZE)),
+        "temp_store": "MEMORY",
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in get_sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def create_storage_engine(url: str = sqlite_url) -> Engine:
+    """Creates the engine shared by the app models and the ADK sessions
+
+    Args:
+        url: The SQLite URL of the database
+
+    Returns:
+        An engine whose connections are opened with the tuned pragmas
+    """
+    db_engine = create_engine(url, **get_pool_options())
+    event.listen(db_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+
+def create_async_storage_engine(url: str = async_sqlite_url) -> AsyncEngine:
+    """Creates the engine for queries made from the event loop
+
+    aiosqlite runs every connection on a thread of its own, so a query awaits
+    its result instead of blocking the event loop that also streams the audio.
+
+    Args:
+        url: The aiosqlite URL of the database
 
-engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+    Returns:
+        An engine whose connections are opened with the tuned pragmas
+    """
+    options = get_pool_options()
+    # The async engine uses its own adapted queue pool, without checkout metrics
+    options.pop("poolclass")
+    async_engine = create_async_engine(url, **options)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return async_engine
 
 
-def get_session():
-    with Session(engine) as session:
+engine = create_storage_engine()
+async_engine = create_async_storage_engine()
+
+
+async def get_session():
+    # Committed models stay readable, as lazy loads are not possible when async
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
-        session.close()
 
 
 def initialize_clean_db():
@@ -21,4 +172,171 @@ def initialize_clean_db():
     SQLModel.metadata.create_all(engine)
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+
+class DatabaseWriter:
+    """Runs the writes of the process on a single thread, a batch per commit.
+
+    SQLite allows one writer at a time, concurrent writers wait on each other
+    through the busy timeout and every commit appends to the WAL. The writer
+    takes all writes queued when it becomes free and commits them together, so
+    the events of concurrent turns share a commit instead of queueing for the
+    lock. A write is a function of a Session that must not commit, its result
+    is returned once its batch is committed. When a batch fails its writes are
+    retried one by one, so a failing write only fails its own caller. The admin
+    routes save and delete their models through it too, so no other connection
+    competes for the write lock.
+    """
+
+    def __init__(self, db_engine: Engine = engine, max_batch_size: int | None = None):
+        """
+        Args:
+            db_engine: The engine the writes are committed on
+            max_batch_size: The most writes in one commit, DB_WRITE_BATCH_SIZE by
+                default
+        """
+        self.db_engine = db_engine
+        self.max_batch_size = max_batch_size or int(
+            os.getenv("DB_WRITE_BATCH_SIZE", DEFAULT_WRITE_BATCH_SIZE)
+        )
+        self.commits = 0
+        self.writes = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Starts the writer thread, if it is not running"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="database-writer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Commits the queued writes and stops the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def submit(self, write: Callable[[Session], T]) -> concurrent.futures.Future:
+        """Queues a write, for callers outside of the event loop
+
+        Args:
+            write: Adds or changes rows through the session, without committing
+
+        Returns:
+            A future of the result of the write, set once it is committed
+        """
+        self.start()
+        future = concurrent.futures.Future()
+        self._queue.put((write, future))
+        return future
+
+    async def write(self, write: Callable[[Session], T]) -> T:
+        """Queues a write and waits until it is committed
+
+        Args:
+            write: Adds or changes rows through the session, without committing
+
+        Returns:
+            The result of the write
+        """
+        return await asyncio.wrap_future(self.submit(write))
+
+    async def save(self, model: M) -> M:
+        """Adds or updates a model and waits until it is committed
+
+        Args:
+            model: A new model, or one loaded and changed through another session
+
+        Returns:
+            The model as committed, with its generated keys
+        """
+
+        def write(session: Session) -> M:
+            saved = session.merge(model)
+            session.flush()
+            return saved
+
+        return await self.write(write)
+
+    async def delete(self, model_class: type[SQLModel], ident) -> None:
+        """Deletes a model by its primary key and waits until it is committed
+
+        Args:
+            model_class: The class of the model
+            ident: The primary key, a tuple for composite keys
+        """
+
+        def write(session: Session) -> None:
+            model = session.get(model_class, ident)
+            if model is not None:
+                session.delete(model)
+
+        await self.write(write)
+
+    def get_stats(self) -> dict:
+        return {
+            "commits": self.commits,
+            "writes": self.writes,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # Writes whose caller was cancelled while queued are dropped
+            batch = [
+                (write, future)
+                for write, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: list[tuple[Callable, concurrent.futures.Future]]):
+        start = time.perf_counter()
+        try:
+            with Session(self.db_engine, expire_on_commit=False) as session:
+                results = [write(session) for write, _ in batch]
+                session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            logger.warning(
+                "A batch of %d database writes failed, retrying them one by one: %s",
+                len(batch),
+                e,
+            )
+            for item in batch:
+                self._write_batch([item])
+            return
+
+        self.commits += 1
+        self.writes += len(batch)
+        DB_WRITE_BATCH_SIZE.observe(len(batch))
+        DB_WRITE_DURATION.observe(time.perf_counter() - start)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+database_writer = DatabaseWriter()
@@ -0,0 +1,17 @@
+from typing import Annotated
+
+from fastapi import Depends
+from starlette.requests import HTTPConnection
+
+from server.service.session_service import SessionService
+
+
+def get_session_service(connection: HTTPConnection) -> SessionService:
+    """Returns the process wide SessionService created in the app lifespan.
+
+    HTTPConnection makes the dependency usable by both HTTP and websocket routes.
+    """
+    return connection.app.state.session_service
+
+
+SessionServiceDep = Annotated[SessionService, Depends(get_session_service)]
@@ -0,0 +1,101 @@
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """Passes only every n-th record of a log call marked with sampled(n).
+
+    Records are counted per logger and message template, so one noisy call
+    site does not suppress another.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._counts: dict[tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", 1)
+        if every <= 1:
+            return True
+        key = (record.name, str(record.msg))
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % every == 0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Puts records on the queue as they are, formatting is left to the listener.
+
+    QueueHandler formats the message on the calling thread so that the record
+    can be pickled for another process. The queue here stays in the process,
+    so the arguments of a record are formatted on the listener thread instead.
+    They should not be changed after the log call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def sampled(every: int) -> dict:
+    """Extra for a log call that should only be emitted once per every calls
+
+    Example:
+        logger.debug("Sent %d bytes", size, extra=sampled(100))
+    """
+    return {"sample_every": every}
+
+
+def parse_levels(levels: str) -> dict[str, str]:
+    """Parses per module levels like "server.routers=WARNING,server.service=DEBUG" """
+    parsed = {}
+    for entry in levels.split(","):
+        if "=" in entry:
+            name, level = entry.split("=", 1)
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def setup_logging() -> None:
+    """Routes the logs of the server package through a queue.
+
+    Log calls on the request path only put the record on a queue, a listener
+    thread formats it and writes it to stderr. The level of the server logger
+    comes from LOG_LEVEL, LOG_LEVELS overrides it per module. Calling this again
+    is a no-op.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    server_logger = logging.getLogger("server")
+    server_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    server_logger.addHandler(queue_handler)
+    server_logger.propagate = False
+    for name, level in parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Writes out the queued records and stops the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,15 +1,19 @@
-from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
+from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
-from pathlib import Path
 
-# Note: dependencies matters, we need to import all models before creating the engine
-from server.dependencies.database import initialize_clean_db
+from server.dependencies.database import async_engine, database_writer
+from server.logging_config import setup_logging, shutdown_logging
+from server.metrics import metrics_endpoint, metrics_middleware
+from server.orm.migrations import migrate
 from server.orm.sample_data import initialize_all_sample_data
 from server.routers import (
     agent_router,
@@ -24,23 +28,73 @@ from server.routers.admin.subagent_links_crud import (
     router as subagent_links_crud_router,
 )
 from server.service.agent_service import AgentService
+from server.service.capture_service import capture_recorder
+from server.service.opening_turn_service import OpeningTurnService
+from server.service.runner_pool import RunnerPool
 from server.service.scenario_service import ScenarioService
 from server.service.session_service import SessionService
+from server.service.tool_registry import ToolRegistry
+from server.tracing import setup_tracing, shutdown_tracing, traces_endpoint
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up(app: FastAPI) -> None:
+    """Creates the speech clients while the server already accepts connections
+
+    Creating a client looks up credentials and opens a channel, that runs in a
+    thread so requests are served meanwhile. A request that needs a client
+    before it is warm creates it itself.
+    """
+    services = [
+        agent_router.speech_to_text_service,
+        agent_router.text_to_speech_service,
+        app.state.session_service.text_to_speech_service,
+    ]
+    for service in services:
+        try:
+            await asyncio.to_thread(service.warm_up)
+        except Exception as e:
+            logger.warning("Warm up of %s failed: %s", type(service).__name__, e)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # TODO: need to change this to more persistent storage, right now just starting with clean db every time
-    initialize_clean_db()
+    # The database persists across restarts, only pending migrations and changed
+    # sample data are applied
+    migrate()
     initialize_all_sample_data()
 
     app.state.scenario_service = ScenarioService()
-    app.state.agent_service = AgentService(app.state.scenario_service)
+    # Tools are imported and validated once, a broken tool fails the startup
+    app.state.tool_registry = ToolRegistry()
+    app.state.agent_service = AgentService(
+        app.state.scenario_service, app.state.tool_registry
+    )
+    app.state.opening_turn_service = OpeningTurnService(app.state.scenario_service)
     app.state.session_service = SessionService()
+    app.state.runner_pool = RunnerPool(
+        app_name=app.state.agent_service.app_name,
+        session_service=app.state.session_service,
+    )
+    database_writer.start()
+    capture_recorder.start()
+    warm_up_task = None
+    if os.getenv("WARM_UP_ENABLED", "true").lower() == "true":
+        warm_up_task = asyncio.create_task(warm_up(app))
     yield
+    if warm_up_task:
+        warm_up_task.cancel()
+    capture_recorder.stop()
+    database_writer.stop()
+    await async_engine.dispose()
+    shutdown_tracing()
+    shutdown_logging()
 
 
 load_dotenv()
+setup_logging()
+setup_tracing()
 
 app = FastAPI(lifespan=lifespan)
 STATIC_DIR = Path("server/static")
@@ -59,6 +113,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Starlette wraps the middlewares added earlier in the ones added later, so this
+# one is outermost and the measured latency includes the CORS middleware
+app.middleware("http")(metrics_middleware)
+
 app.include_router(conversation_router.router)
 app.include_router(scenario_router.router)
 app.include_router(agent_router.router)
@@ -70,6 +128,9 @@ app.include_router(scenarios_crud_router)
 app.include_router(agents_crud_router)
 app.include_router(subagent_links_crud_router)
 
+app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
+app.add_api_route("/traces", traces_endpoint, include_in_schema=False)
+
 
 @app.get("/")
 async def read_root():
@@ -0,0 +1,93 @@
+import time
+
+from fastapi import Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Model and speech calls take seconds, the default buckets stop at 10s
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+AUDIO_BYTES_BUCKETS = (1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response of a route starts",
+    ["method", "route", "status"],
+)
+STT_DURATION = Histogram(
+    "stt_duration_seconds",
+    "Time to transcribe an audio upload, including reading it",
+    ["backend"],
+    buckets=SLOW_BUCKETS,
+)
+RUNNER_FIRST_EVENT = Histogram(
+    "runner_first_event_seconds",
+    "Time from starting an agent run to its first event",
+    ["agent"],
+    buckets=SLOW_BUCKETS,
+)
+RUNNER_DURATION = Histogram(
+    "runner_duration_seconds",
+    "Time of a complete agent run",
+    ["agent"],
+    buckets=SLOW_BUCKETS,
+)
+TTS_DURATION = Histogram(
+    "tts_duration_seconds",
+    "Time of a text to speech API call, cache hits are not included",
+    buckets=SLOW_BUCKETS,
+)
+TTS_AUDIO_BYTES = Histogram(
+    "tts_audio_bytes",
+    "Size of the audio returned by a text to speech API call",
+    buckets=AUDIO_BYTES_BUCKETS,
+)
+SESSION_LOAD_DURATION = Histogram(
+    "session_load_duration_seconds",
+    "Time to load or create an agent session from the database",
+)
+DB_WRITE_BATCH_SIZE = Histogram(
+    "db_write_batch_size",
+    "Writes committed together by the database writer",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+DB_WRITE_DURATION = Histogram(
+    "db_write_duration_seconds",
+    "Time to apply and commit a batch of database writes",
+)
+ACTIVE_WEBSOCKETS = Gauge("active_websockets", "Open live agent websockets")
+LIVE_REQUEST_QUEUES = Gauge(
+    "live_request_queues", "Live request queues feeding a running agent"
+)
+STREAMING_BYTES_SENT = Counter(
+    "streaming_bytes_sent_total",
+    "Bytes sent to clients over the live websocket",
+    ["kind"],
+)
+
+
+async def metrics_middleware(request: Request, call_next) -> Response:
+    """Records the latency of every HTTP route under its path template"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The template keeps ids out of the labels, unmatched paths share one
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        ).observe(time.perf_counter() - start)
+
+
+async def metrics_endpoint() -> Response:
+    """Serves all metrics in the Prometheus text format"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
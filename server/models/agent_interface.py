@@ -13,7 +13,15 @@ class ConversationTurn(BaseModel):
     author: str
     message_id: str
     audio: Optional[str] = None
+    audio_url: Optional[str] = None
 
 
 class Conversation(BaseModel):
     turns: list[ConversationTurn]
+
+
+class ConversationPage(BaseModel):
+    """A page of conversation turns, next_cursor is None on the last page"""
+
+    turns: list[ConversationTurn]
+    next_cursor: Optional[str] = None
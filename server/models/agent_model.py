@@ -1,8 +1,10 @@
+from datetime import datetime, timezone
 from enum import Enum
 from typing import Literal, Optional
 
 from google.adk.agents import BaseAgent
 from pydantic import BaseModel
+from sqlalchemy import LargeBinary
 from sqlmodel import Field, SQLModel, String
 
 
@@ -13,6 +15,25 @@ class AgentResponse(BaseModel):
     author: Optional[str] = None
 
 
+class AgentStreamEventType(str, Enum):
+    PARTIAL = "partial"
+    FINAL = "final"
+    AUDIO = "audio"
+    DONE = "done"
+    ERROR = "error"
+
+
+class AgentStreamEvent(BaseModel):
+    """An event of the streaming variant of an agent request"""
+
+    type: AgentStreamEventType
+    text: Optional[str] = None
+    audio: Optional[str] = None
+    author: Optional[str] = None
+    # Playback order of audio segments
+    index: Optional[int] = None
+
+
 class ADKType(str, Enum):
     LLM = "llm"
     SEQUENTIAL = "sequential"
@@ -33,6 +54,25 @@ class Scenario(SQLModel, table=True):
     initial_prompt: str = Field(default=None)
 
 
+class ScenarioOpeningTurn(SQLModel, table=True):
+    """The generated opening turn of one version of a scenario"""
+
+    id: int = Field(default=None, primary_key=True, unique=True)
+    scenario_id: int = Field(default=None, foreign_key="scenario.id", index=True)
+    # Hash of the prompt and instructions the turn was generated from
+    scenario_version: str = Field(default=None)
+    text: str = Field(default=None)
+    audio: Optional[bytes] = Field(default=None, sa_type=LargeBinary)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class OpeningTurn(BaseModel):
+    scenario_id: int
+    scenario_version: str
+    text: str
+    audio: Optional[str] = None
+
+
 class SetScenarioData(BaseModel):
     scenario_id: int
 
@@ -40,7 +80,7 @@ class SetScenarioData(BaseModel):
 # Name to avoid collison with ADK Agent Class
 class AgentPydantic(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True, unique=True)
-    scenario_id: int = Field(default=None, foreign_key="scenario.id")
+    scenario_id: int = Field(default=None, foreign_key="scenario.id", index=True)
     name: str = Field(default=None)
     adk_type: Literal[
         ADKType.LLM.value, ADKType.SEQUENTIAL.value, ADKType.PARALLEL.value
@@ -0,0 +1,11 @@
+from datetime import datetime, timezone
+
+from sqlmodel import Field, SQLModel
+
+
+class SeedSource(SQLModel, table=True):
+    """The hash of a sample data source when it was last loaded"""
+
+    name: str = Field(primary_key=True)
+    sha256: str
+    loaded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
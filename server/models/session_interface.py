@@ -1,8 +1,12 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class CreateSessionRequest(BaseModel):
     user_id: str
+    # The scenario the session rehearses, requests of the session use its agents
+    scenario_id: Optional[int] = None
 
 
 class GetAllSessionsForUserRequest(BaseModel):
@@ -12,3 +16,16 @@ class GetAllSessionsForUserRequest(BaseModel):
 class GetSessionRequest(BaseModel):
     user_id: str
     session_id: str
+
+
+class GetSessionContentPageRequest(BaseModel):
+    user_id: str
+    session_id: str
+    cursor: Optional[str] = None
+    limit: int = Field(default=20, ge=1, le=100)
+
+
+class GetTurnAudioRequest(BaseModel):
+    user_id: str
+    session_id: str
+    message_id: str
@@ -3,7 +3,7 @@ from sqlmodel import Field, SQLModel
 
 class User(SQLModel):
     id: int = Field(default=None, primary_key=True, unique=True)
-    username: str = Field(default=None)
+    username: str = Field(default=None, unique=True, index=True)
     email: str
     disabled: bool
     admin: bool = Field(default=False)
@@ -0,0 +1,92 @@
+import logging
+from typing import Callable
+
+from pydantic import BaseModel
+from sqlalchemy import Connection, Engine
+from sqlmodel import SQLModel
+
+from server.dependencies.database import engine
+
+# The tables of every model have to be registered before the schema is created
+from server.models import agent_model, seed_model, user_model  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(BaseModel):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def create_tables(connection: Connection) -> None:
+    SQLModel.metadata.create_all(connection)
+
+
+def add_lookup_indexes(connection: Connection) -> None:
+    # Databases created before the models declared these indexes lack them
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_agentpydantic_scenario_id "
+        "ON agentpydantic (scenario_id)"
+    )
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_userindb_username ON userindb (username)"
+    )
+
+
+# Append new migrations with the next version, never edit applied ones. The
+# first migration creates the tables as the models define them now, so a later
+# migration also has to apply cleanly to a database it just created.
+MIGRATIONS = [
+    Migration(version=1, description="Create the tables", apply=create_tables),
+    Migration(
+        version=2,
+        description="Index agents by scenario and users by username",
+        apply=add_lookup_indexes,
+    ),
+]
+
+
+def get_schema_version(connection: Connection) -> int:
+    """Returns the schema version, stored in the SQLite user_version pragma"""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(db_engine: Engine = engine) -> int:
+    """Applies the pending migrations of the database in order
+
+    Each migration runs in its own transaction and bumps the schema version.
+    SQLite commits some DDL right away, so migrations are written to be safe
+    to apply again after an interrupted run.
+
+    Args:
+        db_engine: The engine of the database
+
+    Returns:
+        The schema version of the database
+
+    Raises:
+        RuntimeError: If a newer version of the server migrated the database
+    """
+    latest = MIGRATIONS[-1].version
+    with db_engine.connect() as connection:
+        version = get_schema_version(connection)
+    if version > latest:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than the supported "
+            f"version {latest}"
+        )
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        logger.info(
+            "Migrating the database to version %d: %s",
+            migration.version,
+            migration.description,
+        )
+        with db_engine.begin() as connection:
+            migration.apply(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {migration.version}")
+        version = migration.version
+    return version
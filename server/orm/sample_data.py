@@ -1,3 +1,10 @@
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Callable
+
 from sqlmodel import Session
 from yaml import safe_load
 
@@ -9,18 +16,50 @@ from server.models.agent_model import (
     Scenario,
     SubAgentLink,
 )
+from server.models.seed_model import SeedSource
 from server.models.user_model import UserInDB
 
+logger = logging.getLogger(__name__)
+
 # TODO: move these to the .env file
 PRO_MODEL = "gemini-2.5-pro"
 FLASH_MODEL = "gemini-2.5-flash"
 
+SCENARIO_FILE = "server/orm/temp_scenario_data.yaml"
+# The agent files in load order and the model of their agents
+AGENT_FILES = [
+    ("server/orm/student_agents.yaml", FLASH_MODEL),
+    ("server/orm/inline_feedback_agent.yaml", FLASH_MODEL),
+    ("server/orm/root_agent.yaml", FLASH_MODEL),
+    ("server/orm/whiteboard_root_agent.yaml", FLASH_MODEL),
+    ("server/orm/whiteboard_inline_feedback_agent.yaml", FLASH_MODEL),
+    ("server/orm/overall_feedback_agent.yaml", FLASH_MODEL),
+    ("server/orm/streaming_student_agent.yaml", "gemini-2.0-flash-exp"),
+]
+SAMPLE_USERS = [
+    {
+        "id": 1,
+        "username": "johndoe",
+        "email": "john@test.com",
+        "hashed_password": "$2b$12$pCYsSI/mmqaZOoxkUSslbeFzyxlr38CTulWtGkElzld7p1xVemRYG",
+        "disabled": False,
+        "admin": False,
+    },
+    {
+        "id": 2,
+        "username": "janedoe",
+        "email": "jane@test.com",
+        "hashed_password": "$2b$12$CfXveIDjm7Pvs//KSXc7m.A7mw2XViro3gmfxIbH6p8/skAx4xxea",
+        "disabled": False,
+        "admin": True,
+    },
+]
+
 
 def initialize_scenario_data(session: Session) -> None:
-    with open("server/orm/temp_scenario_data.yaml", "r") as f:
+    with open(SCENARIO_FILE, "r") as f:
         scenario_data_yaml = safe_load(f)
 
-    scenarios = []
     for scenario_id, scenario_data in enumerate(scenario_data_yaml, start=1):
         scenario = Scenario(
             id=scenario_id,
@@ -30,36 +69,18 @@ def initialize_scenario_data(session: Session) -> None:
             system_instructions=scenario_data["system_instructions"],
             initial_prompt=scenario_data["initial_prompt"],
         )
-        scenarios.append(scenario)
+        session.merge(scenario)
 
-    session.add_all(scenarios)
     session.commit()
 
 
-def initialize_sample_user_data() -> None:
+def initialize_sample_user_data(session: Session) -> None:
     """
     Initialize sample user data.
     """
-    with Session(engine) as session:
-        user = UserInDB(
-            id=1,
-            username="johndoe",
-            email="john@test.com",
-            hashed_password="$2b$12$pCYsSI/mmqaZOoxkUSslbeFzyxlr38CTulWtGkElzld7p1xVemRYG",
-            disabled=False,
-            admin=False,
-        )
-        user2 = UserInDB(
-            id=2,
-            username="janedoe",
-            email="jane@test.com",
-            hashed_password="$2b$12$CfXveIDjm7Pvs//KSXc7m.A7mw2XViro3gmfxIbH6p8/skAx4xxea",
-            disabled=False,
-            admin=True,
-        )
-        session.add(user)
-        session.add(user2)
-        session.commit()
+    for user_data in SAMPLE_USERS:
+        session.merge(UserInDB(**user_data))
+    session.commit()
 
 
 def load_agents(
@@ -80,7 +101,7 @@ def load_agents(
     Returns:
         Either a single AgentPydantic object or a list of them
     """
-    print(f"Loading agent data from {file_path}")
+    logger.info("Loading agent data from %s", file_path)
     with open(file_path, "r") as f:
         agent_data_yaml = safe_load(f)
 
@@ -100,16 +121,18 @@ def load_agents(
                 model=model,
                 adk_type=agent_data.get("adk_type", ADKType.LLM),
                 media_type=agent_data.get("media_type", MediaType.NONE),
-                tools=agent_data.get("tools", ""),
-                modules=agent_data.get("modules", ""),
-                sub_agent_ids=agent_data.get("sub_agent_ids", ""),
+                # Keys left empty in the YAML are null, the columns are not
+                tools=agent_data.get("tools") or "",
+                modules=agent_data.get("modules") or "",
+                sub_agent_ids=agent_data.get("sub_agent_ids") or "",
                 voice_name=agent_data.get("voice_name", "Aoede"),
             )
         )
         if agent_data.get("sub_agent_ids"):
             initialize_sub_agent_links(session, agent_id, agent_data["sub_agent_ids"])
 
-    session.add_all(agents)
+    for agent in agents:
+        session.merge(agent)
     session.commit()
 
 
@@ -117,53 +140,83 @@ def initialize_sub_agent_links(
     session: Session, root_agent_id: int, sub_agent_ids: str
 ) -> None:
     """Creates linkage between a root agent and the feedback agents"""
-    sub_agent_links = []
     if sub_agent_ids:
         for sub_agent_id in sub_agent_ids.split(","):
-            sub_agent_links.append(
+            session.merge(
                 SubAgentLink(root_agent_id=root_agent_id, sub_agent_id=sub_agent_id)
             )
-    session.add_all(sub_agent_links)
     session.commit()
 
 
+def get_source_hash(paths: list[str], options: object) -> str:
+    """Hashes the files of a sample data source and the options they load with"""
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8"))
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def load_source(
+    session: Session,
+    name: str,
+    source_hash: str,
+    load: Callable[[], object],
+) -> bool:
+    """Loads a sample data source unless it is unchanged since its last load
+
+    Loading upserts the rows by their ids, rows that were removed from the
+    source stay in the database.
+
+    Returns:
+        Whether the source was loaded
+    """
+    seed_source = session.get(SeedSource, name)
+    if seed_source is not None and seed_source.sha256 == source_hash:
+        return False
+    load()
+    session.merge(SeedSource(name=name, sha256=source_hash))
+    session.commit()
+    return True
+
+
 # TODO: figure out how to assign the agent IDs better
-def initialize_sample_agent_data():
-    with Session(engine) as session:
-        initialize_scenario_data(session)
-        load_agents("server/orm/student_agents.yaml", session=session)
-        load_agents(
-            "server/orm/inline_feedback_agent.yaml",
-            model=FLASH_MODEL,
-            session=session,
-        )
-        load_agents(
-            "server/orm/root_agent.yaml",
-            model=FLASH_MODEL,
-            session=session,
-        )
-        load_agents(
-            "server/orm/whiteboard_root_agent.yaml",
-            model=FLASH_MODEL,
-            session=session,
-        )
-        load_agents(
-            "server/orm/whiteboard_inline_feedback_agent.yaml",
-            model=FLASH_MODEL,
-            session=session,
-        )
-        load_agents(
-            "server/orm/overall_feedback_agent.yaml",
-            model=FLASH_MODEL,
-            session=session,
-        )
-        load_agents(
-            "server/orm/streaming_student_agent.yaml",
-            model="gemini-2.0-flash-exp",
-            session=session,
+def initialize_sample_agent_data(session: Session) -> int:
+    """Loads the changed scenario and agent files, returns how many were loaded"""
+    loaded = load_source(
+        session,
+        SCENARIO_FILE,
+        get_source_hash([SCENARIO_FILE], None),
+        lambda: initialize_scenario_data(session),
+    )
+    for file_path, model in AGENT_FILES:
+        loaded += load_source(
+            session,
+            file_path,
+            get_source_hash([file_path], {"model": model}),
+            lambda: load_agents(file_path, model=model, session=session),
         )
+    return loaded
+
 
+def initialize_all_sample_data() -> None:
+    """Loads the sample data that changed since the last startup
 
-def initialize_all_sample_data():
-    initialize_sample_user_data()
-    initialize_sample_agent_data()
+    Every source is hashed first, files whose hash matches the stored one are
+    not parsed again, so a restart with unchanged sample data does not write
+    to the database.
+    """
+    start = time.perf_counter()
+    with Session(engine) as session:
+        loaded = load_source(
+            session,
+            "sample_users",
+            get_source_hash([], SAMPLE_USERS),
+            lambda: initialize_sample_user_data(session),
+        )
+        loaded += initialize_sample_agent_data(session)
+    logger.info(
+        "Loaded %d of %d sample data sources in %.3fs",
+        loaded,
+        len(AGENT_FILES) + 2,
+        time.perf_counter() - start,
+    )
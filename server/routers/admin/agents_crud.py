@@ -1,11 +1,13 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Request
-from server.dependencies.database import get_session
+from server.dependencies.database import SessionDep, database_writer
 from server.models.agent_model import AgentPydantic
 from server.models.user_model import User
 from server.routers.admin.util import verify_admin
-from sqlmodel import Session, select
+from server.service.agent_graph import AgentGraphError
+from server.service.tool_registry import ToolRegistryError
+from sqlmodel import select
 
 router = APIRouter(prefix="/agents_crud", tags=["agents_crud"])
 
@@ -14,37 +16,46 @@ router = APIRouter(prefix="/agents_crud", tags=["agents_crud"])
 async def create_agent(
     request: Request,
     agent: AgentPydantic,
-    session: Session = Depends(get_session),
     _: User = Depends(verify_admin),
 ):
     """Create a new agent"""
-    session.add(agent)
-    session.commit()
-    session.refresh(agent)
+    agent_service = request.app.state.agent_service
+    try:
+        await agent_service.validate_agent(agent)
+    except (AgentGraphError, ToolRegistryError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    agent = await database_writer.save(agent)
 
     # Update agent in memory
-    request.app.state.agent_service.get_agents_from_database()
+    agent_service.refresh_agent(agent)
 
     return agent
 
 
 @router.get("/", response_model=List[AgentPydantic])
 async def get_agents(
-    session: Session = Depends(get_session), _: User = Depends(verify_admin)
+    session: SessionDep, _: User = Depends(verify_admin)
 ) -> List[AgentPydantic]:
     """Get all agents"""
-    agents = session.exec(select(AgentPydantic)).all()
+    agents = (await session.exec(select(AgentPydantic))).all()
     return agents
 
 
+@router.get("/tools", response_model=List[str])
+async def get_tools(request: Request, _: User = Depends(verify_admin)) -> List[str]:
+    """Get the names of all tools agents can reference"""
+    return request.app.state.tool_registry.list_tools()
+
+
 @router.get("/{agent_id}", response_model=AgentPydantic)
 async def get_agent(
     agent_id: int,
-    session: Session = Depends(get_session),
+    session: SessionDep,
     _: User = Depends(verify_admin),
 ):
     """Get a specific agent by ID"""
-    agent = session.get(AgentPydantic, agent_id)
+    agent = await session.get(AgentPydantic, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     return agent
@@ -55,24 +66,30 @@ async def update_agent(
     request: Request,
     agent_id: int,
     agent_update: AgentPydantic,
-    session: Session = Depends(get_session),
+    session: SessionDep,
     _: User = Depends(verify_admin),
 ):
     """Update a specific agent"""
-    db_agent = session.get(AgentPydantic, agent_id)
+    db_agent = await session.get(AgentPydantic, agent_id)
     if not db_agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
     agent_data = agent_update.dict(exclude_unset=True)
+    agent_data.pop("id", None)
+    candidate = AgentPydantic.model_validate({**db_agent.model_dump(), **agent_data})
+    agent_service = request.app.state.agent_service
+    try:
+        await agent_service.validate_agent(candidate)
+    except (AgentGraphError, ToolRegistryError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     for key, value in agent_data.items():
         setattr(db_agent, key, value)
 
-    session.add(db_agent)
-    session.commit()
-    session.refresh(db_agent)
+    db_agent = await database_writer.save(db_agent)
 
     # Update agent in memory
-    request.app.state.agent_service.get_agents_from_database()
+    agent_service.refresh_agent(db_agent)
     return db_agent
 
 
@@ -80,18 +97,23 @@ async def update_agent(
 async def delete_agent(
     request: Request,
     agent_id: int,
-    session: Session = Depends(get_session),
+    session: SessionDep,
     _: User = Depends(verify_admin),
 ):
     """Delete a specific agent"""
-    agent = session.get(AgentPydantic, agent_id)
+    agent = await session.get(AgentPydantic, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    session.delete(agent)
-    session.commit()
+    agent_service = request.app.state.agent_service
+    try:
+        agent_service.validate_agent_removal(agent_id)
+    except AgentGraphError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    await database_writer.delete(AgentPydantic, agent_id)
 
     # Update agent in memory
-    request.app.state.agent_service.get_agents_from_database()
+    agent_service.remove_agent(agent_id)
 
     return {"message": "Agent deleted successfully"}
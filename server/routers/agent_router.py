@@ -1,6 +1,7 @@
 import asyncio
 import base64
-import json
+import logging
+import time
 from typing import Optional
 
 from fastapi import (
@@ -8,28 +9,50 @@ from fastapi import (
     Depends,
     File,
     Form,
+    HTTPException,
+    Query,
     Request,
     UploadFile,
     WebSocket,
 )
-from fastapi.responses import JSONResponse
-from google.adk.agents import Agent, LiveRequestQueue
-from google.adk.agents.run_config import RunConfig
-from google.adk.runners import InMemoryRunner
-from google.adk.tools import google_search  # Import the tool
-from google.genai.types import (
-    Blob,
-    Content,
-    Part,
-)
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
+from server.dependencies.sessions import SessionServiceDep
+from server.metrics import ACTIVE_WEBSOCKETS, LIVE_REQUEST_QUEUES
 from server.models.agent_interface import Conversation
-from server.service.agent_service_streaming import AgentServiceStreaming
+from server.models.agent_model import (
+    AgentStreamEvent,
+    AgentStreamEventType,
+    MediaType,
+)
 from server.service.agent_request_service import AgentRequestService
-from server.service.session_service import SessionService
-from server.service.speech_to_text_service import SpeechToTextService
+from server.service.agent_service import AgentService, ScenarioNotSelectedError
+from server.service.agent_service_streaming import AgentServiceStreaming
+from server.service.audio_codecs import (
+    MODEL_INPUT_RATE,
+    MODEL_OUTPUT_RATE,
+    AudioTranscoder,
+    CodecName,
+    available_codecs,
+)
+from server.service.capture_service import capture_recorder
+from server.service.frame_protocol import FrameMode, FrameProtocol
+from server.service.send_queue import SendQueueStats, send_queue_registry
+from server.service.speech_pipeline import SpeechPipeline
+from server.service.speech_to_text_service import (
+    AudioFormat,
+    SpeechToTextService,
+    UploadTooLargeError,
+)
 from server.service.text_to_speech_service import TextToSpeechService
+from server.service.voice_activity import (
+    VoiceActivityStats,
+    voice_activity_registry,
+)
+from server.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/agent",
@@ -37,34 +60,56 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Initialize the services
+# Initialize the services, their clients are created on first use or warm up
 speech_to_text_service = SpeechToTextService()
 text_to_speech_service = TextToSpeechService()
 
 APP_NAME = "Time To Teach"
 
 
-async def get_agent_service_request(request: Request) -> AgentRequestService:
+async def get_agent_service_request(
+    request: Request, session_service: SessionServiceDep
+) -> AgentRequestService:
     return AgentRequestService(
         agent_service=request.app.state.agent_service,
+        session_service=session_service,
+        runner_pool=request.app.state.runner_pool,
     )
 
 
+def initialize_error_response(error: ValueError) -> JSONResponse:
+    """A request without a scenario is a bad request, an unknown agent not found"""
+    status_code = 400 if isinstance(error, ScenarioNotSelectedError) else 404
+    return JSONResponse(content={"error": str(error)}, status_code=status_code)
+
+
 class AgentRequest(BaseModel):
     agent_name: str
     message: str
     session_id: str
     user_id: str
+    scenario_id: Optional[int] = None
 
 
 @router.post("/start-session")
 async def start_session(
+    request: Request,
     agent_request: AgentRequest,
     agent_request_service: AgentRequestService = Depends(get_agent_service_request),
 ):
-    return await agent_request_service.initialize_runner(
-        agent_request.user_id, agent_request.session_id
-    )
+    """Starts the agent session and returns the opening turn of its scenario"""
+    try:
+        await agent_request_service.initialize_runner(
+            agent_request.user_id,
+            agent_request.session_id,
+            agent_request.agent_name,
+            agent_request.scenario_id,
+        )
+        return await request.app.state.opening_turn_service.get_opening_turn(
+            agent_request_service.scenario_id
+        )
+    except ValueError as e:
+        return initialize_error_response(e)
 
 
 @router.post("/request")
@@ -74,47 +119,256 @@ async def request_agent_response(
     message: str = Form(...),
     user_id: str = Form(...),
     session_id: str = Form(...),
+    scenario_id: Optional[int] = Form(None),
     audio: Optional[UploadFile] = File(None),
     image: Optional[UploadFile] = File(None),
     agent_request_service: AgentRequestService = Depends(get_agent_service_request),
 ) -> JSONResponse:
-    if request.app.state.agent_service.in_memory_agent_lookup is None:
+    with (
+        tracer.start_as_current_span(
+            "agent.request",
+            attributes={
+                "agent.name": agent_name,
+                "session.id": session_id,
+                "request.has_audio": audio is not None,
+            },
+        ),
+        capture_recorder.capture(),
+    ):
+        start = time.perf_counter()
+        capture_recorder.record(
+            "request",
+            path="/agent/request",
+            agent_name=agent_name,
+            message=message,
+            user_id=user_id,
+            session_id=session_id,
+            scenario_id=scenario_id,
+            audio=await capture_recorder.encode_upload(audio),
+            image=await capture_recorder.encode_upload(image),
+        )
+        try:
+            await agent_request_service.initialize_runner(
+                user_id, session_id, agent_name, scenario_id
+            )
+        except ValueError as e:
+            return initialize_error_response(e)
+
+        message = await transcribe_message(message, audio)
+
+        logger.info("Requesting agent response for agent %s", agent_name)
+        response = await agent_request_service.call_agent_async(
+            query=message,
+            user_id=user_id,
+            session_id=session_id,
+            image_content=(await image.read()) if image else None,
+            image_mime_type=image.content_type if image else None,
+        )
+
+        audio_content = await SpeechPipeline(text_to_speech_service).synthesize_text(
+            response.agent_response_text
+        )
+
+        capture_recorder.record(
+            "response",
+            text=response.agent_response_text,
+            author=response.author,
+            audio_bytes=len(audio_content or b""),
+            seconds=time.perf_counter() - start,
+        )
+        logger.debug("Sending back Agent Response")
         return JSONResponse(
-            content={"error": "Agents not loaded, select a scenario first"},
-            status_code=500,
+            content={
+                "text": response.agent_response_text,
+                "audio": base64.b64encode(audio_content).decode("utf-8")
+                if audio_content
+                else None,
+                "markdown_text": response.markdown_text,
+                "author": response.author,
+            }
         )
 
+
+@router.post("/request/stream")
+async def stream_agent_response(
+    request: Request,
+    agent_name: str = Form(...),
+    message: str = Form(...),
+    user_id: str = Form(...),
+    session_id: str = Form(...),
+    scenario_id: Optional[int] = Form(None),
+    audio: Optional[UploadFile] = File(None),
+    image: Optional[UploadFile] = File(None),
+    agent_request_service: AgentRequestService = Depends(get_agent_service_request),
+):
+    """Server-Sent Events variant of /request.
+
+    Streams partial text and the final response of each agent as they are
+    produced. Spoken responses are synthesized sentence by sentence while they
+    are generated and sent as ordered audio events, a done event closes the
+    stream.
+    """
+    try:
+        await agent_request_service.initialize_runner(
+            user_id, session_id, agent_name, scenario_id
+        )
+    except ValueError as e:
+        return initialize_error_response(e)
+
+    message = await transcribe_message(message, audio)
+    image_content = (await image.read()) if image else None
+    image_mime_type = image.content_type if image else None
+
+    agent_service = request.app.state.agent_service
+    speech_pipeline = SpeechPipeline(text_to_speech_service)
+    outbox: asyncio.Queue[AgentStreamEvent | None] = asyncio.Queue()
+
+    async def generate() -> None:
+        """Forwards agent events and feeds the text to be spoken to the pipeline"""
+        fed_authors = set()
+        try:
+            async for stream_event in agent_request_service.stream_agent_response(
+                agent_name,
+                user_id,
+                session_id,
+                message,
+                image_content=image_content,
+                image_mime_type=image_mime_type,
+            ):
+                await outbox.put(stream_event)
+                author = stream_event.author
+                if not stream_event.text or not is_spoken(
+                    agent_service, author, agent_request_service.scenario_id
+                ):
+                    continue
+
+                if stream_event.type == AgentStreamEventType.PARTIAL:
+                    fed_authors.add(author)
+                    speech_pipeline.feed(stream_event.text, author)
+                elif stream_event.type == AgentStreamEventType.FINAL:
+                    # Without partials the whole text only arrives with the final
+                    if author not in fed_authors:
+                        speech_pipeline.feed(stream_event.text, author)
+                    fed_authors.discard(author)
+                    speech_pipeline.end_turn(author)
+        except Exception as e:
+            logger.exception("Error streaming agent response: %s", e)
+            await outbox.put(
+                AgentStreamEvent(type=AgentStreamEventType.ERROR, text=str(e))
+            )
+        finally:
+            speech_pipeline.close()
+            await outbox.put(None)
+
+    async def speak() -> None:
+        """Forwards the audio of each sentence as soon as it is synthesized"""
+        try:
+            async for segment in speech_pipeline.segments():
+                await outbox.put(
+                    AgentStreamEvent(
+                        type=AgentStreamEventType.AUDIO,
+                        text=segment.text,
+                        audio=base64.b64encode(segment.audio).decode("utf-8"),
+                        author=segment.author,
+                        index=segment.index,
+                    )
+                )
+        finally:
+            await outbox.put(None)
+
+    async def event_stream():
+        final_event = None
+        tasks = [asyncio.create_task(generate()), asyncio.create_task(speak())]
+        try:
+            running = len(tasks)
+            while running:
+                stream_event = await outbox.get()
+                if stream_event is None:
+                    running -= 1
+                    continue
+                if stream_event.type == AgentStreamEventType.FINAL:
+                    final_event = stream_event
+                yield format_sse(stream_event)
+
+            yield format_sse(
+                AgentStreamEvent(
+                    type=AgentStreamEventType.DONE,
+                    text=final_event.text if final_event else None,
+                    author=final_event.author if final_event else None,
+                )
+            )
+        finally:
+            # The client may disconnect mid stream
+            for task in tasks:
+                task.cancel()
+
+    logger.info("Streaming agent response for agent %s", agent_name)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so events reach the client as they are sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def transcribe_message(message: str, audio: Optional[UploadFile]) -> str:
+    """Replaces the message with the transcript of the audio when there is one
+
+    Raises:
+        HTTPException: 413 if the audio exceeds the maximum upload size
+    """
     if audio:
-        audio_content = await audio.read()
-        transcript = await speech_to_text_service.transcribe_audio(audio_content)
+        try:
+            transcript = await speech_to_text_service.transcribe_upload(audio)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
 
         if transcript:
-            message = transcript
-
-    print(f"Requesting agent response for agent {agent_name}")
-    response = await agent_request_service.request_agent_response(
-        agent_name,
-        user_id,
-        session_id,
-        message,
-        image_content=(await image.read()) if image else None,
-        image_mime_type=image.content_type if image else None,
-    )
+            return transcript
+    return message
 
-    audio_content = await text_to_speech_service.text_to_speech(
-        response.agent_response_text
-    )
 
-    print("Sending back Agent Response")
-    return JSONResponse(
-        content={
-            "text": response.agent_response_text,
-            "audio": base64.b64encode(audio_content).decode("utf-8")
-            if audio_content
-            else None,
-            "markdown_text": response.markdown_text,
-            "author": response.author,
-        }
+@router.post("/transcribe")
+async def transcribe_audio(request: Request) -> JSONResponse:
+    """Transcribes a raw audio request body while it is being uploaded
+
+    The content type of the request selects the audio format, WebM Opus by
+    default.
+    """
+    content_length = request.headers.get("content-length")
+    if (
+        content_length
+        and content_length.isdigit()
+        and int(content_length) > speech_to_text_service.max_upload_bytes
+    ):
+        raise HTTPException(status_code=413, detail="Audio upload is too large")
+
+    try:
+        transcript = await speech_to_text_service.transcribe_stream(
+            request.stream(),
+            AudioFormat.from_content_type(request.headers.get("content-type")),
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return JSONResponse(content={"transcript": transcript})
+
+
+def is_spoken(
+    agent_service: AgentService, author: Optional[str], scenario_id: Optional[int]
+) -> bool:
+    """Whether the responses of an agent are spoken, text media agents are not"""
+    try:
+        agent_pydantic = agent_service.lookup_agent(author, scenario_id).agent_pydantic
+    except ValueError:
+        return True
+    return agent_pydantic.media_type != MediaType.TEXT
+
+
+def format_sse(stream_event: AgentStreamEvent) -> str:
+    """Formats a stream event as a Server-Sent Event"""
+    return (
+        f"event: {stream_event.type.value}\n"
+        f"data: {stream_event.model_dump_json(exclude_none=True)}\n\n"
     )
 
 
@@ -122,10 +376,39 @@ async def request_agent_response(
 async def get_conversation_content(
     user_id: str,
     session_id: str,
+    session_service: SessionServiceDep,
+    include_audio: bool = True,
 ) -> Conversation:
-    print(f"Getting conversation content for user {user_id} and session {session_id}")
-    session_service = SessionService()
-    return await session_service.get_session_content(user_id, session_id)
+    logger.debug(
+        "Getting conversation content for user %s and session %s", user_id, session_id
+    )
+    return await session_service.get_session_content(
+        user_id, session_id, include_audio=include_audio
+    )
+
+
+@router.get("/tts-cache-stats")
+async def get_tts_cache_stats() -> dict:
+    """Returns the hit and miss counters of the text to speech audio cache"""
+    return text_to_speech_service.get_cache_stats()
+
+
+@router.get("/audio-codecs")
+async def get_audio_codecs() -> list[str]:
+    """Returns the codecs the live websocket can negotiate"""
+    return available_codecs()
+
+
+@router.get("/ws-stats")
+async def get_websocket_stats() -> list[SendQueueStats]:
+    """Returns the send queue depth and latency of every open websocket"""
+    return send_queue_registry.get_stats()
+
+
+@router.get("/vad-stats")
+async def get_voice_activity_stats() -> list[VoiceActivityStats]:
+    """Returns the sent and dropped audio frames of every open websocket"""
+    return voice_activity_registry.get_stats()
 
 
 @router.post("/feedback")
@@ -133,17 +416,34 @@ async def request_feedback(
     agent_request: AgentRequest,
     agent_request_service: AgentRequestService = Depends(get_agent_service_request),
 ):
-    print(f"Requesting feedback for session {agent_request.session_id}")
+    logger.info("Requesting feedback for session %s", agent_request.session_id)
     return await agent_request_service.request_agent_response(
         agent_request.agent_name,
         agent_request.user_id,
         agent_request.session_id,
         agent_request.message,
+        scenario_id=agent_request.scenario_id,
     )
 
 
-async def get_agent_service_streaming() -> AgentServiceStreaming:
-    return AgentServiceStreaming()
+async def get_agent_service_streaming(
+    websocket: WebSocket,
+    session_service: SessionServiceDep,
+    protocol: FrameMode = FrameMode.JSON,
+    codec: Optional[CodecName] = None,
+    input_rate: int = Query(MODEL_INPUT_RATE, ge=8000, le=48000),
+    output_rate: int = Query(MODEL_OUTPUT_RATE, ge=8000, le=48000),
+    vad: Optional[bool] = None,
+) -> AgentServiceStreaming:
+    transcoder = AudioTranscoder(codec or CodecName.PCM16, input_rate, output_rate)
+    return AgentServiceStreaming(
+        agent_service=websocket.app.state.agent_service,
+        session_service=session_service,
+        frame_protocol=FrameProtocol(protocol, transcoder),
+        # Only clients that negotiate a codec expect to be told the outcome
+        announce_audio_format=codec is not None,
+        voice_activity_detection=vad,
+    )
 
 
 @router.websocket("/ws/{user_id}/{session_id}")
@@ -152,31 +452,74 @@ async def websocket_endpoint(
     user_id: str,
     session_id: str,
     is_audio: str = "false",
+    scenario_id: Optional[int] = None,
+    agent_service_streaming: AgentServiceStreaming = Depends(
+        get_agent_service_streaming
+    ),
 ):
-    """Client websocket endpoint"""
-    agent_service_streaming = AgentServiceStreaming(
-        agent_service=websocket.app.state.agent_service,
-    )
+    """Client websocket endpoint
+
+    Clients pass protocol=binary to exchange audio as raw PCM in binary frames,
+    otherwise every frame is JSON with base64 encoded audio. Clients can also
+    pass a codec, one of /agent/audio-codecs, and the sample rates they record
+    and play at. The server answers with the format it picked, falling back to
+    pcm16 if the codec is not available. vad=false turns off the silence
+    suppression on the audio sent to the model.
+    """
     # Wait for client connection
     await websocket.accept()
-    print(f"Client #{session_id} connected")
-
-    # # Start agent session
-    live_events, live_request_queue = await agent_service_streaming.start_agent_session(
-        user_id, session_id, "root_agent", is_audio
-    )
+    logger.info("Client #%s connected", session_id)
+    ACTIVE_WEBSOCKETS.inc()
+    live_request_queue = None
+    connection_id = f"{user_id}/{session_id}"
+    with capture_recorder.capture():
+        capture_recorder.record(
+            "ws_open",
+            user_id=user_id,
+            session_id=session_id,
+            scenario_id=scenario_id,
+            params=dict(websocket.query_params),
+        )
+        try:
+            # # Start agent session
+            (
+                live_events,
+                live_request_queue,
+            ) = await agent_service_streaming.start_agent_session(
+                user_id, session_id, "root_agent", is_audio, scenario_id
+            )
+            LIVE_REQUEST_QUEUES.inc()
 
-    # Start agent to client messaging
-    agent_to_client_task = asyncio.create_task(
-        agent_service_streaming.agent_to_client_messaging(websocket, live_events)
-    )
+            # Start agent to client messaging
+            agent_to_client_task = asyncio.create_task(
+                agent_service_streaming.agent_to_client_messaging(
+                    websocket, live_events, connection_id=connection_id
+                )
+            )
 
-    # Start client to agent messaging
-    client_to_agent_task = asyncio.create_task(
-        agent_service_streaming.client_to_agent_messaging(websocket, live_request_queue)
-    )
+            # Start client to agent messaging
+            client_to_agent_task = asyncio.create_task(
+                agent_service_streaming.client_to_agent_messaging(
+                    websocket, live_request_queue, connection_id=connection_id
+                )
+            )
 
-    # Wait for both tasks to complete
-    await asyncio.gather(agent_to_client_task, client_to_agent_task)
+            # The session ends when either side does, after a disconnect the
+            # agent side would otherwise wait for live events forever
+            done, pending = await asyncio.wait(
+                [agent_to_client_task, client_to_agent_task],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                task.result()
+        finally:
+            capture_recorder.record("ws_close")
+            ACTIVE_WEBSOCKETS.dec()
+            if live_request_queue is not None:
+                live_request_queue.close()
+                LIVE_REQUEST_QUEUES.dec()
 
-    print(f"Client #{session_id} disconnected")
+    logger.info("Client #%s disconnected", session_id)
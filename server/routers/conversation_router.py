@@ -18,20 +18,20 @@ class GeminiMessage(BaseModel):
 
 @router.post("/send_message")
 async def get_gemini_message(request: Request, gemini_message: GeminiMessage):
-    return request.state.gemini_service.get_gemini_message(
+    return await request.state.gemini_service.get_gemini_message(
         message=gemini_message.message, user_id=gemini_message.user_id
     )
 
 
 @router.get("/messages")
 async def fetch_user_messages(request: Request, user_id: str):
-    return request.state.gemini_service.fetch_user_messages(user_id=int(user_id))
+    return await request.state.gemini_service.fetch_user_messages(user_id=int(user_id))
 
 
 @router.post("/provide_user_feedback")
 async def provide_user_feedback(
     request: Request, summarize_feedback_request: SummarizeFeedbackRequest
 ) -> SummarizeFeedbackResponse:
-    return request.state.gemini_service.provide_user_feedback(
+    return await request.state.gemini_service.provide_user_feedback(
         user_id=summarize_feedback_request.user_id
     )
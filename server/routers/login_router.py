@@ -1,3 +1,4 @@
+import asyncio
 import os
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
@@ -8,7 +9,8 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from server.dependencies.database import SessionDep
 from server.models.user_model import User, UserInDB
@@ -46,18 +48,23 @@ class TokenData(BaseModel):
     username: str | None = None
 
 
-def get_user(session: Session, username: str) -> User | None:
-    user = session.exec(select(UserInDB).where(UserInDB.username == username)).first()
+async def get_user(session: AsyncSession, username: str) -> User | None:
+    user = (
+        await session.exec(select(UserInDB).where(UserInDB.username == username))
+    ).first()
     if user:
         return user
     return None
 
 
-def authenticate_user(session: Session, username: str, password: str) -> User:
-    user = get_user(session, username)
+async def authenticate_user(
+    session: AsyncSession, username: str, password: str
+) -> User:
+    user = await get_user(session, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt is slow on purpose, keep it off the event loop
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
         return False
     return user
 
@@ -90,7 +97,7 @@ async def get_current_user(
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
-    user = get_user(session, username=token_data.username)
+    user = await get_user(session, username=token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -109,7 +116,7 @@ async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     session: SessionDep,
 ) -> Token:
-    user = authenticate_user(session, form_data.username, form_data.password)
+    user = await authenticate_user(session, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
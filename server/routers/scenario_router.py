@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Request
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from fastapi.responses import JSONResponse
 
 from server.models.agent_model import (
+    OpeningTurn,
     Scenario,
     SetScenarioData,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/scenario",
     tags=["scenario"],
@@ -15,7 +21,7 @@ router = APIRouter(
 
 @router.get("/get-all")
 async def get_all_scenarios(request: Request) -> list[Scenario]:
-    return request.app.state.scenario_service.get_all_scenarios()
+    return await request.app.state.scenario_service.get_all_scenarios()
 
 
 @router.get("/get-current-scenario")
@@ -23,12 +29,44 @@ async def get_current_scenario(request: Request) -> Scenario:
     return request.app.state.scenario_service.get_current_scenario()
 
 
+@router.get("/opening-turn")
+async def get_opening_turn(
+    request: Request, scenario_id: Optional[int] = None
+) -> OpeningTurn:
+    """Returns the opening turn of a scenario, the current one by default
+
+    The turn is generated on the first request for a version of the scenario
+    and read from storage after that.
+    """
+    if scenario_id is None:
+        scenario = request.app.state.scenario_service.get_current_scenario()
+        if scenario is None:
+            raise HTTPException(status_code=404, detail="No scenario selected")
+        scenario_id = scenario.id
+    try:
+        return await request.app.state.opening_turn_service.get_opening_turn(
+            scenario_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 @router.post("/set-scenario-data")
-async def set_scenario_data(request: Request, scenario_data: SetScenarioData):
-    # We load the agents from the database upon scenario selection
-    print(f"Setting scenario to {scenario_data.scenario_id}")
-    request.app.state.scenario_service.set_scenario(
-        scenario_id=scenario_data.scenario_id
+async def set_scenario_data(
+    request: Request, scenario_data: SetScenarioData, background_tasks: BackgroundTasks
+):
+    # Sets the default scenario for requests and sessions that don't specify one.
+    # Agents are cached per scenario, so this only builds them on first use
+    logger.info("Setting scenario to %s", scenario_data.scenario_id)
+    try:
+        await request.app.state.scenario_service.set_scenario(
+            scenario_id=scenario_data.scenario_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    await request.app.state.agent_service.load_registry(scenario_data.scenario_id)
+    # Sessions of the scenario start with its opening turn, generate it up front
+    background_tasks.add_task(
+        request.app.state.opening_turn_service.warm, scenario_data.scenario_id
     )
-    request.app.state.agent_service.get_agents_from_database()
     return JSONResponse(content={"message": "Scenario set successfully"})
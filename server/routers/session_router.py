@@ -1,12 +1,17 @@
 import uuid
 from typing import Annotated
 
-from fastapi import APIRouter, Query, Request
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
 
+from server.dependencies.sessions import SessionServiceDep
+from server.models.agent_interface import ConversationPage
 from server.models.session_interface import (
     CreateSessionRequest,
     GetAllSessionsForUserRequest,
+    GetSessionContentPageRequest,
     GetSessionRequest,
+    GetTurnAudioRequest,
 )
 
 router = APIRouter(
@@ -18,12 +23,15 @@ router = APIRouter(
 
 @router.post("/create")
 async def create_session(
-    request: Request, create_session_request: CreateSessionRequest
+    session_service: SessionServiceDep,
+    create_session_request: CreateSessionRequest,
 ):
     # Generate a new session ID
     session_id = str(uuid.uuid4())
-    session = await request.app.state.session_service.get_or_create_session(
-        user_id=create_session_request.user_id, session_id=session_id
+    session = await session_service.get_or_create_session(
+        user_id=create_session_request.user_id,
+        session_id=session_id,
+        scenario_id=create_session_request.scenario_id,
     )
 
     # Transform session to match client interface
@@ -38,9 +46,10 @@ async def create_session(
 
 @router.get("/get-current-session")
 async def get_current_session(
-    request: Request, get_session_request: Annotated[GetSessionRequest, Query()]
+    session_service: SessionServiceDep,
+    get_session_request: Annotated[GetSessionRequest, Query()],
 ):
-    return request.app.state.session_service.get_or_create_session(
+    return await session_service.get_or_create_session(
         user_id=get_session_request.user_id,
         session_id=get_session_request.session_id,
     )
@@ -48,29 +57,75 @@ async def get_current_session(
 
 @router.get("/get-session-content")
 async def get_session_content(
-    request: Request, get_session_request: Annotated[GetSessionRequest, Query()]
+    session_service: SessionServiceDep,
+    get_session_request: Annotated[GetSessionRequest, Query()],
+    include_audio: bool = True,
 ):
-    return await request.app.state.session_service.get_session_content(
+    return await session_service.get_session_content(
         user_id=get_session_request.user_id,
         session_id=get_session_request.session_id,
+        include_audio=include_audio,
+    )
+
+
+@router.get("/get-session-content-page")
+async def get_session_content_page(
+    session_service: SessionServiceDep,
+    get_session_content_page_request: Annotated[GetSessionContentPageRequest, Query()],
+) -> ConversationPage:
+    """Returns a page of conversation turns with audio URLs instead of inlined audio"""
+    try:
+        return await session_service.get_session_content_page(
+            user_id=get_session_content_page_request.user_id,
+            session_id=get_session_content_page_request.session_id,
+            cursor=get_session_content_page_request.cursor,
+            limit=get_session_content_page_request.limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/turn-audio")
+async def get_turn_audio(
+    session_service: SessionServiceDep,
+    get_turn_audio_request: Annotated[GetTurnAudioRequest, Query()],
+) -> Response:
+    """Synthesizes, or serves from cache, the audio of a single model turn"""
+    audio_content = await session_service.get_turn_audio(
+        user_id=get_turn_audio_request.user_id,
+        session_id=get_turn_audio_request.session_id,
+        message_id=get_turn_audio_request.message_id,
+    )
+    if not audio_content:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    # The audio of a turn never changes, so the browser can keep it
+    return Response(
+        content=audio_content,
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "private, max-age=86400"},
     )
 
 
 @router.get("/get-all-sessions-for-user")
 async def get_all_sessions_for_user(
-    request: Request,
+    session_service: SessionServiceDep,
     get_all_sessions_for_user_request: Annotated[GetAllSessionsForUserRequest, Query()],
 ):
-    return await request.app.state.session_service.get_all_sessions_for_user(
+    return await session_service.get_all_sessions_for_user(
         user_id=get_all_sessions_for_user_request.user_id
     )
 
 
 @router.get("/debug-sessions")
-async def debug_sessions(request: Request):
+async def debug_sessions(session_service: SessionServiceDep):
     """Debug endpoint to check session storage"""
     user_id = "18"  # Test user ID
-    sessions = await request.app.state.session_service.get_all_sessions_for_user(
-        user_id
-    )
+    sessions = await session_service.get_all_sessions_for_user(user_id)
     return {"message": "Debug sessions", "user_id": user_id, "sessions": sessions}
+
+
+@router.get("/pool-stats")
+async def get_pool_stats(session_service: SessionServiceDep):
+    """Returns the session storage connection pool state and checkout wait metrics"""
+    return session_service.get_pool_stats()
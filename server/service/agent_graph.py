@@ -0,0 +1,201 @@
+from typing import Iterable
+
+from server.models.agent_model import AgentPydantic
+
+
+class AgentGraphError(ValueError):
+    """Raised when the sub agent links of a scenario do not form a valid graph"""
+
+
+class AgentGraph:
+    """Dependency index over the AgentPydantic nodes of a scenario.
+
+    Edges point from an agent to the sub agents listed in its sub_agent_ids. The
+    reverse index of parents is kept alongside so a change to one agent can be
+    propagated to exactly the agents that contain it.
+    """
+
+    def __init__(self, agents_pydantic: Iterable[AgentPydantic]):
+        """
+        Args:
+            agents_pydantic: The agents of the scenario
+
+        Raises:
+            AgentGraphError: If a sub agent is missing or the links contain a cycle
+        """
+        self.nodes: dict[int, AgentPydantic] = {}
+        self.children: dict[int, list[int]] = {}
+        self.parents: dict[int, set[int]] = {}
+        for agent_pydantic in agents_pydantic:
+            self._add(agent_pydantic)
+        self.validate()
+
+    @staticmethod
+    def parse_sub_agent_ids(agent_pydantic: AgentPydantic) -> list[int]:
+        """Parses the comma separated sub_agent_ids of an agent"""
+        if not agent_pydantic.sub_agent_ids:
+            return []
+        try:
+            return [
+                int(sub_agent_id)
+                for sub_agent_id in str(agent_pydantic.sub_agent_ids).split(",")
+                if sub_agent_id.strip()
+            ]
+        except ValueError:
+            raise AgentGraphError(
+                f"Agent {agent_pydantic.name} has invalid sub_agent_ids "
+                f"{agent_pydantic.sub_agent_ids!r}"
+            )
+
+    def validate(self) -> None:
+        """Checks that every sub agent exists and that there are no cycles
+
+        Raises:
+            AgentGraphError: If the graph is invalid
+        """
+        for agent_id, child_ids in self.children.items():
+            missing = [child_id for child_id in child_ids if child_id not in self.nodes]
+            if missing:
+                name = self.nodes[agent_id].name
+                raise AgentGraphError(
+                    f"Agent {name} references unknown sub agents {missing}"
+                )
+
+        # Iterative depth first search, a node seen again while still on the
+        # current path closes a cycle
+        exhausted = object()
+        visited: set[int] = set()
+        for start_id in self.nodes:
+            if start_id in visited:
+                continue
+            path: list[int] = [start_id]
+            on_path: set[int] = {start_id}
+            stack = [iter(self.children[start_id])]
+            while stack:
+                child_id = next(stack[-1], exhausted)
+                if child_id is exhausted:
+                    stack.pop()
+                    node_id = path.pop()
+                    on_path.discard(node_id)
+                    visited.add(node_id)
+                    continue
+                if child_id in on_path:
+                    cycle = path[path.index(child_id) :] + [child_id]
+                    names = " -> ".join(self.nodes[node_id].name for node_id in cycle)
+                    raise AgentGraphError(f"Sub agent cycle detected: {names}")
+                if child_id in visited:
+                    continue
+                path.append(child_id)
+                on_path.add(child_id)
+                stack.append(iter(self.children[child_id]))
+
+    def with_node(self, agent_pydantic: AgentPydantic) -> "AgentGraph":
+        """Returns a copy of the graph with the agent added or replaced
+
+        Raises:
+            AgentGraphError: If the resulting graph is invalid
+        """
+        others = [
+            node for node_id, node in self.nodes.items() if node_id != agent_pydantic.id
+        ]
+        return AgentGraph(others + [agent_pydantic])
+
+    def without_node(self, agent_id: int) -> "AgentGraph":
+        """Returns a copy of the graph with the agent removed
+
+        Raises:
+            AgentGraphError: If another agent still references the agent
+        """
+        return AgentGraph(
+            node for node_id, node in self.nodes.items() if node_id != agent_id
+        )
+
+    def upsert(self, agent_pydantic: AgentPydantic) -> set[int]:
+        """Adds or replaces an agent
+
+        Args:
+            agent_pydantic: The new version of the agent
+
+        Returns:
+            The ids of the agent and all of its ancestors, which need rebuilding
+
+        Raises:
+            AgentGraphError: If the change would make the graph invalid, in which
+                case the graph is left untouched
+        """
+        self.with_node(agent_pydantic)
+        if agent_pydantic.id in self.nodes:
+            self._remove(agent_pydantic.id)
+        self._add(agent_pydantic)
+        return {agent_pydantic.id} | self.ancestors(agent_pydantic.id)
+
+    def remove(self, agent_id: int) -> set[int]:
+        """Removes an agent
+
+        Args:
+            agent_id: The id of the agent to remove
+
+        Returns:
+            The ids of the ancestors of the agent, which need rebuilding
+
+        Raises:
+            AgentGraphError: If another agent still references the agent
+        """
+        if agent_id not in self.nodes:
+            return set()
+        self.without_node(agent_id)
+        ancestors = self.ancestors(agent_id)
+        self._remove(agent_id)
+        return ancestors
+
+    def ancestors(self, agent_id: int) -> set[int]:
+        """Returns the ids of every agent that contains the agent, directly or not"""
+        ancestors: set[int] = set()
+        pending = list(self.parents.get(agent_id, ()))
+        while pending:
+            parent_id = pending.pop()
+            if parent_id not in ancestors:
+                ancestors.add(parent_id)
+                pending.extend(self.parents.get(parent_id, ()))
+        return ancestors
+
+    def topological_order(self, agent_ids: Iterable[int] | None = None) -> list[int]:
+        """Orders agents so that every sub agent comes before the agents containing it
+
+        Args:
+            agent_ids: The agents to order, all agents by default
+
+        Returns:
+            The ordered agent ids
+        """
+        selected = set(self.nodes if agent_ids is None else agent_ids)
+        ordered: list[int] = []
+        done: set[int] = set()
+
+        def visit(agent_id: int) -> None:
+            if agent_id in done:
+                return
+            done.add(agent_id)
+            for child_id in self.children[agent_id]:
+                if child_id in selected:
+                    visit(child_id)
+            ordered.append(agent_id)
+
+        for agent_id in sorted(selected):
+            visit(agent_id)
+        return ordered
+
+    def _add(self, agent_pydantic: AgentPydantic) -> None:
+        agent_id = agent_pydantic.id
+        self.nodes[agent_id] = agent_pydantic
+        self.children[agent_id] = self.parse_sub_agent_ids(agent_pydantic)
+        self.parents.setdefault(agent_id, set())
+        for child_id in self.children[agent_id]:
+            self.parents.setdefault(child_id, set()).add(agent_id)
+
+    def _remove(self, agent_id: int) -> None:
+        for child_id in self.children.pop(agent_id):
+            self.parents.get(child_id, set()).discard(agent_id)
+        del self.nodes[agent_id]
+        if not self.parents.get(agent_id):
+            self.parents.pop(agent_id, None)
@@ -0,0 +1,177 @@
+import logging
+from typing import Callable, Iterable
+
+from google.adk.agents import BaseAgent
+from google.adk.tools import FunctionTool
+
+from server.models.agent_model import AgentPydantic, InMemoryAgent
+from server.service.agent_graph import AgentGraph
+
+logger = logging.getLogger(__name__)
+
+BuildAgent = Callable[[AgentPydantic, list[BaseAgent], list[FunctionTool]], BaseAgent]
+LoadTools = Callable[[AgentPydantic], list[FunctionTool]]
+
+
+class AgentRegistry:
+    """The built ADK agents of a single scenario.
+
+    Each agent is built once, sub agents before the agents containing them, and
+    kept by agent id so that an admin change only rebuilds the changed agent and
+    the agents containing it. The agents in in_memory_agent_lookup are those
+    trees, so a sub agent there still points at its parent. lookup_agent returns
+    agents that can be run as the root of a Runner.
+    """
+
+    def __init__(
+        self,
+        scenario_id: int,
+        agents_pydantic: Iterable[AgentPydantic],
+        build_agent: BuildAgent,
+        load_tools: LoadTools | None = None,
+    ):
+        """
+        Args:
+            scenario_id: The scenario the agents belong to
+            agents_pydantic: The agents of the scenario
+            build_agent: Builds an ADK agent from its pydantic object, sub agents
+                and tools
+            load_tools: Loads the tools of an agent, None to build agents without tools
+
+        Raises:
+            AgentGraphError: If a sub agent is missing or the links contain a cycle
+        """
+        self.scenario_id = scenario_id
+        self.agent_graph = AgentGraph(agents_pydantic)
+        self.in_memory_agent_lookup: dict[str, InMemoryAgent] = {}
+        self._build_agent = build_agent
+        self._load_tools = load_tools
+        self._built_agents: dict[int, BaseAgent] = {}
+        self._agent_tools: dict[int, list[FunctionTool]] = {}
+        # Copies of sub agents without a parent, built when run as a root
+        self._standalone_agents: dict[int, BaseAgent] = {}
+        self._rebuild(set(self.agent_graph.nodes))
+
+    def lookup_agent(self, agent_name: str) -> InMemoryAgent:
+        """Returns the agent with the given name, ready to run as a root agent
+
+        An agent that is the sub agent of another one is copied with its own sub
+        agents on first lookup, so the run does not see the parent.
+
+        Raises:
+            ValueError: If the scenario has no agent with that name
+        """
+        if agent_name not in self.in_memory_agent_lookup:
+            raise ValueError(
+                f"Agent {agent_name} not found in scenario {self.scenario_id}"
+            )
+        in_memory_agent = self.in_memory_agent_lookup[agent_name]
+        if in_memory_agent.agent.parent_agent is None:
+            return in_memory_agent
+
+        agent_id = in_memory_agent.agent_pydantic.id
+        if agent_id not in self._standalone_agents:
+            self._standalone_agents[agent_id] = self._build_copy(agent_id)
+        return InMemoryAgent(
+            agent_pydantic=in_memory_agent.agent_pydantic,
+            agent=self._standalone_agents[agent_id],
+        )
+
+    def validate_agent(self, agent_pydantic: AgentPydantic) -> None:
+        """Checks that saving the agent keeps the agent graph valid
+
+        Raises:
+            AgentGraphError: If a sub agent is missing or the change adds a cycle
+        """
+        self.agent_graph.with_node(agent_pydantic)
+
+    def validate_agent_removal(self, agent_id: int) -> None:
+        """Checks that no agent still references the agent
+
+        Raises:
+            AgentGraphError: If the agent is still a sub agent of another agent
+        """
+        if agent_id in self.agent_graph.nodes:
+            self.agent_graph.without_node(agent_id)
+
+    def refresh_agent(self, agent_pydantic: AgentPydantic) -> None:
+        """Rebuilds a created or updated agent and the agents containing it"""
+        self._agent_tools.pop(agent_pydantic.id, None)
+        self._rebuild(self.agent_graph.upsert(agent_pydantic))
+
+    def remove_agent(self, agent_id: int) -> None:
+        """Drops a deleted agent and rebuilds the agents that contained it"""
+        if agent_id not in self.agent_graph.nodes:
+            return
+
+        affected_ids = self.agent_graph.remove(agent_id)
+        self._built_agents.pop(agent_id, None)
+        self._agent_tools.pop(agent_id, None)
+        self._standalone_agents.pop(agent_id, None)
+        self._rebuild(affected_ids)
+
+    def _get_tools(self, agent_pydantic: AgentPydantic) -> list[FunctionTool]:
+        """Returns the tools of an agent, loaded once per agent"""
+        if self._load_tools is None or not agent_pydantic.tools:
+            return []
+        if agent_pydantic.id not in self._agent_tools:
+            self._agent_tools[agent_pydantic.id] = self._load_tools(agent_pydantic)
+        return self._agent_tools[agent_pydantic.id]
+
+    def _rebuild(self, agent_ids: set[int]) -> None:
+        """Rebuilds the given agents, sub agents first, reusing every other agent
+
+        Args:
+            agent_ids: The agents to rebuild, must include all of their ancestors
+        """
+        # Standalone copies contain the copies of their sub agents
+        for agent_id in agent_ids:
+            self._standalone_agents.pop(agent_id, None)
+        previous_agents = {
+            agent_id: self._built_agents.pop(agent_id)
+            for agent_id in agent_ids
+            if agent_id in self._built_agents
+        }
+        for agent_id in self.agent_graph.topological_order(agent_ids):
+            agent_pydantic = self.agent_graph.nodes[agent_id]
+            logger.info("Building agent %s", agent_pydantic.name)
+            sub_agents = [
+                self._claim_sub_agent(sub_agent_id, previous_agents.get(agent_id))
+                for sub_agent_id in self.agent_graph.children[agent_id]
+            ]
+            self._built_agents[agent_id] = self._build_agent(
+                agent_pydantic, sub_agents, self._get_tools(agent_pydantic)
+            )
+
+        self.in_memory_agent_lookup = {
+            agent_pydantic.name: InMemoryAgent(
+                agent_pydantic=agent_pydantic,
+                agent=self._built_agents[agent_id],
+            )
+            for agent_id, agent_pydantic in self.agent_graph.nodes.items()
+        }
+
+    def _claim_sub_agent(
+        self, agent_id: int, previous_parent: BaseAgent | None
+    ) -> BaseAgent:
+        """Returns the built agent for use as a sub agent of a new parent
+
+        ADK agents can only belong to a single parent. The built agent is reused
+        when it is free or only belonged to the previous version of the parent,
+        otherwise, when several agents share the sub agent, a copy is built.
+        """
+        agent = self._built_agents[agent_id]
+        if agent.parent_agent is None or agent.parent_agent is previous_parent:
+            agent.parent_agent = None
+            return agent
+        return self._build_copy(agent_id)
+
+    def _build_copy(self, agent_id: int) -> BaseAgent:
+        agent_pydantic = self.agent_graph.nodes[agent_id]
+        sub_agents = [
+            self._build_copy(sub_agent_id)
+            for sub_agent_id in self.agent_graph.children[agent_id]
+        ]
+        return self._build_agent(
+            agent_pydantic, sub_agents, self._get_tools(agent_pydantic)
+        )
@@ -1,18 +1,42 @@
-from google.adk.artifacts import InMemoryArtifactService
-from google.adk.runners import LiveRequestQueue, RunConfig, Runner
+import logging
+import time
+from typing import AsyncIterator
+
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.runners import Runner
 from google.genai import types
 from google.genai.types import Blob
+from opentelemetry import context as otel_context
+from opentelemetry import trace
 
-from server.models.agent_model import AgentResponse
+from server.metrics import RUNNER_DURATION, RUNNER_FIRST_EVENT
+from server.models.agent_model import (
+    AgentResponse,
+    AgentStreamEvent,
+    AgentStreamEventType,
+)
 from server.service.agent_service import AgentService
+from server.service.capture_service import capture_recorder
+from server.service.runner_pool import RunnerPool
 from server.service.session_service import SessionService
+from server.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 
 class AgentRequestService:
-    def __init__(self, agent_service: AgentService):
-        self.session_service = SessionService()
+    def __init__(
+        self,
+        agent_service: AgentService,
+        session_service: SessionService,
+        runner_pool: RunnerPool,
+    ):
+        self.session_service = session_service
         self.agent_service = agent_service
+        self.runner_pool = runner_pool
         self.runner = None
+        self.scenario_id = None
 
     async def request_agent_response(
         self,
@@ -22,8 +46,9 @@ class AgentRequestService:
         message: str,
         image_content: bytes | None = None,
         image_mime_type: str | None = None,
+        scenario_id: int | None = None,
     ) -> AgentResponse:
-        await self.initialize_runner(user_id, session_id, root_agent_name)
+        await self.initialize_runner(user_id, session_id, root_agent_name, scenario_id)
         return await self.call_agent_async(
             query=message,
             user_id=user_id,
@@ -32,43 +57,112 @@ class AgentRequestService:
             image_mime_type=image_mime_type,
         )
 
+    async def stream_agent_response(
+        self,
+        root_agent_name: str,
+        user_id: str,
+        session_id: str,
+        message: str,
+        image_content: bytes | None = None,
+        image_mime_type: str | None = None,
+        scenario_id: int | None = None,
+    ) -> AsyncIterator[AgentStreamEvent]:
+        """Streams the agent response as it is generated.
+
+        Partial text is forwarded as soon as the model produces it, and every final
+        response is forwarded with its author, so sub agents of the graph show up
+        as they finish instead of once the whole graph has run.
+
+        Args:
+            root_agent_name: The name of the root agent
+            user_id: The user ID
+            session_id: The session ID
+            message: The message to send to the agent
+            image_content: Optional image attached to the message
+            image_mime_type: The mime type of the image
+            scenario_id: The scenario of the agents, ignored when the runner was
+                already initialized
+
+        Yields:
+            Partial and final events of the agent response
+        """
+        if not self.runner:
+            await self.initialize_runner(
+                user_id, session_id, root_agent_name, scenario_id
+            )
+        content = self._build_user_content(message, image_content, image_mime_type)
+
+        async for event in self._observe_run(
+            self.runner.run_async(
+                user_id=user_id,
+                session_id=session_id,
+                new_message=content,
+                run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+            )
+        ):
+            if event.partial:
+                part = event.content and event.content.parts and event.content.parts[0]
+                if part and part.text:
+                    yield AgentStreamEvent(
+                        type=AgentStreamEventType.PARTIAL,
+                        text=part.text,
+                        author=event.author,
+                    )
+                continue
+
+            if event.is_final_response():
+                yield AgentStreamEvent(
+                    type=AgentStreamEventType.FINAL,
+                    text=self._get_final_response_text(event),
+                    author=event.author,
+                )
+
     async def initialize_runner(
         self,
         user_id: str,
         session_id: str,
         root_agent_name: str,
+        scenario_id: int | None = None,
     ) -> None:
-        """Starts an agent session
+        """Starts an agent session and picks the pooled runner of the root agent
+
+        The scenario is the explicit one, otherwise the one stored in the session
+        state, otherwise the currently selected scenario.
 
         Args:
             user_id: The user ID
             session_id: The session ID
             root_agent_name: The name of the root agent
+            scenario_id: The scenario of the agents
+
+        Raises:
+            ScenarioNotSelectedError: If no scenario is given, stored or selected
+            ValueError: If the agent is not found
         """
 
-        session = await self.session_service.get_or_create_session(user_id, session_id)
+        session = await self.session_service.get_or_create_session(
+            user_id,
+            session_id,
+            scenario_id,
+            default_scenario_id=self.agent_service.resolve_scenario_id,
+        )
+        if scenario_id is None:
+            scenario_id = self.session_service.get_scenario_id(session)
+        if scenario_id is None:
+            # The session was created without a scenario, it keeps the current one
+            scenario_id = self.agent_service.resolve_scenario_id()
+            await self.session_service.set_scenario_id(session, scenario_id)
+        self.scenario_id = scenario_id
 
-        root_agent = self.agent_service.lookup_agent(root_agent_name).agent
+        await self.agent_service.load_registry(self.scenario_id)
+        root_agent = self.agent_service.lookup_agent(
+            root_agent_name, self.scenario_id
+        ).agent
         if not root_agent:
             raise ValueError(f"Root agent {root_agent_name} not found")
 
-        print(f"Root agent: {root_agent.name}")
-        self.runner = Runner(
-            app_name=self.agent_service.app_name,
-            agent=root_agent,
-            session_service=self.session_service.get_session_service(),
-            artifact_service=InMemoryArtifactService(),
-        )
-
-        run_config = RunConfig(response_modalities=["TEXT"])
-
-        self.live_request_queue = LiveRequestQueue()
-
-        self.live_events = self.runner.run_live(
-            session=session,
-            live_request_queue=self.live_request_queue,
-            run_config=run_config,
-        )
+        logger.debug("Root agent: %s in scenario %s", root_agent.name, self.scenario_id)
+        self.runner = self.runner_pool.get_runner(root_agent, self.scenario_id)
 
     async def handle_media_types(
         self, runner: Runner, user_id: str, session_id: str, filename: str
@@ -101,16 +195,8 @@ class AgentRequestService:
             The final response from the agent
         """
         event_author = None
-        print(f"\n>>> User Query: {query}")
-        # Prepare the user's message in ADK format
-        parts: list[types.Part] = [types.Part(text=query)]
-        if image_content and image_mime_type:
-            parts.append(
-                types.Part(
-                    inline_data=Blob(data=image_content, mime_type=image_mime_type)
-                )
-            )
-        content = types.Content(role="user", parts=parts)
+        logger.debug(">>> User Query: %s", query)
+        content = self._build_user_content(query, image_content, image_mime_type)
 
         final_response_text = "Agent did not produce a final response."  # Default
 
@@ -119,33 +205,153 @@ class AgentRequestService:
         if not self.runner:
             raise ValueError("Runner not initialized")
 
-        async for event in self.runner.run_async(
-            user_id=user_id, session_id=session_id, new_message=content
-        ):
-            # You can uncomment the line below to see *all* events during execution
-            print(
-                f"  [Event] Author: {event.author}, Type: {type(event).__name__}, Final: {event.is_final_response()}, Content: {event.content}"
-            )
+        with tracer.start_as_current_span(
+            "agent.run",
+            attributes={"agent.name": self.runner.agent.name, "session.id": session_id},
+        ) as span:
+            async for event in self._observe_run(
+                self.runner.run_async(
+                    user_id=user_id, session_id=session_id, new_message=content
+                )
+            ):
+                # You can uncomment the line below to see *all* events during execution
+                logger.debug(
+                    "[Event] Author: %s, Type: %s, Final: %s, Content: %s",
+                    event.author,
+                    type(event).__name__,
+                    event.is_final_response(),
+                    event.content,
+                )
 
-            # Key Concept: is_final_response() marks the concluding message for the turn.
-            if event.is_final_response():
-                event_author = event.author
-                if event.content and event.content.parts:
-                    # Assuming text response in the first part
-                    final_response_text = event.content.parts[0].text
-                elif (
-                    event.actions and event.actions.escalate
-                ):  # Handle potential errors/escalations
-                    final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-                # Add more checks here if needed (e.g., specific error codes)
-
-                # Only break if it's an LLM agent, if it's a parallel or sequential agent we will want to aggregate responses
-                # if self.agent_pydantic.adk_type == ADKType.LLM.value:
-                #     break  # Stop processing events once the final response is found
-
-        print(f"<<< Agent Response: {final_response_text}")
+                # Key Concept: is_final_response() marks the concluding message for the turn.
+                if event.is_final_response():
+                    event_author = event.author
+                    final_response_text = self._get_final_response_text(
+                        event, final_response_text
+                    )
+
+                    # Only break if it's an LLM agent, if it's a parallel or sequential agent we will want to aggregate responses
+                    # if self.agent_pydantic.adk_type == ADKType.LLM.value:
+                    #     break  # Stop processing events once the final response is found
+            span.set_attribute("agent.final_author", event_author or "")
+
+        logger.debug("<<< Agent Response: %s", final_response_text)
 
         return AgentResponse(
             agent_response_text=final_response_text,
             author=event_author,
         )
+
+    async def _observe_run(self, events: AsyncIterator[Event]) -> AsyncIterator[Event]:
+        """Passes the events of a run through while observing it.
+
+        The first event latency and duration of the run are recorded under the
+        name of the root agent. Consecutive events of the same author are traced
+        as one span, a child of the span that was current when the run started,
+        so the trace shows which sub agent took how long. The span of the latest
+        author is current while the runner produces the next events, so the
+        spans of its model and tool calls nest under it. It is detached again
+        before each event is yielded, the caller keeps its own context.
+        """
+        agent = self.runner.agent.name
+        parent_context = otel_context.get_current()
+        start = time.perf_counter()
+        first_event = True
+        author_span = None
+        author = None
+        event_count = 0
+        try:
+            while True:
+                token = (
+                    otel_context.attach(
+                        trace.set_span_in_context(author_span, parent_context)
+                    )
+                    if author_span is not None
+                    else None
+                )
+                try:
+                    event = await anext(events)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    if token is not None:
+                        otel_context.detach(token)
+                if first_event:
+                    RUNNER_FIRST_EVENT.labels(agent=agent).observe(
+                        time.perf_counter() - start
+                    )
+                    first_event = False
+                if author_span is None or event.author != author:
+                    if author_span is not None:
+                        author_span.set_attribute("agent.events", event_count)
+                        author_span.end()
+                    author = event.author
+                    event_count = 0
+                    author_span = tracer.start_span(
+                        f"agent.author.{author}",
+                        context=parent_context,
+                        attributes={"agent.author": author or ""},
+                    )
+                event_count += 1
+                if not event.partial:
+                    self._capture_event(event, time.perf_counter() - start)
+                yield event
+        finally:
+            if author_span is not None:
+                author_span.set_attribute("agent.events", event_count)
+                author_span.end()
+            RUNNER_DURATION.labels(agent=agent).observe(time.perf_counter() - start)
+
+    def _capture_event(self, event: Event, seconds: float) -> None:
+        """Records the text or transfer of an event, enough to replay the model"""
+        if not capture_recorder.enabled or not (event.content and event.content.parts):
+            return
+        text = "".join(part.text or "" for part in event.content.parts)
+        transfer = next(
+            (
+                call.args.get("agent_name")
+                for call in event.get_function_calls()
+                if call.name == "transfer_to_agent" and call.args
+            ),
+            None,
+        )
+        if text or transfer:
+            capture_recorder.record(
+                "runner_event",
+                author=event.author,
+                final=event.is_final_response(),
+                text=text or None,
+                transfer=transfer,
+                seconds=seconds,
+            )
+
+    def _build_user_content(
+        self,
+        query: str,
+        image_content: bytes | None = None,
+        image_mime_type: str | None = None,
+    ) -> types.Content:
+        """Prepares the user's message in ADK format"""
+        parts: list[types.Part] = [types.Part(text=query)]
+        if image_content and image_mime_type:
+            parts.append(
+                types.Part(
+                    inline_data=Blob(data=image_content, mime_type=image_mime_type)
+                )
+            )
+        return types.Content(role="user", parts=parts)
+
+    def _get_final_response_text(
+        self,
+        event: Event,
+        default: str = "Agent did not produce a final response.",
+    ) -> str:
+        """Extracts the text of a final response event"""
+        if event.content and event.content.parts:
+            # Assuming text response in the first part
+            return event.content.parts[0].text
+        elif event.actions and event.actions.escalate:
+            # Handle potential errors/escalations
+            return f"Agent escalated: {event.error_message or 'No specific message.'}"
+        # Add more checks here if needed (e.g., specific error codes)
+        return default
@@ -1,104 +1,233 @@
-import importlib
+import logging
 import os
+from collections import OrderedDict
 
 from google.adk.agents import Agent, ParallelAgent, SequentialAgent
 from google.adk.tools import FunctionTool
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from server.dependencies.database import get_session
+from server.dependencies.database import async_engine
 from server.models.agent_model import (
     ADKType,
     AgentPydantic,
     InMemoryAgent,
 )
+from server.service.agent_graph import AgentGraph
+from server.service.agent_registry import AgentRegistry
 from server.service.scenario_service import ScenarioService
+from server.service.tool_registry import ToolRegistry
 
-PATH_TO_TOOLS = "server.tools"
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CACHED_SCENARIOS = 8
+
+
+class ScenarioNotSelectedError(ValueError):
+    """Raised when a request names no scenario and none is selected"""
+
+
+def select_agents(scenario_id: int):
+    return select(AgentPydantic).where(AgentPydantic.scenario_id == scenario_id)
 
 
 class AgentService:
-    def __init__(self, scenario_service: ScenarioService):
+    def __init__(
+        self,
+        scenario_service: ScenarioService,
+        tool_registry: ToolRegistry | None = None,
+    ):
         self.app_name = os.getenv("APP_NAME", "Rehearsed")
         self.runner = None
         self.live_events = None
         self.live_request_queue = None
         self.scenario_service = scenario_service
+        self.tool_registry = tool_registry or ToolRegistry()
 
-        # TODO: probably a better way to do this, but it enables
-        # the agent CRUD routes to also call get_agents_from_database
-        # to refresh the agents in memory when the DB is updated
-        self.in_memory_agent_lookup: dict[str, InMemoryAgent] = None
+        # Agents are built lazily per scenario and the least recently used
+        # scenarios are evicted, so users on different scenarios never share or
+        # thrash each other's agents
+        self.max_cached_scenarios = int(
+            os.getenv("AGENT_REGISTRY_MAX_SCENARIOS", DEFAULT_MAX_CACHED_SCENARIOS)
+        )
+        self.load_tools = True
+        self._registries: OrderedDict[int, AgentRegistry] = OrderedDict()
 
-    def get_agents_from_database(self, load_tools: bool = True) -> None:
-        """Loads all agents in the database into memory with all of their sub agents.
+    def get_registry(self, scenario_id: int | None = None) -> AgentRegistry:
+        """Returns the agents of a scenario, once loaded with load_registry
 
-        First it loads all the agent pydantic objects from the database into memory.
-        Then it uses those pydantic objects to initialize the Agents objects and store them.
+        Reading the agents blocks, so a sync lookup never loads them. Async code
+        awaits load_registry before looking agents up.
 
-        Note: This method is public because we want to reload the agents upon an Admin making any changes to the DB
+        Args:
+            scenario_id: The scenario, defaults to the currently set scenario
+
+        Returns:
+            The agent registry of the scenario
+
+        Raises:
+            ValueError: If no scenario is given and none is set, or the agents
+                of the scenario are not loaded
+        """
+        scenario_id = self.resolve_scenario_id(scenario_id)
+        registry = self._get_cached_registry(scenario_id)
+        if registry is None:
+            raise ValueError(f"Agents of scenario {scenario_id} are not loaded")
+        return registry
+
+    async def load_registry(self, scenario_id: int | None = None) -> AgentRegistry:
+        """Returns the agents of a scenario, reading them without blocking the loop
 
         Args:
-            load_tools: Whether to load the tools for the agent
+            scenario_id: The scenario, defaults to the currently set scenario
+
+        Returns:
+            The agent registry of the scenario
+
+        Raises:
+            ValueError: If no scenario is given and none is set
         """
-        # TODO: move this to ORM layer?
-        session = next(get_session())
-        statement = select(AgentPydantic).where(
-            AgentPydantic.scenario_id == self.scenario_service.get_current_scenario().id
+        scenario_id = self.resolve_scenario_id(scenario_id)
+        registry = self._get_cached_registry(scenario_id)
+        if registry is not None:
+            return registry
+        return self._add_registry(
+            scenario_id, await self._load_agents_pydantic(scenario_id)
         )
-        agents_pydantic = session.exec(statement).all()
-
-        # Note: it might be more memory efficient to do this all in one pass,
-        # but I didn't want to modify objects I'm iterating over for simplicity
-        agent_pydantic_lookup: dict[int, AgentPydantic] = {}
-        for agent_pydantic in agents_pydantic:
-            agent_pydantic_lookup[agent_pydantic.id] = agent_pydantic
-
-        in_memory_agent_lookup: dict[int, InMemoryAgent] = {}
-        for agent_id, agent_pydantic in agent_pydantic_lookup.items():
-            in_memory_agent_lookup[agent_pydantic.name] = InMemoryAgent(
-                agent_pydantic=agent_pydantic,
-                agent=self._load_root_agent(
-                    agent_id, agent_pydantic_lookup, load_tools=load_tools
-                ),
-            )
-        self.in_memory_agent_lookup = in_memory_agent_lookup
 
-    def list_available_agents(self) -> list[str]:
-        """Returns a list of available agents loaded into memory"""
-        return [agent_name for agent_name in self.in_memory_agent_lookup.keys()]
+    def _get_cached_registry(self, scenario_id: int) -> AgentRegistry | None:
+        registry = self._registries.get(scenario_id)
+        if registry is not None:
+            self._registries.move_to_end(scenario_id)
+        return registry
+
+    def _add_registry(
+        self, scenario_id: int, agents_pydantic: list[AgentPydantic]
+    ) -> AgentRegistry:
+        registry = AgentRegistry(
+            scenario_id,
+            agents_pydantic,
+            build_agent=self._build_adk_agent,
+            load_tools=self._load_tools if self.load_tools else None,
+        )
+        self._registries[scenario_id] = registry
+        while len(self._registries) > self.max_cached_scenarios:
+            evicted_scenario_id, _ = self._registries.popitem(last=False)
+            logger.info("Evicted agents of scenario %s", evicted_scenario_id)
+        return registry
+
+    def resolve_scenario_id(self, scenario_id: int | None = None) -> int:
+        """Returns the given scenario id or the id of the currently set scenario
+
+        Raises:
+            ScenarioNotSelectedError: If no scenario is given and none is set
+        """
+        if scenario_id is not None:
+            return scenario_id
+        scenario = self.scenario_service.get_current_scenario()
+        if scenario is None:
+            raise ScenarioNotSelectedError("No scenario selected")
+        return scenario.id
+
+    async def get_agents_from_database(
+        self, load_tools: bool = True, scenario_id: int | None = None
+    ) -> None:
+        """Loads all agents of a scenario into memory with all of their sub agents.
+
+        Drops any cached agents of the scenario first. Agents are otherwise loaded
+        lazily on first lookup, so this is only needed to force a full reload.
+
+        Args:
+            load_tools: Whether to load the tools for the agent
+            scenario_id: The scenario, defaults to the currently set scenario
+        """
+        scenario_id = self.resolve_scenario_id(scenario_id)
+        self.load_tools = load_tools
+        self._registries.pop(scenario_id, None)
+        await self.load_registry(scenario_id)
+
+    async def validate_agent(self, agent_pydantic: AgentPydantic) -> None:
+        """Checks that the agent graph of its scenario stays valid and the tools exist
+
+        Args:
+            agent_pydantic: The agent about to be created or updated
+
+        Raises:
+            AgentGraphError: If a sub agent is missing or the change adds a cycle
+            ToolRegistryError: If the agent references an unknown tool
+        """
+        self.tool_registry.validate_agent(agent_pydantic)
+        registry = self._registries.get(agent_pydantic.scenario_id)
+        if registry is not None:
+            registry.validate_agent(agent_pydantic)
+        else:
+            AgentGraph(
+                await self._load_agents_pydantic(agent_pydantic.scenario_id)
+            ).with_node(agent_pydantic)
+
+    def validate_agent_removal(self, agent_id: int) -> None:
+        """Checks that no cached agent still references the agent
+
+        Raises:
+            AgentGraphError: If the agent is still a sub agent of another agent
+        """
+        for registry in self._registries.values():
+            registry.validate_agent_removal(agent_id)
+
+    def refresh_agent(self, agent_pydantic: AgentPydantic) -> None:
+        """Rebuilds a created or updated agent and the agents containing it
+
+        Only scenarios with cached agents are touched, the others pick the change
+        up when they are built.
+
+        Args:
+            agent_pydantic: The agent as saved in the database
+        """
+        for scenario_id, registry in self._registries.items():
+            if scenario_id == agent_pydantic.scenario_id:
+                registry.refresh_agent(agent_pydantic)
+            else:
+                # The agent may have been moved out of the scenario
+                registry.remove_agent(agent_pydantic.id)
 
-    def lookup_agent(self, agent_name: str) -> InMemoryAgent:
+    def remove_agent(self, agent_id: int) -> None:
+        """Drops a deleted agent and rebuilds the agents that contained it
+
+        Args:
+            agent_id: The id of the deleted agent
+        """
+        for registry in self._registries.values():
+            registry.remove_agent(agent_id)
+
+    async def list_available_agents(self, scenario_id: int | None = None) -> list[str]:
+        """Returns a list of available agents of the scenario"""
+        registry = await self.load_registry(scenario_id)
+        return list(registry.in_memory_agent_lookup.keys())
+
+    def lookup_agent(
+        self, agent_name: str, scenario_id: int | None = None
+    ) -> InMemoryAgent:
         """Returns the specified agent from the in memory agent store
         Args:
             agent_name: The name of the agent to lookup
+            scenario_id: The scenario of the agent, the currently set one by default
         Returns:
             The InMemory Agent
+        Raises:
+            ValueError: If the agent is not found or its scenario is not loaded
         """
-        if agent_name not in self.in_memory_agent_lookup:
-            raise ValueError(f"Agent {agent_name} not found")
-
-        return self.in_memory_agent_lookup[agent_name]
-
-    def _load_tools(
-        self, agent_pydantic: AgentPydantic
-    ) -> list[FunctionTool] | list[None]:
-        tools = []
-        active_tool_names = [
-            t.strip() for t in agent_pydantic.tools.split(",") if t.strip()
-        ]
-        active_module_names = [
-            m.strip() for m in agent_pydantic.modules.split(",") if m.strip()
-        ]
-        if active_tool_names and active_module_names:
-            for tool, module in zip(active_tool_names, active_module_names):
-                print(
-                    f"For agent {agent_pydantic.name}, loading tool: {tool} from module: {module}"
-                )
-                module_path = importlib.import_module(f"{PATH_TO_TOOLS}.{module}")
-                function = getattr(module_path, tool)
-                tools.append(FunctionTool(func=function))
-
-        return tools
+        return self.get_registry(scenario_id).lookup_agent(agent_name)
+
+    async def _load_agents_pydantic(self, scenario_id: int) -> list[AgentPydantic]:
+        async with AsyncSession(async_engine) as session:
+            agents_pydantic = (await session.exec(select_agents(scenario_id))).all()
+        logger.info(
+            "Loaded %d agents for scenario %s", len(agents_pydantic), scenario_id
+        )
+        return agents_pydantic
+
+    def _load_tools(self, agent_pydantic: AgentPydantic) -> list[FunctionTool]:
+        return self.tool_registry.get_tools(agent_pydantic)
 
     def _build_adk_agent(
         self,
@@ -141,58 +270,3 @@ class AgentService:
             )
         else:
             raise ValueError(f"Invalid ADK type: {agent_pydantic.adk_type}")
-
-    def _get_agents(
-        self, agent_ids: list[int], agent_pydantic_lookup: dict[int, AgentPydantic]
-    ) -> list[Agent]:
-        agents_pydantic = [agent_pydantic_lookup[agent_id] for agent_id in agent_ids]
-        agents = []
-        for agent_pydantic in agents_pydantic:
-            tools = []
-            if agent_pydantic.tools:
-                tools = self._load_tools(agent_pydantic)
-
-            sub_agents = []
-            if agent_pydantic.sub_agent_ids:
-                sub_agent_ids = [
-                    int(id) for id in agent_pydantic.sub_agent_ids.split(",")
-                ]
-                sub_agents = self._get_agents(sub_agent_ids, agent_pydantic_lookup)
-            agents.append(self._build_adk_agent(agent_pydantic, sub_agents, tools))
-        return agents
-
-    def _load_root_agent(
-        self,
-        agent_id: int,
-        agent_pydantic_lookup: dict[int, AgentPydantic],
-        load_tools: bool = True,
-    ) -> Agent:
-        """
-        Loads the root agent for the scenario
-
-        Args:
-            agent_id: The id of the agent to load
-            load_tools: Whether to load the tools for the agent
-
-        Returns:
-            The Agent object
-        """
-        agent_pydantic = agent_pydantic_lookup[agent_id]
-        print(
-            f"Loading root agent for scenario {self.scenario_service.get_current_scenario().id} with agent name {agent_pydantic.name}"
-        )
-
-        print(f"Root agent: {agent_pydantic.name}")
-
-        if agent_pydantic.sub_agent_ids:
-            sub_agent_ids = [int(id) for id in agent_pydantic.sub_agent_ids.split(",")]
-            sub_agents = self._get_agents(sub_agent_ids, agent_pydantic_lookup)
-        else:
-            sub_agents = []
-
-        if load_tools:
-            tools = self._load_tools(agent_pydantic)
-        else:
-            tools = []
-
-        return self._build_adk_agent(agent_pydantic, sub_agents, tools)
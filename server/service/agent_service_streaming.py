@@ -1,5 +1,6 @@
-import base64
+import asyncio
 import json
+import logging
 import os
 
 from fastapi import WebSocket, WebSocketDisconnect
@@ -10,19 +11,47 @@ from google.genai.types import (
     Blob,
     Content,
     Part,
+    PrebuiltVoiceConfig,
     SpeechConfig,
     VoiceConfig,
-    PrebuiltVoiceConfig,
 )
 
+from server.logging_config import sampled
 from server.service.agent_service import AgentService
+from server.service.capture_service import capture_recorder
+from server.service.frame_protocol import (
+    AUDIO_MIME_TYPE,
+    TEXT_MIME_TYPE,
+    FrameProtocol,
+)
+from server.service.send_queue import SendQueue, send_queue_registry
 from server.service.session_service import SessionService
+from server.service.voice_activity import (
+    VoiceActivityDetector,
+    voice_activity_registry,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class AgentServiceStreaming:
-    def __init__(self, agent_service: AgentService):
+    def __init__(
+        self,
+        agent_service: AgentService,
+        session_service: SessionService,
+        frame_protocol: FrameProtocol | None = None,
+        announce_audio_format: bool = False,
+        voice_activity_detection: bool | None = None,
+    ):
         self.agent_service = agent_service
-        self.session_service = SessionService()
+        self.session_service = session_service
+        self.frame_protocol = frame_protocol or FrameProtocol()
+        self.announce_audio_format = announce_audio_format
+        if voice_activity_detection is None:
+            voice_activity_detection = (
+                os.getenv("VAD_ENABLED", "true").lower() == "true"
+            )
+        self.voice_activity_detection = voice_activity_detection
         self.app_name = os.getenv("APP_NAME", "Rehearsed")
 
     async def start_agent_session(
@@ -31,6 +60,7 @@ class AgentServiceStreaming:
         session_id: str,
         root_agent_name: str,
         is_audio: bool = False,
+        scenario_id: int | None = None,
     ):
         """Starts an agent session
 
@@ -39,17 +69,19 @@ class AgentServiceStreaming:
             session_id: The session ID
             root_agent_name: The name of the root agent
             is_audio: Whether the session is audio
+            scenario_id: The scenario of the agents, the current one by default
         """
 
         # session = await self.session_service.get_or_create_session(user_id, session_id)
 
-        in_memory_agent = self.agent_service.lookup_agent(root_agent_name)
+        await self.agent_service.load_registry(scenario_id)
+        in_memory_agent = self.agent_service.lookup_agent(root_agent_name, scenario_id)
         if not in_memory_agent:
             raise ValueError(f"Root agent {root_agent_name} not found")
 
         root_agent = in_memory_agent.agent
         pydantic_agent = in_memory_agent.agent_pydantic
-        print(f"Root agent: {root_agent.name}")
+        logger.info("Root agent: %s", root_agent.name)
 
         runner = InMemoryRunner(
             app_name=self.app_name,
@@ -84,108 +116,164 @@ class AgentServiceStreaming:
             live_request_queue=live_request_queue,
             run_config=run_config,
         )
-        print("Agent session started with live_events", live_events)
+        logger.info("Agent session started for user %s", user_id)
 
         return live_events, live_request_queue
 
-    async def agent_to_client_messaging(self, websocket: WebSocket, live_events):
-        """Agent to client communication"""
+    async def agent_to_client_messaging(
+        self, websocket: WebSocket, live_events, connection_id: str = ""
+    ):
+        """Agent to client communication
+
+        Events are put on a bounded send queue drained by a separate sender task,
+        so a slow client never stalls the consumption of the live events.
+        """
+        send_queue = SendQueue(connection_id, self.frame_protocol)
+        send_queue_registry.add(send_queue)
+        if self.announce_audio_format:
+            send_queue.put_message(
+                {"audio_format": self.frame_protocol.transcoder.describe()}
+            )
+        sender = asyncio.create_task(send_queue.run(websocket))
+        drain = False
         try:
-            print("Starting agent to client messaging")
-            while True:
-                print("Waiting for event")
-                async for event in live_events:
-                    print(f"Received event: {event}")
-                    # If the turn complete or interrupted, send it
-                    if event.turn_complete or event.interrupted:
-                        message = {
-                            "turn_complete": event.turn_complete,
-                            "interrupted": event.interrupted,
-                        }
-                        await websocket.send_text(json.dumps(message))
-                        print(f"[AGENT TO CLIENT]: {message}")
-                        continue
+            logger.debug("Starting agent to client messaging")
+            async for event in live_events:
+                if sender.done():
+                    # Raises the disconnect or send error of the sender
+                    sender.result()
+                    return
 
-                    # Read the Content and its first Part
-                    part: Part = (
-                        event.content and event.content.parts and event.content.parts[0]
-                    )
-                    if not part:
+                logger.debug("Received event: %s", event, extra=sampled(50))
+                # If the turn complete or interrupted, send it
+                if event.turn_complete or event.interrupted:
+                    if event.interrupted:
+                        # The user barged in, queued audio is stale
+                        flushed = send_queue.flush_audio()
+                        logger.debug("Flushed %d queued audio chunks", flushed)
+                    message = {
+                        "turn_complete": event.turn_complete,
+                        "interrupted": event.interrupted,
+                    }
+                    send_queue.put_message(message)
+                    capture_recorder.record("ws_out", **message)
+                    logger.debug("[AGENT TO CLIENT]: %s", message)
+                    continue
+
+                # Read the Content and its first Part
+                part: Part = (
+                    event.content and event.content.parts and event.content.parts[0]
+                )
+                if not part:
+                    continue
+
+                # If it's audio, send it in the negotiated frame mode
+                is_audio = part.inline_data and part.inline_data.mime_type.startswith(
+                    AUDIO_MIME_TYPE
+                )
+                if is_audio:
+                    audio_data = part.inline_data and part.inline_data.data
+                    if audio_data:
+                        send_queue.put_audio(audio_data)
+                        capture_recorder.record("ws_out", audio_bytes=len(audio_data))
+                        logger.debug(
+                            "[AGENT TO CLIENT]: audio/pcm: %d bytes.",
+                            len(audio_data),
+                            extra=sampled(100),
+                        )
                         continue
 
-                    # If it's audio, send Base64 encoded audio data
-                    is_audio = (
-                        part.inline_data
-                        and part.inline_data.mime_type.startswith("audio/pcm")
+                # If it's text and a partial text, send it
+                if part.text and event.partial:
+                    message = {"mime_type": TEXT_MIME_TYPE, "data": part.text}
+                    send_queue.put_message(message)
+                    capture_recorder.record("ws_out", text=part.text)
+                    logger.debug(
+                        "[AGENT TO CLIENT]: text/plain: %s",
+                        message,
+                        extra=sampled(20),
                     )
-                    if is_audio:
-                        audio_data = part.inline_data and part.inline_data.data
-                        if audio_data:
-                            message = {
-                                "mime_type": "audio/pcm",
-                                "data": base64.b64encode(audio_data).decode("ascii"),
-                            }
-                            await websocket.send_text(json.dumps(message))
-                            print(
-                                f"[AGENT TO CLIENT]: audio/pcm: {len(audio_data)} bytes."
-                            )
-                            continue
-
-                    # If it's text and a partial text, send it
-                    if part.text and event.partial:
-                        message = {"mime_type": "text/plain", "data": part.text}
-                        await websocket.send_text(json.dumps(message))
-                        print(f"[AGENT TO CLIENT]: text/plain: {message}")
+            # The live events ended, the queued frames still go out
+            drain = True
         except WebSocketDisconnect:
-            print("WebSocket client disconnected during agent messaging")
+            logger.info("WebSocket client disconnected during agent messaging")
             # Don't re-raise, just return gracefully
             return
         except Exception as e:
-            print(f"Error in agent_to_client_messaging: {e}")
+            logger.exception("Error in agent_to_client_messaging: %s", e)
             # Re-raise to be handled by the main WebSocket handler
             raise
+        finally:
+            send_queue.close()
+            if drain:
+                # Lets the sender finish the queued audio and the last turn_complete
+                await asyncio.wait([sender], timeout=send_queue.drain_seconds)
+            sender.cancel()
+            send_queue_registry.remove(send_queue)
+            logger.info("Send queue stats: %s", send_queue.get_stats())
 
-    async def client_to_agent_messaging(self, websocket: WebSocket, live_request_queue):
-        """Client to agent communication"""
+    async def client_to_agent_messaging(
+        self, websocket: WebSocket, live_request_queue, connection_id: str = ""
+    ):
+        """Client to agent communication
+
+        With voice activity detection enabled, silent audio is dropped before it
+        reaches the model.
+        """
+        detector = None
+        if self.voice_activity_detection:
+            detector = VoiceActivityDetector(connection_id)
+            voice_activity_registry.add(detector)
         try:
             while True:
-                # Decode JSON message
-                message_json = await websocket.receive_text()
-                message = json.loads(message_json)
-                mime_type = message["mime_type"]
-                data = message["data"]
+                # Audio arrives decoded, whichever the frame mode
+                message = await self.frame_protocol.receive(websocket)
+                mime_type = message.mime_type
+                data = message.data
 
                 # Send the message to the agent
-                if mime_type == "text/plain":
+                if mime_type == TEXT_MIME_TYPE:
                     # Send a text message
+                    capture_recorder.record("ws_in", text=data)
                     content = Content(role="user", parts=[Part.from_text(text=data)])
                     live_request_queue.send_content(content=content)
-                    print(f"[CLIENT TO AGENT]: {data}")
-                elif mime_type == "audio/pcm":
-                    # Send an audio data
-                    decoded_data = base64.b64decode(data)
-                    live_request_queue.send_realtime(
-                        Blob(data=decoded_data, mime_type=mime_type)
-                    )
+                    logger.debug("[CLIENT TO AGENT]: %s", data)
+                elif mime_type == AUDIO_MIME_TYPE:
+                    # Send an audio data, unless it is silence
+                    if capture_recorder.enabled:
+                        audio = capture_recorder.encode_microphone_audio(data)
+                        capture_recorder.record("ws_in", audio=audio)
+                    if detector:
+                        data = detector.process(data)
+                    if data:
+                        live_request_queue.send_realtime(
+                            Blob(data=data, mime_type=mime_type)
+                        )
                 else:
                     raise ValueError(f"Mime type not supported: {mime_type}")
         except WebSocketDisconnect:
-            print("WebSocket client disconnected")
+            logger.info("WebSocket client disconnected")
             # Don't re-raise, just return gracefully
             return
         except json.JSONDecodeError as e:
-            print(f"Invalid JSON received from client: {e}")
+            logger.warning("Invalid JSON received from client: %s", e)
             # Send error message back to client
             try:
-                await websocket.send_text(json.dumps({"error": "Invalid JSON format"}))
+                await self.frame_protocol.send_message(
+                    websocket, {"error": "Invalid JSON format"}
+                )
             except:
                 pass
         except Exception as e:
-            print(f"Error in client_to_agent_messaging: {e}")
+            logger.exception("Error in client_to_agent_messaging: %s", e)
             # Send error message back to client
             try:
-                await websocket.send_text(
-                    json.dumps({"error": "Internal server error"})
+                await self.frame_protocol.send_message(
+                    websocket, {"error": "Internal server error"}
                 )
             except:
                 pass
+        finally:
+            if detector:
+                voice_activity_registry.remove(detector)
+                logger.info("Voice activity stats: %s", detector.get_stats())
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Default (max concurrency, timeout in seconds) per backend, overridable with
+# <NAME>_BACKEND_MAX_CONCURRENCY and <NAME>_BACKEND_TIMEOUT_SECONDS
+DEFAULT_BACKEND_LIMITS: dict[str, tuple[int, float]] = {
+    "tts": (8, 30.0),
+    "stt": (4, 60.0),
+    "text": (4, 120.0),
+    "gemini": (4, 120.0),
+}
+
+
+class AsyncBackend:
+    """Async adapter for a blocking or rate limited Google client.
+
+    Blocking calls run on a dedicated, bounded thread pool so they never block the
+    event loop, native async calls run directly on the loop. Both are limited to
+    max_concurrency calls in flight and cancelled after timeout seconds.
+
+    The backends are process wide while an asyncio.Semaphore belongs to the loop
+    it is first used on, so each running loop gets a semaphore of its own.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, timeout: float):
+        """
+        Args:
+            name: The name of the backend, used for the executor threads
+            max_concurrency: The maximum number of calls in flight
+            timeout: The number of seconds after which a call is abandoned
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix=f"{name}-backend"
+        )
+        # Keyed by the id of the loop, a semaphore refers to its loop so neither
+        # may be held strongly. Every call holding a slot keeps its semaphore
+        # alive, one nobody refers to has all slots free and is simply recreated
+        self._semaphores: weakref.WeakValueDictionary[int, asyncio.Semaphore] = (
+            weakref.WeakValueDictionary()
+        )
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs a blocking call on the executor of the backend
+
+        Args:
+            func: The blocking callable
+            *args: Positional arguments for the callable
+            **kwargs: Keyword arguments for the callable
+
+        Returns:
+            The result of the callable
+
+        Raises:
+            TimeoutError: If the call did not finish within the backend timeout
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._get_semaphore(loop)
+        await semaphore.acquire()
+        try:
+            future = self.executor.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            semaphore.release()
+            raise
+
+        # Release the slot once the thread is actually free, not when the caller
+        # gives up, otherwise timed out calls would pile up in the executor queue
+        def release(_) -> None:
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # The event loop is closed, nobody is waiting on the semaphore
+                pass
+
+        future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    async def run_async(self, coroutine_factory: Callable[[], Awaitable[T]]) -> T:
+        """Runs a native async call under the concurrency limit and timeout
+
+        Args:
+            coroutine_factory: Callable returning the awaitable to run
+
+        Returns:
+            The result of the awaitable
+
+        Raises:
+            TimeoutError: If the call did not finish within the backend timeout
+        """
+        async with self._get_semaphore(asyncio.get_running_loop()):
+            return await asyncio.wait_for(coroutine_factory(), self.timeout)
+
+    def _get_semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        """Returns the semaphore of the loop, creating it on its first call"""
+        semaphore = self._semaphores.get(id(loop))
+        if semaphore is None:
+            semaphore = self._semaphores[id(loop)] = asyncio.Semaphore(
+                self.max_concurrency
+            )
+        return semaphore
+
+
+_backends: dict[str, AsyncBackend] = {}
+
+
+def get_backend(name: str) -> AsyncBackend:
+    """Returns the process wide backend with the given name, creating it on first use
+
+    Args:
+        name: The name of the backend, one of DEFAULT_BACKEND_LIMITS
+
+    Returns:
+        The backend
+    """
+    if name not in _backends:
+        default_concurrency, default_timeout = DEFAULT_BACKEND_LIMITS[name]
+        prefix = name.upper()
+        _backends[name] = AsyncBackend(
+            name=name,
+            max_concurrency=int(
+                os.getenv(f"{prefix}_BACKEND_MAX_CONCURRENCY", default_concurrency)
+            ),
+            timeout=float(
+                os.getenv(f"{prefix}_BACKEND_TIMEOUT_SECONDS", default_timeout)
+            ),
+        )
+    return _backends[name]
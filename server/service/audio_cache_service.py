@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[1] / ".cache" / "tts"
+
+
+class AudioCacheService:
+    """Two tier, content addressed cache for synthesized audio.
+
+    The first tier is an in-process LRU bounded by the total number of audio bytes
+    it holds, the second tier is an on-disk store that survives restarts, bounded
+    the same way and evicting the files read least recently. Keys are
+    the hash of the text together with the voice and audio config used to
+    synthesize it, so a change in either produces a new entry.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int | None = None,
+        cache_dir: str | None = None,
+        max_disk_bytes: int | None = None,
+    ):
+        """
+        Args:
+            max_memory_bytes: The byte budget of the in-process LRU, defaults to
+                TTS_CACHE_MAX_BYTES
+            cache_dir: The directory of the on-disk store, defaults to TTS_CACHE_DIR,
+                otherwise server/.cache/tts. Setting TTS_CACHE_DIR to an empty string
+                disables the disk tier
+            max_disk_bytes: The byte budget of the on-disk store, defaults to
+                TTS_CACHE_MAX_DISK_BYTES
+        """
+        if max_memory_bytes is None:
+            max_memory_bytes = int(
+                os.getenv("TTS_CACHE_MAX_BYTES", DEFAULT_MAX_MEMORY_BYTES)
+            )
+        self.max_memory_bytes = max_memory_bytes
+        if max_disk_bytes is None:
+            max_disk_bytes = int(
+                os.getenv("TTS_CACHE_MAX_DISK_BYTES", DEFAULT_MAX_DISK_BYTES)
+            )
+        self.max_disk_bytes = max_disk_bytes
+        if cache_dir is None:
+            cache_dir = os.getenv("TTS_CACHE_DIR", str(DEFAULT_CACHE_DIR))
+        self.cache_dir = Path(cache_dir).resolve() if cache_dir else None
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        # Sizes of the files on disk, least recently read first, scanned on first
+        # use. Only changed on the event loop, the threads only touch the files
+        self._disk: OrderedDict[str, int] | None = None
+        self._disk_bytes = 0
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.collapsed_requests = 0
+
+    @staticmethod
+    def make_key(text: str, voice: dict, audio_config: dict) -> str:
+        """Builds the cache key for a synthesis request
+
+        Args:
+            text: The text to synthesize
+            voice: The voice selection parameters
+            audio_config: The audio config parameters
+
+        Returns:
+            The hex digest identifying the audio
+        """
+        payload = json.dumps(
+            {"text": text, "voice": voice, "audio_config": audio_config},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get_or_synthesize(
+        self,
+        key: str,
+        synthesize: Callable[[], Awaitable[Optional[bytes]]],
+    ) -> Optional[bytes]:
+        """Returns the cached audio for the key or synthesizes and stores it.
+
+        Concurrent calls for the same key share a single synthesis.
+
+        Args:
+            key: The cache key, see make_key
+            synthesize: Coroutine factory producing the audio on a miss
+
+        Returns:
+            The audio content in bytes or None if synthesis failed
+        """
+        audio_content = self._get_from_memory(key)
+        if audio_content is not None:
+            self.memory_hits += 1
+            return audio_content
+
+        # The synthesis runs in a task of its own, so a caller that is cancelled
+        # only stops waiting and the others still get the audio
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            in_flight = asyncio.create_task(self._load(key, synthesize))
+            self._in_flight[key] = in_flight
+            in_flight.add_done_callback(partial(self._finish_load, key))
+        else:
+            self.collapsed_requests += 1
+        return await asyncio.shield(in_flight)
+
+    async def _load(
+        self,
+        key: str,
+        synthesize: Callable[[], Awaitable[Optional[bytes]]],
+    ) -> Optional[bytes]:
+        audio_content = await self._read_from_disk(key)
+        if audio_content is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            audio_content = await synthesize()
+            if audio_content:
+                await self._write_to_disk(key, audio_content)
+
+        if audio_content:
+            self._put_in_memory(key, audio_content)
+        return audio_content
+
+    def _finish_load(self, key: str, task: asyncio.Task) -> None:
+        del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> dict:
+        """Returns the hit and miss counters of the cache"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "collapsed_requests": self.collapsed_requests,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "disk_entries": len(self._disk or ()),
+            "disk_bytes": self._disk_bytes,
+            "max_disk_bytes": self.max_disk_bytes,
+        }
+
+    def _get_from_memory(self, key: str) -> Optional[bytes]:
+        audio_content = self._memory.get(key)
+        if audio_content is not None:
+            self._memory.move_to_end(key)
+        return audio_content
+
+    def _put_in_memory(self, key: str, audio_content: bytes) -> None:
+        # Entries larger than the whole budget would only evict everything else
+        if len(audio_content) > self.max_memory_bytes:
+            return
+
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = audio_content
+        self._memory_bytes += len(audio_content)
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key: str) -> Path:
+        # Shard by prefix to keep directories small
+        return self.cache_dir / key[:2] / f"{key}.audio"
+
+    async def _get_disk_index(self) -> OrderedDict[str, int]:
+        if self._disk is None:
+            disk = await asyncio.to_thread(self._scan_disk)
+            # Another call may have finished the scan first and added to it since
+            if self._disk is None:
+                self._disk = disk
+                self._disk_bytes = sum(disk.values())
+        return self._disk
+
+    def _scan_disk(self) -> OrderedDict[str, int]:
+        entries = []
+        for path in self.cache_dir.glob("*/*.audio"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        # Reads touch the files, so the oldest modification is the least recent read
+        entries.sort()
+        return OrderedDict((key, size) for _, key, size in entries)
+
+    async def _read_from_disk(self, key: str) -> Optional[bytes]:
+        if self.cache_dir is None:
+            return None
+
+        disk = await self._get_disk_index()
+        if key not in disk:
+            return None
+
+        path = self._disk_path(key)
+
+        def read() -> bytes:
+            audio_content = path.read_bytes()
+            path.touch()
+            return audio_content
+
+        try:
+            audio_content = await asyncio.to_thread(read)
+        except OSError as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Error reading cached audio %s: %s", path, e)
+            self._forget_on_disk(key)
+            return None
+        if key in disk:
+            disk.move_to_end(key)
+        return audio_content
+
+    async def _write_to_disk(self, key: str, audio_content: bytes) -> None:
+        # Entries larger than the whole budget would only evict everything else
+        if self.cache_dir is None or len(audio_content) > self.max_disk_bytes:
+            return
+
+        disk = await self._get_disk_index()
+        self._forget_on_disk(key)
+        disk[key] = len(audio_content)
+        self._disk_bytes += len(audio_content)
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes:
+            evicted_key, size = disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(self._disk_path(evicted_key))
+
+        path = self._disk_path(key)
+
+        def write() -> None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file first so readers never see partial audio
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(audio_content)
+            os.replace(tmp_path, path)
+            for evicted_path in evicted:
+                evicted_path.unlink(missing_ok=True)
+
+        try:
+            await asyncio.to_thread(write)
+        except OSError as e:
+            logger.warning("Error writing cached audio %s: %s", path, e)
+            self._forget_on_disk(key)
+
+    def _forget_on_disk(self, key: str) -> None:
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+
+# Shared by every TextToSpeechService so that all callers hit the same cache
+default_audio_cache = AudioCacheService()
@@ -0,0 +1,241 @@
+import warnings
+from abc import ABC, abstractmethod
+from enum import Enum
+
+import numpy as np
+
+try:
+    with warnings.catch_warnings():
+        # audioop is deprecated and removed in Python 3.13, ADPCM is only offered
+        # where it is still available
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+# The Live API takes 16 kHz input and produces 24 kHz output, 16 bit mono
+MODEL_INPUT_RATE = 16000
+MODEL_OUTPUT_RATE = 24000
+
+SAMPLE_WIDTH = 2
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+
+class CodecName(str, Enum):
+    PCM16 = "pcm16"
+    MULAW = "mulaw"
+    ADPCM = "adpcm"
+
+
+class AudioCodec(ABC):
+    """Encodes 16 bit mono PCM for the wire and decodes it back"""
+
+    name: CodecName
+
+    @abstractmethod
+    def encode(self, pcm: bytes) -> bytes:
+        """Encodes 16 bit mono PCM for the wire"""
+
+    @abstractmethod
+    def decode(self, data: bytes) -> bytes:
+        """Decodes wire data back to 16 bit mono PCM"""
+
+
+class Pcm16Codec(AudioCodec):
+    """Sends the PCM as is"""
+
+    name = CodecName.PCM16
+
+    def encode(self, pcm: bytes) -> bytes:
+        return pcm
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+def _build_mulaw_tables() -> tuple[np.ndarray, np.ndarray]:
+    # Segment of a biased magnitude by its top bits, position of the highest set bit
+    exponents = np.array(
+        [max(value.bit_length() - 1, 0) for value in range(256)], dtype=np.int32
+    )
+
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    magnitudes = (((codes & 0x0F) << 3) + MULAW_BIAS) << ((codes >> 4) & 0x07)
+    magnitudes -= MULAW_BIAS
+    samples = np.where(codes & 0x80, -magnitudes, magnitudes).astype(np.int16)
+    return exponents, samples
+
+
+MULAW_EXPONENTS, MULAW_SAMPLES = _build_mulaw_tables()
+
+
+class MulawCodec(AudioCodec):
+    """G.711 μ-law, 8 bits per sample, half the size of PCM16"""
+
+    name = CodecName.MULAW
+
+    def encode(self, pcm: bytes) -> bytes:
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.int32)
+        sign = (samples < 0).astype(np.int32) << 7
+        # Like the G.711 reference, which works on 14 bit samples, negative
+        # magnitudes are rounded up to a multiple of 4
+        magnitudes = np.where(samples < 0, -(samples >> 2) << 2, samples)
+        magnitudes = np.minimum(magnitudes, MULAW_CLIP) + MULAW_BIAS
+        exponents = MULAW_EXPONENTS[magnitudes >> 7]
+        mantissas = (magnitudes >> (exponents + 3)) & 0x0F
+        codes = ~(sign | (exponents << 4) | mantissas) & 0xFF
+        return codes.astype(np.uint8).tobytes()
+
+    def decode(self, data: bytes) -> bytes:
+        codes = np.frombuffer(data, dtype=np.uint8)
+        return MULAW_SAMPLES[codes].astype("<i2").tobytes()
+
+
+class AdpcmCodec(AudioCodec):
+    """IMA ADPCM, 4 bits per sample, a quarter of the size of PCM16.
+
+    The codec is stateful, the decoder of the other side must see every chunk
+    this encoder produced in order, so encoding has to happen after any chunk
+    was dropped or flushed.
+    """
+
+    name = CodecName.ADPCM
+
+    def __init__(self):
+        if audioop is None:
+            raise ValueError("ADPCM is not available on this Python version")
+        self._encode_state = None
+        self._decode_state = None
+
+    def encode(self, pcm: bytes) -> bytes:
+        data, self._encode_state = audioop.lin2adpcm(
+            pcm, SAMPLE_WIDTH, self._encode_state
+        )
+        return data
+
+    def decode(self, data: bytes) -> bytes:
+        pcm, self._decode_state = audioop.adpcm2lin(
+            data, SAMPLE_WIDTH, self._decode_state
+        )
+        return pcm
+
+
+CODECS: dict[CodecName, type[AudioCodec]] = {
+    CodecName.PCM16: Pcm16Codec,
+    CodecName.MULAW: MulawCodec,
+}
+if audioop is not None:
+    CODECS[CodecName.ADPCM] = AdpcmCodec
+
+
+def available_codecs() -> list[str]:
+    return [codec_name.value for codec_name in CODECS]
+
+
+class Resampler:
+    """Resamples a stream of 16 bit mono PCM chunk by chunk, linearly interpolated
+
+    Downsampling first averages over the decimation factor, which keeps most of
+    the aliasing out of speech without a full filter design. The filter and the
+    interpolation carry their state from chunk to chunk, so the output is the
+    same however the stream is split and chunk boundaries do not click. A
+    trailing odd byte is kept until the next chunk completes its sample.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int):
+        """
+        Args:
+            from_rate: The sample rate of the audio
+            to_rate: The sample rate to resample to
+        """
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.step = from_rate / to_rate
+        window = int(np.ceil(self.step)) if to_rate < from_rate else 1
+        self._kernel = np.full(window, 1 / window)
+        # The input samples the filter of the next chunk still needs
+        self._filter_tail = np.zeros(window - 1)
+        # The last filtered sample, the left neighbour of the next output sample
+        self._last = np.zeros(0)
+        # Position of the next output sample, relative to the last sample
+        self._position = 0.0
+        self._odd_byte = b""
+
+    def process(self, pcm: bytes) -> bytes:
+        """Resamples the next chunk of the stream
+
+        Args:
+            pcm: The next chunk of audio, of any length
+
+        Returns:
+            The resampled audio of all complete samples received so far
+        """
+        pcm = self._odd_byte + pcm
+        complete = len(pcm) - len(pcm) % SAMPLE_WIDTH
+        pcm, self._odd_byte = pcm[:complete], pcm[complete:]
+        if self.from_rate == self.to_rate or not pcm:
+            return pcm
+
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float64)
+        if len(self._kernel) > 1:
+            padded = np.concatenate([self._filter_tail, samples])
+            self._filter_tail = padded[len(samples) :]
+            samples = np.convolve(padded, self._kernel, mode="valid")
+
+        buffer = np.concatenate([self._last, samples])
+        last_index = len(buffer) - 1
+        count = max(int(np.floor((last_index - self._position) / self.step)) + 1, 0)
+        positions = self._position + np.arange(count) * self.step
+        resampled = np.interp(positions, np.arange(len(buffer)), buffer)
+        self._position += count * self.step - last_index
+        self._last = buffer[-1:]
+        return np.clip(np.rint(resampled), -32768, 32767).astype("<i2").tobytes()
+
+
+class AudioTranscoder:
+    """Converts between the audio format of a client and the one of the model.
+
+    Each direction has its own codec and resampler instance, so their state is
+    kept separately for input and output.
+    """
+
+    def __init__(
+        self,
+        codec_name: CodecName = CodecName.PCM16,
+        input_rate: int = MODEL_INPUT_RATE,
+        output_rate: int = MODEL_OUTPUT_RATE,
+    ):
+        """
+        Args:
+            codec_name: The requested codec, PCM16 if it is not available
+            input_rate: The sample rate of the audio the client sends
+            output_rate: The sample rate the client plays audio at
+        """
+        codec_class = CODECS.get(codec_name, Pcm16Codec)
+        self.input_codec = codec_class()
+        self.output_codec = codec_class()
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.input_resampler = Resampler(input_rate, MODEL_INPUT_RATE)
+        self.output_resampler = Resampler(MODEL_OUTPUT_RATE, output_rate)
+
+    @property
+    def codec_name(self) -> CodecName:
+        return self.input_codec.name
+
+    def decode_input(self, data: bytes) -> bytes:
+        """Decodes client audio into PCM16 at the model input rate"""
+        return self.input_resampler.process(self.input_codec.decode(data))
+
+    def encode_output(self, pcm: bytes) -> bytes:
+        """Encodes PCM16 at the model output rate for the client"""
+        return self.output_codec.encode(self.output_resampler.process(pcm))
+
+    def describe(self) -> dict:
+        """The negotiated format, sent to the client when it connects"""
+        return {
+            "codec": self.codec_name.value,
+            "input_rate": self.input_rate,
+            "output_rate": self.output_rate,
+        }
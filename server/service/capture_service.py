@@ -0,0 +1,171 @@
+import base64
+import contextlib
+import contextvars
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import UploadFile
+
+from server.service.audio_codecs import MODEL_INPUT_RATE, MulawCodec
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FORMAT_VERSION = 1
+
+# The request or websocket the records of the current task belong to
+_capture_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "capture_id", default=None
+)
+
+
+def encode_bytes(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_bytes(data: str) -> bytes:
+    return base64.b64decode(data)
+
+
+class CaptureRecorder:
+    """Records real sessions so they can be replayed offline.
+
+    With CAPTURE_DIR set, every /agent/request and live websocket session is
+    written to a gzip compressed JSON lines file in that directory: the request
+    with its audio and image, the transcript, the final events of the runner,
+    the synthesized speech and the frames of the websocket. Records are put on
+    a queue and written by a separate thread, so the request path never waits
+    for the disk. Microphone audio is stored as μ-law, the synthesized audio
+    only by its size unless CAPTURE_TTS_AUDIO is true.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.include_tts_audio = False
+        self.path: Optional[str] = None
+        self._queue: queue.SimpleQueue[Optional[dict]] = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._start = time.monotonic()
+        self._mulaw = MulawCodec()
+
+    def start(self, capture_dir: str | None = None) -> None:
+        """Opens a new capture file if CAPTURE_DIR or capture_dir is set
+
+        Args:
+            capture_dir: The directory of the capture files, CAPTURE_DIR by default
+        """
+        capture_dir = capture_dir or os.getenv("CAPTURE_DIR")
+        if not capture_dir or self.enabled:
+            return
+        os.makedirs(capture_dir, exist_ok=True)
+        started = datetime.now(timezone.utc)
+        self.path = os.path.join(
+            capture_dir,
+            f"capture-{started:%Y%m%d-%H%M%S}-{os.getpid()}.jsonl.gz",
+        )
+        self.include_tts_audio = os.getenv("CAPTURE_TTS_AUDIO", "false") == "true"
+        self._start = time.monotonic()
+        self._queue.put(
+            {
+                "kind": "capture",
+                "version": CAPTURE_FORMAT_VERSION,
+                "started": started.isoformat(),
+                "t": 0.0,
+            }
+        )
+        self._writer = threading.Thread(
+            target=self._write, name="capture-writer", daemon=True
+        )
+        self._writer.start()
+        self.enabled = True
+        logger.info("Capturing sessions to %s", self.path)
+
+    def stop(self) -> None:
+        """Writes the queued records and closes the capture file"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._queue.put(None)
+        self._writer.join()
+        logger.info("Capture written to %s", self.path)
+
+    @contextlib.contextmanager
+    def capture(self, capture_id: str | None = None):
+        """Assigns the records made within the block to a new request or session
+
+        Tasks created within the block inherit the id.
+        """
+        token = _capture_id.set(capture_id or uuid.uuid4().hex[:12])
+        try:
+            yield
+        finally:
+            _capture_id.reset(token)
+
+    def record(self, kind: str, **fields) -> None:
+        """Records an event of the current request or session
+
+        Does nothing when capturing is off or outside of a capture block.
+        """
+        if not self.enabled:
+            return
+        capture_id = _capture_id.get()
+        if capture_id is None:
+            return
+        fields["kind"] = kind
+        fields["id"] = capture_id
+        fields["t"] = round(time.monotonic() - self._start, 4)
+        self._queue.put(fields)
+
+    def encode_microphone_audio(self, pcm: bytes) -> dict:
+        """Compacts model input PCM to μ-law for a record"""
+        return {
+            "codec": self._mulaw.name.value,
+            "rate": MODEL_INPUT_RATE,
+            "data": encode_bytes(self._mulaw.encode(pcm)),
+        }
+
+    async def encode_upload(self, upload: Optional[UploadFile]) -> Optional[dict]:
+        """Reads an upload for a record and rewinds it for its actual consumer"""
+        if not self.enabled or upload is None:
+            return None
+        data = await upload.read()
+        await upload.seek(0)
+        return {"content_type": upload.content_type, "data": encode_bytes(data)}
+
+    def _write(self) -> None:
+        with gzip.open(self.path, "wt", encoding="utf-8") as capture_file:
+            while (record := self._queue.get()) is not None:
+                try:
+                    capture_file.write(
+                        json.dumps(record, separators=(",", ":"), default=str) + "\n"
+                    )
+                except (TypeError, ValueError) as e:
+                    logger.error("Could not capture a %s record: %s", record["kind"], e)
+
+
+def read_capture(path: str) -> list[dict]:
+    """Reads the records of a capture file
+
+    Raises:
+        ValueError: If the file is not a capture of a supported version
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as capture_file:
+        records = [json.loads(line) for line in capture_file if line.strip()]
+    if not records or records[0].get("kind") != "capture":
+        raise ValueError(f"{path} is not a capture file")
+    if records[0]["version"] != CAPTURE_FORMAT_VERSION:
+        raise ValueError(
+            f"{path} has capture format version {records[0]['version']}, "
+            f"expected {CAPTURE_FORMAT_VERSION}"
+        )
+    return records[1:]
+
+
+capture_recorder = CaptureRecorder()
@@ -0,0 +1,122 @@
+import base64
+import json
+from enum import Enum
+from typing import Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+
+from server.service.audio_codecs import AudioTranscoder
+
+AUDIO_MIME_TYPE = "audio/pcm"
+TEXT_MIME_TYPE = "text/plain"
+
+
+class FrameMode(str, Enum):
+    """How audio travels over the websocket, negotiated with the protocol query
+    parameter when connecting"""
+
+    # Every message is a JSON text frame, audio is base64 encoded
+    JSON = "json"
+    # Audio is sent as raw bytes in binary frames, everything else as JSON text
+    BINARY = "binary"
+
+
+class ClientMessage(BaseModel):
+    """A message received from the client, data is model input PCM for audio"""
+
+    mime_type: str
+    data: str | bytes
+
+
+def dumps(message: dict) -> str:
+    """Serializes a control message as compact JSON"""
+    return json.dumps(message, separators=(",", ":"))
+
+
+class FrameProtocol:
+    """Encodes and decodes the frames of the live agent websocket.
+
+    JSON mode is the original protocol. Binary mode skips the base64 and JSON
+    round trip for audio, which is about a third less bandwidth and no encoding
+    work on the hottest path. Audio is converted with the negotiated codec and
+    sample rates in both directions.
+    """
+
+    def __init__(
+        self,
+        mode: FrameMode = FrameMode.JSON,
+        transcoder: AudioTranscoder | None = None,
+    ):
+        """
+        Args:
+            mode: The negotiated frame mode
+            transcoder: The negotiated codec and sample rates, PCM16 by default
+        """
+        self.mode = mode
+        self.transcoder = transcoder or AudioTranscoder()
+
+    async def send_audio(self, websocket: WebSocket, audio_data: bytes) -> int:
+        """Encodes and sends a chunk of model audio
+
+        Encoding happens here, when the chunk is actually sent, so stateful
+        codecs stay in sync with the client even when queued audio is dropped.
+
+        Returns:
+            The number of bytes put on the wire
+        """
+        audio_data = self.transcoder.encode_output(audio_data)
+        if self.mode == FrameMode.BINARY:
+            await websocket.send_bytes(audio_data)
+            return len(audio_data)
+
+        frame = dumps(
+            {
+                "mime_type": AUDIO_MIME_TYPE,
+                "data": base64.b64encode(audio_data).decode("ascii"),
+            }
+        )
+        await websocket.send_text(frame)
+        return len(frame)
+
+    async def send_message(self, websocket: WebSocket, message: dict) -> int:
+        """Sends a control or text message as a JSON text frame
+
+        Returns:
+            The number of bytes put on the wire
+        """
+        frame = dumps(message)
+        await websocket.send_text(frame)
+        return len(frame)
+
+    async def receive(self, websocket: WebSocket) -> ClientMessage:
+        """Waits for the next message of the client
+
+        Raises:
+            WebSocketDisconnect: If the client disconnected
+            json.JSONDecodeError: If a text frame is not valid JSON
+            ValueError: If the message is malformed
+        """
+        frame = await websocket.receive()
+        if frame["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(frame.get("code", 1000))
+
+        audio_data: Optional[bytes] = frame.get("bytes")
+        if audio_data is not None:
+            if self.mode != FrameMode.BINARY:
+                raise ValueError("Binary frames require the binary protocol")
+            return ClientMessage(
+                mime_type=AUDIO_MIME_TYPE,
+                data=self.transcoder.decode_input(audio_data),
+            )
+
+        message = json.loads(frame.get("text") or "")
+        try:
+            mime_type = message["mime_type"]
+            data = message["data"]
+        except (KeyError, TypeError):
+            raise ValueError("Messages need a mime_type and data")
+        if mime_type == AUDIO_MIME_TYPE:
+            # JSON clients and binary clients falling back to text frames
+            data = self.transcoder.decode_input(base64.b64decode(data))
+        return ClientMessage(mime_type=mime_type, data=data)
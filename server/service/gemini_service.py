@@ -1,3 +1,4 @@
+import logging
 import os
 
 import yaml
@@ -5,8 +6,12 @@ from google import genai
 from google.genai import types
 
 from server.models.message import Message, SummarizeFeedbackResponse
+from server.service.async_backend import get_backend
+from server.service.opening_turn_service import OpeningTurnService
 from server.service.scenario_service import ScenarioService
 
+logger = logging.getLogger(__name__)
+
 
 # TODO: move to ORM layer with DB call
 def load_feedback_prompt() -> str:
@@ -15,7 +20,11 @@ def load_feedback_prompt() -> str:
 
 
 class GeminiService:
-    def __init__(self, scenario_service: ScenarioService):
+    def __init__(
+        self,
+        scenario_service: ScenarioService,
+        opening_turn_service: OpeningTurnService | None = None,
+    ):
         # TODO: make this a persistent database
         self.temp_client_messages: dict[str, list[Message]] = {}
         self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
@@ -26,11 +35,18 @@ class GeminiService:
         self.chat = self.client.chats.create(model=self.model_name)
 
         self.scenario_service = scenario_service
-        self.populate_initial_data()
+        self.opening_turn_service = opening_turn_service or OpeningTurnService(
+            scenario_service
+        )
+        self.backend = get_backend("gemini")
         self.feedback_prompt = load_feedback_prompt()
 
-    def populate_initial_data(self, user_id: int = 1) -> None:
-        """Runs the initial prompt through the Gemini client and also stores the response
+    async def populate_initial_data(self, user_id: int = 1) -> None:
+        """Starts the messages of a user with the opening turn of the scenario
+
+        The opening turn comes from the opening turn service, which generates
+        and stores it with its own model when the scenario has none stored yet.
+        Users whose messages are already started are left as they are.
 
         Args:
             user_id: The user id to populate the initial data for
@@ -39,37 +55,32 @@ class GeminiService:
             None
         """
         # TODO: setup logging and log this
-        if user_id not in self.temp_client_messages:
-            self.temp_client_messages[user_id] = []
+        if user_id in self.temp_client_messages:
+            return
 
         scenario_data = self.scenario_service.get_current_scenario()
 
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=[types.Part.from_text(text=scenario_data.initial_prompt)],
-            config=types.GenerateContentConfig(
-                response_mime_type="text/plain",
-                system_instruction=[
-                    types.Part.from_text(text=scenario_data.system_instructions)
-                ],
-            ),
+        opening_turn = await self.opening_turn_service.get_opening_turn(
+            scenario_data.id
         )
-        self.temp_client_messages[user_id].append(
-            Message(message=response.text, role="system")
+        # A concurrent request may have started the messages while this one waited
+        self.temp_client_messages.setdefault(
+            user_id, [Message(message=opening_turn.text, role="system")]
         )
 
-    def fetch_user_messages(self, user_id: int) -> list[Message]:
+    async def fetch_user_messages(self, user_id: int) -> list[Message]:
         """Fetches the messages for a user from the client messages
 
         Args:
             user_id: The user id to fetch the messages for
 
         Returns:
-            The messages for the user
+            The messages for the user, starting with the opening turn
         """
-        return self.temp_client_messages.get(user_id, [])
+        await self.populate_initial_data(user_id)
+        return self.temp_client_messages[user_id]
 
-    def get_gemini_message(self, message: str, user_id: str):
+    async def get_gemini_message(self, message: str, user_id: str):
         """
         Sends a prompt to Gemini and returns the response
 
@@ -81,37 +92,42 @@ class GeminiService:
             The message from Gemini
         """
 
+        await self.populate_initial_data(user_id)
         self.temp_client_messages[user_id].append(Message(message=message, role="user"))
         scenario_data = self.scenario_service.get_current_scenario()
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=[types.Part.from_text(text=message)],
-            config=types.GenerateContentConfig(
-                response_mime_type="text/plain",
-                system_instruction=[
-                    types.Part.from_text(text=scenario_data.system_instructions)
-                ],
-            ),
+        response = await self.backend.run_async(
+            lambda: self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=[types.Part.from_text(text=message)],
+                config=types.GenerateContentConfig(
+                    response_mime_type="text/plain",
+                    system_instruction=[
+                        types.Part.from_text(text=scenario_data.system_instructions)
+                    ],
+                ),
+            )
         )
         self.temp_client_messages[user_id].append(
             Message(message=response.text, role="system")
         )
         return response.text
 
-    def provide_user_feedback(self, user_id: str) -> SummarizeFeedbackResponse:
+    async def provide_user_feedback(self, user_id: str) -> SummarizeFeedbackResponse:
         """
         Provides feedback to the user based on the conversation
         """
-        print(self.temp_client_messages[1])
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=[
-                # types.Part.from_text(text=self.temp_client_messages[1]),
-                types.Part.from_text(text=self.feedback_prompt),
-            ],
-            config=types.GenerateContentConfig(
-                response_mime_type="text/plain",
-            ),
+        logger.debug("Initial prompt: %s", self.temp_client_messages[1])
+        response = await self.backend.run_async(
+            lambda: self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=[
+                    # types.Part.from_text(text=self.temp_client_messages[1]),
+                    types.Part.from_text(text=self.feedback_prompt),
+                ],
+                config=types.GenerateContentConfig(
+                    response_mime_type="text/plain",
+                ),
+            )
         )
 
         return SummarizeFeedbackResponse(feedback=response.text)
@@ -0,0 +1,198 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+from google.adk.models import LlmRequest
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+from sqlmodel import Session, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from server.dependencies.database import async_engine, database_writer
+from server.models.agent_model import OpeningTurn, Scenario, ScenarioOpeningTurn
+from server.service.scenario_service import ScenarioService
+from server.service.text_to_speech_service import TextToSpeechService
+from server.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPENING_TURN_MODEL = "gemini-2.5-flash"
+
+
+def get_scenario_version(scenario: Scenario, model: str) -> str:
+    """Hashes what the opening turn of a scenario is generated from"""
+    source = json.dumps(
+        [scenario.initial_prompt, scenario.system_instructions, model]
+    ).encode("utf-8")
+    return hashlib.sha256(source).hexdigest()
+
+
+class OpeningTurnService:
+    """Generates the opening turn of a scenario once and serves it from the db.
+
+    The opening turn is the answer of the model to the initial prompt of the
+    scenario under its system instructions, together with its synthesized
+    audio. It only depends on the scenario, so it is generated once per version
+    of the scenario and stored. Stored turns of an older version are ignored
+    and replaced, editing a scenario through the admin routes drops them.
+    """
+
+    def __init__(
+        self,
+        scenario_service: ScenarioService,
+        text_to_speech_service: TextToSpeechService | None = None,
+        model: str | None = None,
+    ):
+        """
+        Args:
+            scenario_service: The service the scenarios are read from
+            text_to_speech_service: Synthesizes the audio of the turns, created
+                on first use by default
+            model: The model generating the turns, OPENING_TURN_MODEL by default
+        """
+        self.scenario_service = scenario_service
+        self._text_to_speech_service = text_to_speech_service
+        self.model = model or os.getenv(
+            "OPENING_TURN_MODEL", DEFAULT_OPENING_TURN_MODEL
+        )
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    @property
+    def text_to_speech_service(self) -> TextToSpeechService:
+        if self._text_to_speech_service is None:
+            self._text_to_speech_service = TextToSpeechService()
+        return self._text_to_speech_service
+
+    async def get_opening_turn(self, scenario_id: int) -> OpeningTurn:
+        """Returns the opening turn of a scenario, generating it if not stored
+
+        Concurrent requests for the same scenario wait for a single generation.
+
+        Args:
+            scenario_id: The id of the scenario
+
+        Raises:
+            ValueError: If the scenario does not exist
+        """
+        scenario = await self.scenario_service.get_scenario(scenario_id)
+        stored = await self.get_stored(scenario)
+        if stored is not None and stored.audio is not None:
+            return self._to_opening_turn(stored)
+
+        lock = self._locks.setdefault(scenario_id, asyncio.Lock())
+        async with lock:
+            stored = await self.get_stored(scenario)
+            if stored is None:
+                text = await self._generate(scenario)
+                stored = await self.store(scenario, text)
+            if stored.audio is None:
+                audio = await self.text_to_speech_service.text_to_speech(stored.text)
+                if audio:
+                    stored = await self.store(scenario, stored.text, audio)
+        return self._to_opening_turn(stored)
+
+    async def get_stored(self, scenario: Scenario) -> Optional[ScenarioOpeningTurn]:
+        """Returns the stored opening turn of the current version of a scenario"""
+        async with AsyncSession(async_engine) as session:
+            return (
+                await session.exec(
+                    select(ScenarioOpeningTurn).where(
+                        ScenarioOpeningTurn.scenario_id == scenario.id,
+                        ScenarioOpeningTurn.scenario_version
+                        == get_scenario_version(scenario, self.model),
+                    )
+                )
+            ).first()
+
+    async def store(
+        self, scenario: Scenario, text: str, audio: bytes | None = None
+    ) -> ScenarioOpeningTurn:
+        """Stores the opening turn of a scenario, replacing the stored ones
+
+        Args:
+            scenario: The scenario the turn was generated for
+            text: The text of the turn
+            audio: The synthesized audio of the text
+        """
+        opening_turn = ScenarioOpeningTurn(
+            scenario_id=scenario.id,
+            scenario_version=get_scenario_version(scenario, self.model),
+            text=text,
+            audio=audio,
+        )
+
+        def write(session: Session) -> ScenarioOpeningTurn:
+            session.exec(
+                delete(ScenarioOpeningTurn).where(
+                    ScenarioOpeningTurn.scenario_id == scenario.id
+                )
+            )
+            session.add(opening_turn)
+            session.flush()
+            return opening_turn
+
+        return await database_writer.write(write)
+
+    async def invalidate(self, scenario_id: int) -> None:
+        """Drops the stored opening turns of a scenario after it was edited
+
+        Args:
+            scenario_id: The id of the scenario
+        """
+        await database_writer.write(
+            lambda session: session.exec(
+                delete(ScenarioOpeningTurn).where(
+                    ScenarioOpeningTurn.scenario_id == scenario_id
+                )
+            )
+        )
+
+    async def warm(self, scenario_id: int) -> None:
+        """Generates the opening turn ahead of the first session, logs failures"""
+        try:
+            await self.get_opening_turn(scenario_id)
+        except Exception as e:
+            logger.warning(
+                "Could not generate the opening turn of scenario %s: %s",
+                scenario_id,
+                e,
+            )
+
+    async def _generate(self, scenario: Scenario) -> str:
+        logger.info("Generating the opening turn of scenario %s", scenario.id)
+        llm = LLMRegistry.new_llm(self.model)
+        llm_request = LlmRequest(
+            model=self.model,
+            contents=[
+                types.UserContent(
+                    parts=[types.Part.from_text(text=scenario.initial_prompt)]
+                )
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="text/plain",
+                system_instruction=scenario.system_instructions,
+            ),
+        )
+        text = ""
+        with tracer.start_as_current_span(
+            "opening_turn.generate", attributes={"scenario.id": scenario.id}
+        ):
+            async for response in llm.generate_content_async(llm_request):
+                if response.content and response.content.parts and not response.partial:
+                    text += "".join(part.text or "" for part in response.content.parts)
+        return text
+
+    @staticmethod
+    def _to_opening_turn(stored: ScenarioOpeningTurn) -> OpeningTurn:
+        return OpeningTurn(
+            scenario_id=stored.scenario_id,
+            scenario_version=stored.scenario_version,
+            text=stored.text,
+            audio=base64.b64encode(stored.audio).decode("utf-8")
+            if stored.audio
+            else None,
+        )
@@ -0,0 +1,69 @@
+import logging
+
+from google.adk.agents import BaseAgent
+from google.adk.artifacts import BaseArtifactService, InMemoryArtifactService
+from google.adk.runners import Runner
+
+from server.service.session_service import SessionService
+
+logger = logging.getLogger(__name__)
+
+
+class RunnerPool:
+    """Process wide pool of ADK Runners keyed by root agent name and scenario.
+
+    Runners hold no per request state, user and session are passed on every
+    run_async call, so a single Runner per root agent can serve all requests. All
+    Runners share the same session and artifact services.
+    """
+
+    def __init__(
+        self,
+        app_name: str,
+        session_service: SessionService,
+        artifact_service: BaseArtifactService | None = None,
+    ):
+        """
+        Args:
+            app_name: The ADK app name the Runners are created with
+            session_service: The shared session service
+            artifact_service: The shared artifact service, in memory by default
+        """
+        self.app_name = app_name
+        self.session_service = session_service
+        self.artifact_service = artifact_service or InMemoryArtifactService()
+        self._runners: dict[tuple[str, int | None], Runner] = {}
+
+    def get_runner(self, root_agent: BaseAgent, scenario_id: int | None) -> Runner:
+        """Returns the pooled Runner for the root agent, creating it on first use
+
+        A new Runner is created when the agents were reloaded since the pooled
+        Runner was built, so admin changes are picked up on the next request.
+
+        Args:
+            root_agent: The root agent of the Runner
+            scenario_id: The scenario the root agent belongs to
+
+        Returns:
+            The Runner
+        """
+        key = (root_agent.name, scenario_id)
+        runner = self._runners.get(key)
+        if runner is None or runner.agent is not root_agent:
+            logger.info(
+                "Creating runner for agent %s in scenario %s",
+                root_agent.name,
+                scenario_id,
+            )
+            runner = Runner(
+                app_name=self.app_name,
+                agent=root_agent,
+                session_service=self.session_service.get_session_service(),
+                artifact_service=self.artifact_service,
+            )
+            self._runners[key] = runner
+        return runner
+
+    def clear(self) -> None:
+        """Drops all pooled Runners"""
+        self._runners.clear()
@@ -1,12 +1,14 @@
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from server.dependencies.database import engine
+from server.dependencies.database import async_engine
 from server.models.agent_model import Scenario
 
 
 class ScenarioService:
     def __init__(self, default_scenario_id: int = 1):
         self.scenario = None
+        self._scenarios: dict[int, Scenario] = {}
 
     def get_current_scenario(self) -> Scenario:
         """
@@ -17,20 +19,52 @@ class ScenarioService:
         """
         return self.scenario
 
-    def set_scenario(self, scenario_id: int) -> None:
+    async def set_scenario(self, scenario_id: int) -> None:
         """
         Sets the scenario data for the currently set scenario
 
         Args:
-            scenario: The scenario to set
+            scenario_id: The id of the scenario to set
+
+        Raises:
+            ValueError: If the scenario does not exist
+        """
+        self.scenario = await self.get_scenario(scenario_id)
+
+    async def get_scenario(self, scenario_id: int) -> Scenario:
+        """
+        Returns the scenario data of a scenario, cached after the first lookup
+
+        Args:
+            scenario_id: The id of the scenario
+
+        Raises:
+            ValueError: If the scenario does not exist
+        """
+        if scenario_id not in self._scenarios:
+            async with AsyncSession(async_engine) as session:
+                scenario = await session.get(Scenario, scenario_id)
+            if scenario is None:
+                raise ValueError(f"Scenario {scenario_id} not found")
+            self._scenarios[scenario_id] = scenario
+        return self._scenarios[scenario_id]
+
+    async def invalidate_scenario(self, scenario_id: int) -> None:
+        """
+        Drops the cached data of a scenario after it was edited
+
+        Args:
+            scenario_id: The id of the scenario
         """
-        with Session(engine) as session:
-            statement = select(Scenario).where(Scenario.id == scenario_id)
-            scenario = session.exec(statement).one()
-            self.scenario = scenario
+        self._scenarios.pop(scenario_id, None)
+        if self.scenario is not None and self.scenario.id == scenario_id:
+            try:
+                await self.set_scenario(scenario_id)
+            except ValueError:
+                self.scenario = None
 
-    def get_all_scenarios(self) -> list[Scenario]:
-        with Session(engine) as session:
+    async def get_all_scenarios(self) -> list[Scenario]:
+        async with AsyncSession(async_engine) as session:
             statement = select(Scenario)
-            scenarios = session.exec(statement).all()
+            scenarios = (await session.exec(statement)).all()
             return scenarios
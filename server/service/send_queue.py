@@ -0,0 +1,233 @@
+import asyncio
+import os
+import time
+from collections import deque
+from enum import Enum
+from typing import Optional
+
+from fastapi import WebSocket
+from pydantic import BaseModel
+
+from server.metrics import STREAMING_BYTES_SENT
+from server.service.frame_protocol import FrameProtocol
+
+DEFAULT_MAX_ITEMS = 64
+# Two seconds of 24 kHz 16 bit mono audio
+DEFAULT_MAX_COALESCED_BYTES = 96_000
+DEFAULT_DRAIN_SECONDS = 2.0
+
+
+class OverflowPolicy(str, Enum):
+    """What happens to audio when the send queue of a slow client is full"""
+
+    # Merge the new chunk into the last queued one, nothing is lost until a
+    # merged chunk reaches its size limit
+    COALESCE = "coalesce"
+    # Drop the oldest queued chunk
+    DROP = "drop"
+
+
+class OutboundFrame(BaseModel):
+    audio: Optional[bytes] = None
+    message: Optional[dict] = None
+    enqueued_at: float
+
+
+class SendQueueStats(BaseModel):
+    connection_id: str
+    depth: int
+    max_depth: int
+    enqueued: int
+    sent: int
+    coalesced: int
+    dropped: int
+    flushed: int
+    bytes_sent: int
+    avg_send_latency_ms: float
+    max_send_latency_ms: float
+
+
+class SendQueue:
+    """Bounded per connection queue between the live events and the websocket.
+
+    Live events are consumed as fast as the model produces them while a single
+    sender task writes to the websocket at the pace of the client. Audio is
+    bounded by the overflow policy, control and text messages are never
+    dropped. Send latency is measured from enqueue to the end of the send.
+    """
+
+    def __init__(
+        self,
+        connection_id: str,
+        frame_protocol: FrameProtocol,
+        max_items: int | None = None,
+        policy: OverflowPolicy | None = None,
+        max_coalesced_bytes: int | None = None,
+        drain_seconds: float | None = None,
+    ):
+        """
+        Args:
+            connection_id: Identifies the connection in the metrics
+            frame_protocol: Encodes the frames for the websocket
+            max_items: The maximum number of queued audio chunks
+            policy: What to do with audio when the queue is full
+            max_coalesced_bytes: The maximum size of a coalesced audio chunk
+            drain_seconds: How long the sender may take for the queued frames
+                once the queue is closed
+        """
+        self.connection_id = connection_id
+        self.frame_protocol = frame_protocol
+        self.max_items = max_items or int(
+            os.getenv("WS_SEND_QUEUE_MAX_ITEMS", DEFAULT_MAX_ITEMS)
+        )
+        self.policy = policy or OverflowPolicy(
+            os.getenv("WS_SEND_QUEUE_POLICY", OverflowPolicy.COALESCE.value)
+        )
+        self.max_coalesced_bytes = max_coalesced_bytes or int(
+            os.getenv("WS_SEND_QUEUE_MAX_COALESCED_BYTES", DEFAULT_MAX_COALESCED_BYTES)
+        )
+        self.drain_seconds = (
+            drain_seconds
+            if drain_seconds is not None
+            else float(os.getenv("WS_SEND_QUEUE_DRAIN_SECONDS", DEFAULT_DRAIN_SECONDS))
+        )
+        self._frames: deque[OutboundFrame] = deque()
+        self._audio_count = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+
+        self.max_depth = 0
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.bytes_sent = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def put_audio(self, audio: bytes) -> None:
+        """Queues a chunk of audio, applying the overflow policy when full"""
+        self.enqueued += 1
+        if self._audio_count >= self.max_items:
+            if self.policy == OverflowPolicy.COALESCE and self._coalesce(audio):
+                return
+            self._drop_oldest_audio()
+        self._append(OutboundFrame(audio=audio, enqueued_at=time.perf_counter()))
+        self._audio_count += 1
+
+    def put_message(self, message: dict) -> None:
+        """Queues a control or text message, these are never dropped"""
+        self.enqueued += 1
+        self._append(OutboundFrame(message=message, enqueued_at=time.perf_counter()))
+
+    def flush_audio(self) -> int:
+        """Discards all queued audio, used when the user barges in
+
+        Returns:
+            The number of discarded chunks
+        """
+        if not self._audio_count:
+            return 0
+        flushed = self._audio_count
+        self._frames = deque(frame for frame in self._frames if frame.audio is None)
+        self._audio_count = 0
+        self.flushed += flushed
+        return flushed
+
+    def close(self) -> None:
+        """Lets the sender finish the queued frames and stop"""
+        self._closed = True
+        self._ready.set()
+
+    async def run(self, websocket: WebSocket) -> None:
+        """Sends queued frames until the queue is closed and drained
+
+        Raises:
+            WebSocketDisconnect: If the client disconnected
+        """
+        while True:
+            if not self._frames:
+                if self._closed:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            frame = self._frames.popleft()
+            if frame.audio is not None:
+                self._audio_count -= 1
+                size = await self.frame_protocol.send_audio(websocket, frame.audio)
+                STREAMING_BYTES_SENT.labels(kind="audio").inc(size)
+            else:
+                size = await self.frame_protocol.send_message(websocket, frame.message)
+                STREAMING_BYTES_SENT.labels(kind="message").inc(size)
+            self.bytes_sent += size
+            self._record_sent(frame)
+
+    def get_stats(self) -> SendQueueStats:
+        return SendQueueStats(
+            connection_id=self.connection_id,
+            depth=len(self._frames),
+            max_depth=self.max_depth,
+            enqueued=self.enqueued,
+            sent=self.sent,
+            coalesced=self.coalesced,
+            dropped=self.dropped,
+            flushed=self.flushed,
+            bytes_sent=self.bytes_sent,
+            avg_send_latency_ms=(
+                self._total_latency / self.sent * 1000 if self.sent else 0.0
+            ),
+            max_send_latency_ms=self._max_latency * 1000,
+        )
+
+    def _append(self, frame: OutboundFrame) -> None:
+        self._frames.append(frame)
+        self.max_depth = max(self.max_depth, len(self._frames))
+        self._ready.set()
+
+    def _coalesce(self, audio: bytes) -> bool:
+        """Merges the audio into the last queued chunk if it has room left"""
+        last = self._frames[-1] if self._frames else None
+        if last is None or last.audio is None:
+            return False
+        if len(last.audio) + len(audio) > self.max_coalesced_bytes:
+            return False
+        last.audio += audio
+        self.coalesced += 1
+        return True
+
+    def _drop_oldest_audio(self) -> None:
+        for frame in self._frames:
+            if frame.audio is not None:
+                self._frames.remove(frame)
+                self._audio_count -= 1
+                self.dropped += 1
+                return
+
+    def _record_sent(self, frame: OutboundFrame) -> None:
+        latency = time.perf_counter() - frame.enqueued_at
+        self.sent += 1
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
+
+
+class SendQueueRegistry:
+    """Keeps the send queues of the open websockets for the stats endpoint"""
+
+    def __init__(self):
+        self._queues: dict[str, SendQueue] = {}
+
+    def add(self, send_queue: SendQueue) -> None:
+        self._queues[send_queue.connection_id] = send_queue
+
+    def remove(self, send_queue: SendQueue) -> None:
+        if self._queues.get(send_queue.connection_id) is send_queue:
+            del self._queues[send_queue.connection_id]
+
+    def get_stats(self) -> list[SendQueueStats]:
+        return [send_queue.get_stats() for send_queue in self._queues.values()]
+
+
+send_queue_registry = SendQueueRegistry()
@@ -1,28 +1,182 @@
 import base64
+import logging
 import os
+from datetime import datetime
+from functools import partial
+from typing import Callable, Optional
+from urllib.parse import urlencode
 
-from google.adk.sessions import Session
-from google.adk.sessions.database_session_service import DatabaseSessionService
+import google.adk
+from google.adk.events import Event, EventActions
+from google.adk.sessions import BaseSessionService, Session, State
+from google.adk.sessions.database_session_service import (
+    Base,
+    DatabaseSessionService,
+    StorageAppState,
+    StorageEvent,
+    StorageSession,
+    StorageUserState,
+)
+from sqlalchemy import Engine, MetaData, inspect
+from sqlalchemy.orm import Session as DatabaseSession
+from sqlalchemy.orm import sessionmaker
 
-from server.models.agent_interface import Conversation, ConversationTurn
+from server.dependencies.database import (
+    DatabaseWriter,
+    database_writer,
+    engine,
+    session_pool_metrics,
+)
+from server.metrics import SESSION_LOAD_DURATION
+from server.models.agent_interface import (
+    Conversation,
+    ConversationPage,
+    ConversationTurn,
+)
+from server.service.speech_pipeline import SpeechPipeline
 from server.service.text_to_speech_service import TextToSpeechService
 
+logger = logging.getLogger(__name__)
+
+SCENARIO_STATE_KEY = "scenario_id"
+# StorageSessionService and store_event mirror the DatabaseSessionService of this
+# ADK release, which is pinned. Check them against a new release before bumping.
+ADK_STORAGE_VERSION = "1.5.0"
+
+
+def split_state_delta(state_delta: dict) -> tuple[dict, dict, dict]:
+    """Splits a state delta into the app, user and session state changes
+
+    Temporary keys are dropped, they are never stored.
+    """
+    app_state_delta, user_state_delta, session_state_delta = {}, {}, {}
+    for key, value in state_delta.items():
+        if key.startswith(State.APP_PREFIX):
+            app_state_delta[key.removeprefix(State.APP_PREFIX)] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state_delta[key.removeprefix(State.USER_PREFIX)] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state_delta[key] = value
+    return app_state_delta, user_state_delta, session_state_delta
+
+
+def store_event(session: Session, event: Event, db_session: DatabaseSession) -> float:
+    """Stores an event and the state it changes, like ADK's append_event
+
+    Args:
+        session: The session the event belongs to
+        event: The event to store
+        db_session: The session of the database writer
+
+    Returns:
+        The update time of the stored session
+
+    Raises:
+        ValueError: If the session was updated since it was loaded
+    """
+    storage_session = db_session.get(
+        StorageSession, (session.app_name, session.user_id, session.id)
+    )
+    if storage_session.update_time.timestamp() > session.last_update_time:
+        raise ValueError(
+            "The last_update_time provided in the session object "
+            f"{datetime.fromtimestamp(session.last_update_time)} is earlier than "
+            f"the update_time in the storage_session {storage_session.update_time}."
+            " Please check if it is a stale session."
+        )
+
+    storage_app_state = db_session.get(StorageAppState, (session.app_name))
+    storage_user_state = db_session.get(
+        StorageUserState, (session.app_name, session.user_id)
+    )
+    app_state_delta, user_state_delta, session_state_delta = {}, {}, {}
+    if event.actions and event.actions.state_delta:
+        app_state_delta, user_state_delta, session_state_delta = split_state_delta(
+            event.actions.state_delta
+        )
+    if app_state_delta:
+        storage_app_state.state = {**storage_app_state.state, **app_state_delta}
+    if user_state_delta:
+        storage_user_state.state = {**storage_user_state.state, **user_state_delta}
+    if session_state_delta:
+        storage_session.state = {**storage_session.state, **session_state_delta}
+
+    db_session.add(StorageEvent.from_event(session, event))
+    db_session.flush()
+    # The update time is set by the database when the session row changed
+    db_session.refresh(storage_session)
+    return storage_session.update_time.timestamp()
+
+
+class StorageSessionService(DatabaseSessionService):
+    """The ADK database session service on the engine of the app.
+
+    The events of the sessions are appended through the database writer, so
+    the events of concurrent turns are committed together and off the event
+    loop. Creating, loading and deleting sessions is left to ADK.
+    """
+
+    def __init__(
+        self, db_engine: Engine = engine, writer: DatabaseWriter = database_writer
+    ):
+        """
+        Args:
+            db_engine: The engine of the database, shared with the app models
+            writer: The writer the events are appended through
+
+        Raises:
+            RuntimeError: If the installed ADK is not the release this mirrors
+        """
+        if google.adk.__version__ != ADK_STORAGE_VERSION:
+            raise RuntimeError(
+                "The session storage is written for google-adk "
+                f"{ADK_STORAGE_VERSION}, {google.adk.__version__} is installed"
+            )
+        # DatabaseSessionService.__init__ would create an engine of its own, and
+        # its append_event commits on the event loop, so neither is reused
+        self.db_engine = db_engine
+        self.metadata = MetaData()
+        self.inspector = inspect(db_engine)
+        self.database_session_factory = sessionmaker(bind=db_engine)
+        self.writer = writer
+        Base.metadata.create_all(db_engine)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        session.last_update_time = await self.writer.write(
+            partial(store_event, session, event)
+        )
+        # Applies the event to the session in memory, skipping ADK's own write
+        await BaseSessionService.append_event(self, session=session, event=event)
+        return event
+
 
 class SessionService:
-    def __init__(self):
+    """Session storage for the whole process.
+
+    Only one instance should exist, created in the app lifespan and injected through
+    server.dependencies.sessions, so that all requests share a single database
+    engine with a tuned connection pool and a single text to speech client.
+    """
+
+    def __init__(self, text_to_speech_service: TextToSpeechService | None = None):
+        """
+        Args:
+            text_to_speech_service: The text to speech service used for turn audio
+        """
         self.app_name = os.getenv("APP_NAME", "Rehearsed")
-        db_url = os.getenv("DB_PATH")
-        self.session_service = DatabaseSessionService(db_url=f"sqlite:///{db_url}")
-        self.text_to_speech_service = TextToSpeechService()
+        self.session_service = StorageSessionService()
+        self.text_to_speech_service = text_to_speech_service or TextToSpeechService()
 
     async def get_all_sessions_for_user(self, user_id: str) -> dict:
-        print(f"Getting all sessions for user: {user_id}")
+        logger.debug("Getting all sessions for user: %s", user_id)
         sessions = await self.session_service.list_sessions(
             app_name=self.app_name, user_id=user_id
         )
-        print(f"Raw sessions response: {sessions}")
-        print(
-            f"Number of sessions found: {len(sessions.sessions) if sessions.sessions else 0}"
+        logger.debug(
+            "Number of sessions found: %d",
+            len(sessions.sessions) if sessions.sessions else 0,
         )
 
         # Sort sessions by lastUpdatedTime in descending order (most recent first)
@@ -31,7 +185,6 @@ class SessionService:
             key=lambda session: session.last_update_time,
             reverse=True,
         )
-        print(f"Sorted sessions: {sorted_sessions}")
 
         # Transform sessions to match client interface
         transformed_sessions = []
@@ -44,38 +197,80 @@ class SessionService:
             transformed_sessions.append(transformed_session)
 
         result = {"sessions": transformed_sessions}
-        print(f"Returning transformed sessions: {result}")
         return result
 
-    def get_session_service(self) -> DatabaseSessionService:
+    def get_session_service(self) -> StorageSessionService:
         return self.session_service
 
-    async def get_or_create_session(self, user_id: str, session_id: str) -> Session:
+    def get_scenario_id(self, session: Session) -> Optional[int]:
+        """Returns the scenario stored in the state of the session, if any"""
+        return session.state.get(SCENARIO_STATE_KEY)
+
+    async def set_scenario_id(self, session: Session, scenario_id: int) -> None:
+        """Stores the scenario in the state of a session created without one"""
+        await self.session_service.append_event(
+            session,
+            Event(
+                author="system",
+                actions=EventActions(state_delta={SCENARIO_STATE_KEY: scenario_id}),
+            ),
+        )
+
+    def get_pool_stats(self) -> dict:
+        """Returns the connection pool state and checkout wait metrics"""
+        return {
+            "pool": self.session_service.db_engine.pool.status(),
+            "checkout": session_pool_metrics.get_stats(),
+            "writer": self.session_service.writer.get_stats(),
+        }
+
+    async def get_or_create_session(
+        self,
+        user_id: str,
+        session_id: str,
+        scenario_id: Optional[int] = None,
+        default_scenario_id: Optional[Callable[[], int]] = None,
+    ) -> Session:
         """Either retrieves an existing session or creates a new one
 
         Args:
             user_id (str): The user ID
             session_id (str): The session ID
+            scenario_id (int): The scenario stored in the state of a new session
+            default_scenario_id (Callable): Resolves the scenario of a new session
+                created without one, so it never follows a later selection
 
         Returns:
             Session: The session
         """
-        print(
-            f"Getting or creating session for user {user_id} and session {session_id}"
+        logger.debug(
+            "Getting or creating session for user %s and session %s",
+            user_id,
+            session_id,
         )
-        session = await self.session_service.get_session(
-            app_name=self.app_name, user_id=user_id, session_id=session_id
-        )
-        if session is None:
-            print(f"Creating new session for user {user_id} and session {session_id}")
-            session = await self.session_service.create_session(
-                app_name=self.app_name,
-                user_id=user_id,
-                session_id=session_id,
+        with SESSION_LOAD_DURATION.time():
+            session = await self.session_service.get_session(
+                app_name=self.app_name, user_id=user_id, session_id=session_id
             )
-            print(f"Session created successfully: {session.id}")
-        else:
-            print(f"Retrieved existing session: {session.id}")
+            if session is None:
+                logger.info(
+                    "Creating new session for user %s and session %s",
+                    user_id,
+                    session_id,
+                )
+                if scenario_id is None and default_scenario_id is not None:
+                    scenario_id = default_scenario_id()
+                session = await self.session_service.create_session(
+                    app_name=self.app_name,
+                    user_id=user_id,
+                    session_id=session_id,
+                    state={SCENARIO_STATE_KEY: scenario_id}
+                    if scenario_id is not None
+                    else None,
+                )
+                logger.debug("Session created successfully: %s", session.id)
+            else:
+                logger.debug("Retrieved existing session: %s", session.id)
         return session
 
     async def get_session_content(
@@ -89,50 +284,133 @@ class SessionService:
         Args:
             user_id (str): The user ID
             session_id (str): The session ID
-            include_audio (bool): Whether to include audio in the conversation
+            include_audio (bool): Whether to inline the audio in the conversation,
+                otherwise each model turn only carries an audio URL
 
         Returns:
             Conversation: The conversation
         """
-        print(f"Getting session content for user {user_id} and session {session_id}")
+        logger.debug(
+            "Getting session content for user %s and session %s", user_id, session_id
+        )
         saved_session = await self.get_or_create_session(user_id, session_id)
         conversation = Conversation(turns=[])
 
-        for event in saved_session.events:
-            # TODO: make an enum with agent names here. This is a hack
-            if (
-                event.content
-                and event.content.parts
-                and event.content.parts[0].text
-                and event.author != "feedback_agent"
-            ):
-                # Generate audio for system responses
-                audio_content = None
-                # TODO: make an enum with "user" and "model" here
-                if event.content.role == "model" and include_audio:
-                    print(
-                        f"Generating audio for system message: {event.content.parts[0].text[:100]}..."
-                    )
-                    audio_content = await self.text_to_speech_service.text_to_speech(
-                        event.content.parts[0].text
-                    )
-                    print(f"Audio content generated: {audio_content is not None}")
-                    if audio_content:
-                        # Properly encode the audio content as base64
-                        audio_content = base64.b64encode(audio_content).decode("utf-8")
-                        print(f"Audio content encoded: {len(audio_content)} bytes")
-
-                conversation_turn = ConversationTurn(
-                    content=event.content.parts[0].text,
-                    role=event.content.role,
-                    author=event.author,
-                    message_id=event.id,
-                    audio=audio_content,
-                )
-                print(
-                    f"Conversation turn created with audio: {conversation_turn.audio is not None}"
+        for event in self._get_conversation_events(saved_session):
+            conversation_turn = self._build_conversation_turn(
+                user_id, session_id, event
+            )
+            # TODO: make an enum with "user" and "model" here
+            if event.content.role == "model" and include_audio:
+                audio_content = await self.text_to_speech_service.text_to_speech(
+                    conversation_turn.content
                 )
-                conversation.turns.append(conversation_turn)
+                if audio_content:
+                    # Properly encode the audio content as base64
+                    conversation_turn.audio = base64.b64encode(audio_content).decode(
+                        "utf-8"
+                    )
+            conversation.turns.append(conversation_turn)
 
-        print(f"Conversation: {conversation}")
+        logger.debug("Conversation loaded with %d turns", len(conversation.turns))
         return conversation
+
+    async def get_session_content_page(
+        self,
+        user_id: str,
+        session_id: str,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> ConversationPage:
+        """Gets a page of the conversation without synthesizing any audio.
+
+        Model turns carry an audio URL which is synthesized, or served from the
+        audio cache, only when the client requests it.
+
+        Args:
+            user_id (str): The user ID
+            session_id (str): The session ID
+            cursor (str): The message ID of the last turn of the previous page,
+                None to start from the beginning of the conversation
+            limit (int): The maximum number of turns in the page
+
+        Returns:
+            ConversationPage: The turns of the page and the cursor of the next one
+        """
+        saved_session = await self.get_or_create_session(user_id, session_id)
+        events = self._get_conversation_events(saved_session)
+
+        start = 0
+        if cursor is not None:
+            message_ids = [event.id for event in events]
+            if cursor not in message_ids:
+                raise ValueError(f"Cursor {cursor} not found in session {session_id}")
+            start = message_ids.index(cursor) + 1
+
+        page_events = events[start : start + limit]
+        turns = [
+            self._build_conversation_turn(user_id, session_id, event)
+            for event in page_events
+        ]
+        has_more = start + limit < len(events)
+        return ConversationPage(
+            turns=turns,
+            next_cursor=turns[-1].message_id if turns and has_more else None,
+        )
+
+    async def get_turn_audio(
+        self, user_id: str, session_id: str, message_id: str
+    ) -> Optional[bytes]:
+        """Synthesizes the audio of a single model turn
+
+        Args:
+            user_id (str): The user ID
+            session_id (str): The session ID
+            message_id (str): The message ID of the turn
+
+        Returns:
+            The audio content in bytes or None if the turn has no audio
+        """
+        saved_session = await self.session_service.get_session(
+            app_name=self.app_name, user_id=user_id, session_id=session_id
+        )
+        if saved_session is None:
+            return None
+
+        for event in self._get_conversation_events(saved_session):
+            if event.id == message_id and event.content.role == "model":
+                # Long turns are synthesized sentence by sentence, one request
+                # would exceed the input limit of the API
+                return await SpeechPipeline(
+                    self.text_to_speech_service
+                ).synthesize_text(event.content.parts[0].text)
+        return None
+
+    def _get_conversation_events(self, saved_session: Session) -> list[Event]:
+        """Returns the events of the session that are shown as conversation turns"""
+        # TODO: make an enum with agent names here. This is a hack
+        return [
+            event
+            for event in saved_session.events
+            if event.content
+            and event.content.parts
+            and event.content.parts[0].text
+            and event.author != "feedback_agent"
+        ]
+
+    def _build_conversation_turn(
+        self, user_id: str, session_id: str, event: Event
+    ) -> ConversationTurn:
+        audio_url = None
+        if event.content.role == "model":
+            audio_url = "/session/turn-audio?" + urlencode(
+                {"user_id": user_id, "session_id": session_id, "message_id": event.id}
+            )
+
+        return ConversationTurn(
+            content=event.content.parts[0].text,
+            role=event.content.role,
+            author=event.author,
+            message_id=event.id,
+            audio_url=audio_url,
+        )
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Optional
+
+from pydantic import BaseModel
+
+from server.service.text_to_speech_service import TextToSpeechService
+
+# Cloud TTS rejects inputs over 5000 bytes, stay well below it per chunk
+MAX_CHUNK_CHARS = 1000
+DEFAULT_MAX_PARALLEL = 4
+
+# A sentence ends with terminal punctuation, optional closing quotes or brackets,
+# followed by whitespace, or with a blank line
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n")
+
+
+class SpeechSegment(BaseModel):
+    """Synthesized audio of one chunk of text, index gives the playback order"""
+
+    index: int
+    author: Optional[str] = None
+    text: str
+    audio: bytes
+
+
+class SentenceSplitter:
+    """Incrementally splits streamed text into sentences"""
+
+    def __init__(self, max_chunk_chars: int = MAX_CHUNK_CHARS):
+        self.max_chunk_chars = max_chunk_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        """Adds text and returns the sentences it completed
+
+        Args:
+            text: The next piece of streamed text
+
+        Returns:
+            The complete sentences, in order
+        """
+        self._buffer += text
+        sentences = []
+        while True:
+            match = SENTENCE_END.search(self._buffer)
+            if not match:
+                break
+            sentences.extend(self._limit(self._buffer[: match.end()]))
+            self._buffer = self._buffer[match.end() :]
+
+        # Text without punctuation still has to be spoken eventually
+        if len(self._buffer) > self.max_chunk_chars:
+            cut = self._buffer.rfind(" ", 0, self.max_chunk_chars)
+            cut = cut if cut > 0 else self.max_chunk_chars
+            sentences.extend(self._limit(self._buffer[:cut]))
+            self._buffer = self._buffer[cut:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        """Returns whatever text is left as the last sentences"""
+        sentences = self._limit(self._buffer)
+        self._buffer = ""
+        return sentences
+
+    def _limit(self, text: str) -> list[str]:
+        text = text.strip()
+        chunks = []
+        while len(text) > self.max_chunk_chars:
+            cut = text.rfind(" ", 0, self.max_chunk_chars)
+            cut = cut if cut > 0 else self.max_chunk_chars
+            chunks.append(text[:cut].strip())
+            text = text[cut:].strip()
+        if text:
+            chunks.append(text)
+        return chunks
+
+
+def split_sentences(text: str, max_chunk_chars: int = MAX_CHUNK_CHARS) -> list[str]:
+    """Splits a complete text into sentences of at most max_chunk_chars"""
+    splitter = SentenceSplitter(max_chunk_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+class SpeechPipeline:
+    """Synthesizes text sentence by sentence while it is still being generated.
+
+    Text is fed per author as it streams in, every completed sentence is
+    synthesized right away with at most max_parallel syntheses in flight, and the
+    audio is emitted in the order the sentences were fed. The first sentence can
+    therefore play while the rest is still being generated or synthesized.
+    """
+
+    def __init__(
+        self,
+        text_to_speech_service: TextToSpeechService,
+        max_parallel: int | None = None,
+    ):
+        """
+        Args:
+            text_to_speech_service: The service used to synthesize each sentence
+            max_parallel: The maximum number of concurrent syntheses
+        """
+        self.text_to_speech_service = text_to_speech_service
+        max_parallel = max_parallel or int(
+            os.getenv("TTS_PIPELINE_MAX_PARALLEL", DEFAULT_MAX_PARALLEL)
+        )
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._splitters: dict[Optional[str], SentenceSplitter] = {}
+        self._tasks: asyncio.Queue[Optional[asyncio.Task]] = asyncio.Queue()
+        self._next_index = 0
+        self._closed = False
+
+    def feed(self, text: str, author: Optional[str] = None) -> None:
+        """Adds streamed text of an author, completed sentences start synthesizing
+
+        Args:
+            text: The next piece of text
+            author: The author of the text
+        """
+        splitter = self._splitters.setdefault(author, SentenceSplitter())
+        for sentence in splitter.feed(text):
+            self._schedule(sentence, author)
+
+    def end_turn(self, author: Optional[str] = None) -> None:
+        """Synthesizes the rest of the text of an author
+
+        Args:
+            author: The author whose turn is complete
+        """
+        splitter = self._splitters.pop(author, None)
+        if splitter:
+            for sentence in splitter.flush():
+                self._schedule(sentence, author)
+
+    def close(self) -> None:
+        """Marks the end of the input, pending text of all authors is flushed"""
+        if self._closed:
+            return
+        for author in list(self._splitters):
+            self.end_turn(author)
+        self._closed = True
+        self._tasks.put_nowait(None)
+
+    async def segments(self) -> AsyncIterator[SpeechSegment]:
+        """Yields the synthesized segments in order until the pipeline is closed.
+
+        Sentences whose synthesis failed are skipped.
+        """
+        task = None
+        try:
+            while True:
+                task = await self._tasks.get()
+                if task is None:
+                    return
+                segment = await task
+                if segment is not None:
+                    yield segment
+        finally:
+            if task is not None and not task.done():
+                task.cancel()
+            self.cancel()
+
+    async def synthesize_text(self, text: str) -> Optional[bytes]:
+        """Synthesizes a complete text as concurrently synthesized sentences.
+
+        MP3 frames can be concatenated, so the result plays as a single file. This
+        also keeps long texts under the per request input limit of the API.
+
+        Args:
+            text: The text to synthesize
+
+        Returns:
+            The audio content in bytes or None if nothing could be synthesized
+        """
+        self.feed(text)
+        self.close()
+        audio_segments = [segment.audio async for segment in self.segments()]
+        return b"".join(audio_segments) if audio_segments else None
+
+    def cancel(self) -> None:
+        """Cancels the syntheses that have not finished"""
+        while not self._tasks.empty():
+            task = self._tasks.get_nowait()
+            if task is not None:
+                task.cancel()
+
+    def _schedule(self, sentence: str, author: Optional[str]) -> None:
+        if self._closed:
+            raise RuntimeError("Speech pipeline is closed")
+        index = self._next_index
+        self._next_index += 1
+        self._tasks.put_nowait(
+            asyncio.create_task(self._synthesize(index, sentence, author))
+        )
+
+    async def _synthesize(
+        self, index: int, sentence: str, author: Optional[str]
+    ) -> Optional[SpeechSegment]:
+        async with self._semaphore:
+            audio_content = await self.text_to_speech_service.text_to_speech(sentence)
+        if not audio_content:
+            return None
+        return SpeechSegment(
+            index=index, author=author, text=sentence, audio=audio_content
+        )
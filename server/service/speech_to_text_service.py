@@ -1,42 +1,346 @@
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
 
+from fastapi import UploadFile
 from google.cloud import speech
+from opentelemetry import trace
+from pydantic import BaseModel
 
+from server.metrics import STT_DURATION
+from server.service.async_backend import get_backend
+from server.service.capture_service import capture_recorder
+from server.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+DEFAULT_CHUNK_BYTES = 32 * 1024
+# Streaming recognize rejects requests carrying more than 25 KB of audio
+MAX_STREAMING_REQUEST_BYTES = 25 * 1024
+# The local backend returns uploads of text as their own transcript
+MAX_LOCAL_TEXT_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when uploaded audio exceeds the maximum upload size"""
+
+
+class AudioFormat(BaseModel):
+    """Encoding of uploaded audio, a sample rate of None is read from the header"""
+
+    encoding: speech.RecognitionConfig.AudioEncoding = (
+        speech.RecognitionConfig.AudioEncoding.WEBM_OPUS
+    )
+    sample_rate_hertz: Optional[int] = 48000  # WebM Opus typically uses 48kHz
+    language_code: str = "en-US"
+
+    @classmethod
+    def from_content_type(cls, content_type: Optional[str]) -> "AudioFormat":
+        """Picks the format from the content type of the upload, WebM by default"""
+        media_type = (content_type or "").split(";")[0].strip().lower()
+        encodings = speech.RecognitionConfig.AudioEncoding
+        if media_type in ("audio/ogg", "audio/opus"):
+            return cls(encoding=encodings.OGG_OPUS)
+        if media_type in ("audio/wav", "audio/x-wav", "audio/wave"):
+            return cls(encoding=encodings.LINEAR16, sample_rate_hertz=None)
+        if media_type == "audio/flac":
+            return cls(encoding=encodings.FLAC, sample_rate_hertz=None)
+        return cls()
+
+
+class SpeechToTextBackend(ABC):
+    """Transcribes audio that arrives as a stream of chunks"""
+
+    @abstractmethod
+    async def transcribe(
+        self, chunks: AsyncIterator[bytes], audio_format: AudioFormat
+    ) -> Optional[str]:
+        """
+        Args:
+            chunks: The audio, consumed as it arrives
+            audio_format: The encoding of the audio
+
+        Returns:
+            The transcript or None if nothing was recognized
+        """
+
+
+class GoogleSpeechToTextBackend(SpeechToTextBackend):
+    """Google Cloud Speech-to-Text streaming recognition.
+
+    The blocking gRPC stream runs on the stt backend executor and pulls the
+    chunks from a queue, so recognition runs while the audio is still arriving.
+    """
 
-class SpeechToTextService:
     def __init__(self):
-        # Initialize the Speech-to-Text client
         self.client = speech.SpeechClient()
+        self.backend = get_backend("stt")
 
-    async def transcribe_audio(self, audio_content: bytes) -> Optional[str]:
+    async def transcribe(
+        self, chunks: AsyncIterator[bytes], audio_format: AudioFormat
+    ) -> Optional[str]:
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=audio_format.encoding,
+                sample_rate_hertz=audio_format.sample_rate_hertz or 0,
+                language_code=audio_format.language_code,
+                enable_automatic_punctuation=True,
+            )
+        )
+        requests: queue.Queue[Optional[bytes]] = queue.Queue()
+
+        def request_iterator():
+            while (chunk := requests.get()) is not None:
+                yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+        def recognize() -> str:
+            responses = self.client.streaming_recognize(
+                config=streaming_config, requests=request_iterator()
+            )
+            return " ".join(
+                result.alternatives[0].transcript
+                for response in responses
+                for result in response.results
+                if result.is_final and result.alternatives
+            )
+
+        recognition = asyncio.ensure_future(self.backend.run(recognize))
+        try:
+            async for chunk in chunks:
+                if recognition.done():
+                    break
+                for start in range(0, len(chunk), MAX_STREAMING_REQUEST_BYTES):
+                    requests.put(chunk[start : start + MAX_STREAMING_REQUEST_BYTES])
+        except BaseException:
+            recognition.cancel()
+            raise
+        finally:
+            requests.put(None)
+        return await recognition or None
+
+
+class LocalSpeechToTextBackend(SpeechToTextBackend):
+    """Deterministic stand in for tests and benchmarks that never calls an API.
+
+    Audio that decodes as UTF-8 text is its own transcript, so tests can choose
+    what was "said". Audio whose SHA-256 is in the transcripts, for example the
+    recorded transcripts of a replayed capture, gets that transcript, any other
+    audio one derived from its hash.
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float | None = None,
+        transcripts: dict[str, str] | None = None,
+    ):
         """
-        Transcribe audio content using Google Cloud Speech-to-Text.
+        Args:
+            latency_seconds: Simulated recognition time after the last chunk
+            transcripts: Transcripts by the SHA-256 hex digest of the audio,
+                read from the JSON file STT_LOCAL_TRANSCRIPTS by default
+        """
+        self.latency_seconds = (
+            latency_seconds
+            if latency_seconds is not None
+            else float(os.getenv("STT_LOCAL_LATENCY_MS", 0)) / 1000
+        )
+        if transcripts is None and os.getenv("STT_LOCAL_TRANSCRIPTS"):
+            with open(os.environ["STT_LOCAL_TRANSCRIPTS"], encoding="utf-8") as f:
+                transcripts = json.load(f)
+        self.transcripts = transcripts or {}
+
+    async def transcribe(
+        self, chunks: AsyncIterator[bytes], audio_format: AudioFormat
+    ) -> Optional[str]:
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        async for chunk in chunks:
+            digest.update(chunk)
+            size += len(chunk)
+            if len(head) <= MAX_LOCAL_TEXT_BYTES:
+                head += chunk
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if not size:
+            return None
+        if digest.hexdigest() in self.transcripts:
+            return self.transcripts[digest.hexdigest()]
+
+        if size <= MAX_LOCAL_TEXT_BYTES:
+            try:
+                text = head.decode("utf-8")
+            except UnicodeDecodeError:
+                text = ""
+            if text.strip() and all(c.isprintable() or c.isspace() for c in text):
+                return text.strip()
+        return f"Transcript {digest.hexdigest()[:12]}"
+
+
+def get_speech_to_text_backend(name: str | None = None) -> SpeechToTextBackend:
+    """Returns the backend named by STT_BACKEND, google or local"""
+    name = name or os.getenv("STT_BACKEND", "google")
+    if name == "local":
+        return LocalSpeechToTextBackend()
+    if name == "google":
+        return GoogleSpeechToTextBackend()
+    raise ValueError(f"Unknown speech to text backend {name}")
+
+
+class SpeechToTextService:
+    def __init__(
+        self,
+        backend: SpeechToTextBackend | None = None,
+        max_upload_bytes: int | None = None,
+        chunk_bytes: int | None = None,
+    ):
+        """
+        Args:
+            backend: The speech to text backend, from STT_BACKEND on first use by
+                default
+            max_upload_bytes: The maximum size of an audio upload
+            chunk_bytes: The size of the chunks uploads are read in
+        """
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+        self.max_upload_bytes = max_upload_bytes or int(
+            os.getenv("STT_MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES)
+        )
+        self.chunk_bytes = chunk_bytes or int(
+            os.getenv("STT_UPLOAD_CHUNK_BYTES", DEFAULT_CHUNK_BYTES)
+        )
+
+    @property
+    def backend(self) -> SpeechToTextBackend:
+        """The speech to text backend, created on first use
+
+        The Google backend creates its client when constructed, which looks up
+        credentials and opens a channel, so it is deferred like the client.
+        """
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = get_speech_to_text_backend()
+                    logger.info("Speech to text backend created")
+        return self._backend
+
+    def warm_up(self) -> None:
+        """Creates the backend ahead of the first request, blocks while doing so"""
+        self.backend
+
+    async def transcribe_audio(
+        self, audio_content: bytes, audio_format: AudioFormat | None = None
+    ) -> Optional[str]:
+        """
+        Transcribe audio content that is already in memory.
 
         Args:
             audio_content: The audio content in bytes
+            audio_format: The encoding of the audio, WebM Opus by default
 
         Returns:
             The transcribed text or None if transcription fails
         """
-        try:
-            # Configure the audio and recognition settings
-            audio = speech.RecognitionAudio(content=audio_content)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-                sample_rate_hertz=48000,  # WebM Opus typically uses 48kHz
-                language_code="en-US",
-                enable_automatic_punctuation=True,
+
+        async def chunks() -> AsyncIterator[bytes]:
+            for start in range(0, len(audio_content), self.chunk_bytes):
+                yield audio_content[start : start + self.chunk_bytes]
+
+        return await self.transcribe_stream(chunks(), audio_format)
+
+    async def transcribe_upload(self, upload: UploadFile) -> Optional[str]:
+        """
+        Transcribe an uploaded file chunk by chunk.
+
+        Starlette spools multipart uploads over 1 MB to a temporary file, the
+        upload is read from there in chunks instead of as a whole.
+
+        Args:
+            upload: The uploaded audio, its content type selects the format
+
+        Returns:
+            The transcribed text or None if transcription fails
+
+        Raises:
+            UploadTooLargeError: If the upload exceeds the maximum upload size
+        """
+        if upload.size is not None and upload.size > self.max_upload_bytes:
+            raise UploadTooLargeError(
+                f"Audio upload of {upload.size} bytes exceeds the limit of "
+                f"{self.max_upload_bytes} bytes"
             )
 
-            # Perform the transcription
-            response = self.client.recognize(config=config, audio=audio)
+        async def chunks() -> AsyncIterator[bytes]:
+            while chunk := await upload.read(self.chunk_bytes):
+                yield chunk
+
+        return await self.transcribe_stream(
+            chunks(), AudioFormat.from_content_type(upload.content_type)
+        )
+
+    async def transcribe_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        audio_format: AudioFormat | None = None,
+    ) -> Optional[str]:
+        """
+        Transcribe audio while it is still arriving.
 
-            # Combine all transcribed text
-            transcript = " ".join(
-                [result.alternatives[0].transcript for result in response.results]
+        Args:
+            chunks: The audio chunks, for example a request body stream
+            audio_format: The encoding of the audio, WebM Opus by default
+
+        Returns:
+            The transcribed text or None if transcription fails
+
+        Raises:
+            UploadTooLargeError: If the audio exceeds the maximum upload size
+        """
+        if self._backend is None:
+            # Creating the backend blocks, it runs on a thread like in warm_up
+            await asyncio.to_thread(self.warm_up)
+        speech_to_text_backend = self._backend
+        backend = type(speech_to_text_backend).__name__
+        start = time.perf_counter()
+        try:
+            with (
+                tracer.start_as_current_span(
+                    "stt.transcribe", attributes={"stt.backend": backend}
+                ),
+                STT_DURATION.labels(backend=backend).time(),
+            ):
+                transcript = await speech_to_text_backend.transcribe(
+                    self._limit(chunks), audio_format or AudioFormat()
+                )
+            capture_recorder.record(
+                "stt",
+                backend=backend,
+                transcript=transcript,
+                seconds=time.perf_counter() - start,
             )
             return transcript
-
+        except UploadTooLargeError:
+            raise
         except Exception as e:
-            print(f"Error transcribing audio: {str(e)}")
+            logger.exception("Error transcribing audio: %s", e)
             return None
+
+    async def _limit(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > self.max_upload_bytes:
+                raise UploadTooLargeError(
+                    f"Audio upload exceeds the limit of {self.max_upload_bytes} bytes"
+                )
+            if chunk:
+                yield chunk
+        trace.get_current_span().set_attribute("stt.audio_bytes", size)
@@ -2,6 +2,8 @@ import os
 
 from google import genai
 
+from server.service.async_backend import get_backend
+
 
 class TextService:
     def __init__(self, project_id: str | None = None, location: str | None = None):
@@ -19,8 +21,9 @@ class TextService:
         except Exception as e:
             error_message = f"Error initializing TextService: {e}"
             raise Exception(error_message)
+        self.backend = get_backend("text")
 
-    def generate_markdown_text(
+    async def generate_markdown_text(
         self, prompt: str, model: str = "gemini-2.5-flash-preview-05-20"
     ) -> str:
         """
@@ -30,8 +33,10 @@ class TextService:
             prompt: The prompt to generate text from
             model: The model to use for the generation
         """
-        response = self.client.models.generate_content(
-            model=model,
-            contents=prompt,
+        response = await self.backend.run_async(
+            lambda: self.client.aio.models.generate_content(
+                model=model,
+                contents=prompt,
+            )
         )
         return response.text
@@ -1,22 +1,123 @@
+import hashlib
+import logging
+import os
+import threading
+import time
 from typing import Optional
 
 from google.cloud import texttospeech
 
+from server.metrics import TTS_AUDIO_BYTES, TTS_DURATION
+from server.service.async_backend import get_backend
+from server.service.audio_cache_service import AudioCacheService, default_audio_cache
+from server.service.capture_service import capture_recorder, encode_bytes
+from server.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+VOICE_PARAMS = {
+    "language_code": "en-US",
+    "name": "en-US-Chirp3-HD-Zephyr",  # Using a neural voice for better quality
+}
+AUDIO_CONFIG_PARAMS = {
+    "audio_encoding": "MP3",
+    "speaking_rate": 1.0,
+    "pitch": 0.0,
+}
+# MP3 at 32 kbps, roughly 15 characters of text are spoken per second
+LOCAL_BYTES_PER_CHAR = 270
+
+
+class LocalTextToSpeechClient:
+    """Deterministic stand in for the Cloud TTS client in tests and benchmarks.
+
+    Returns audio bytes derived from the hash of the text, sized like MP3 of the
+    spoken text. It blocks for the simulated latency like the real client, which
+    runs on the tts backend executor as well.
+    """
+
+    def __init__(self, latency_seconds: float | None = None):
+        """
+        Args:
+            latency_seconds: Simulated synthesis time of a request
+        """
+        self.latency_seconds = (
+            latency_seconds
+            if latency_seconds is not None
+            else float(os.getenv("TTS_LOCAL_LATENCY_MS", 0)) / 1000
+        )
+
+    def synthesize_speech(
+        self,
+        input: texttospeech.SynthesisInput,
+        voice: texttospeech.VoiceSelectionParams,
+        audio_config: texttospeech.AudioConfig,
+    ) -> texttospeech.SynthesizeSpeechResponse:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        digest = hashlib.sha256(input.text.encode("utf-8")).digest()
+        size = max(len(input.text), 1) * LOCAL_BYTES_PER_CHAR
+        audio_content = (digest * (size // len(digest) + 1))[:size]
+        return texttospeech.SynthesizeSpeechResponse(audio_content=audio_content)
+
+
+def get_text_to_speech_client(name: str | None = None):
+    """Returns the client named by TTS_BACKEND, google or local"""
+    name = name or os.getenv("TTS_BACKEND", "google")
+    if name == "local":
+        return LocalTextToSpeechClient()
+    if name == "google":
+        return texttospeech.TextToSpeechClient()
+    raise ValueError(f"Unknown text to speech backend {name}")
+
 
 class TextToSpeechService:
-    def __init__(self):
+    def __init__(
+        self,
+        audio_cache: AudioCacheService | None = None,
+        client: texttospeech.TextToSpeechClient | LocalTextToSpeechClient | None = None,
+    ):
+        """
+        Args:
+            audio_cache: The synthesized audio cache, shared across services by default
+            client: The Text-to-Speech client, from TTS_BACKEND on first use by
+                default
+        """
         try:
-            # Initialize the Text-to-Speech client
-            self.client = texttospeech.TextToSpeechClient()
-            print("TextToSpeechService initialized successfully")
+            self._client = client
+            self._client_lock = threading.Lock()
+            self.audio_cache = audio_cache or default_audio_cache
+            self.backend = get_backend("tts")
+            logger.info("TextToSpeechService initialized successfully")
         except Exception as e:
-            print(f"Error initializing TextToSpeechService: {str(e)}")
+            logger.exception("Error initializing TextToSpeechService: %s", e)
             raise
 
+    @property
+    def client(self) -> texttospeech.TextToSpeechClient | LocalTextToSpeechClient:
+        """The Text-to-Speech client, created on first use
+
+        Creating the Google client looks up credentials and opens a channel, so
+        it is deferred until the first synthesis or warm_up.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = get_text_to_speech_client()
+                    logger.info("Text-to-Speech client created")
+        return self._client
+
+    def warm_up(self) -> None:
+        """Creates the client ahead of the first request, blocks while doing so"""
+        self.client
+
     async def text_to_speech(self, text: str) -> Optional[bytes]:
         """
         Convert text to speech using Google Cloud Text-to-Speech.
 
+        Audio is served from the cache when the same text was synthesized before
+        with the same voice and audio config.
+
         Args:
             text: The text to convert to speech
 
@@ -24,35 +125,65 @@ class TextToSpeechService:
             The audio content in bytes or None if conversion fails
         """
         try:
-            print(f"Attempting to convert text to speech: {text[:100]}...")
-
-            # Set the text input to be synthesized
-            synthesis_input = texttospeech.SynthesisInput(text=text)
-
-            # Build the voice request
-            voice = texttospeech.VoiceSelectionParams(
-                language_code="en-US",
-                name="en-US-Chirp3-HD-Zephyr",  # Using a neural voice for better quality
-            )
-
-            # Select the type of audio file
-            audio_config = texttospeech.AudioConfig(
-                audio_encoding=texttospeech.AudioEncoding.MP3,
-                speaking_rate=1.0,
-                pitch=0.0,
-            )
-
-            print("Sending request to Google Cloud Text-to-Speech API...")
-            # Perform the text-to-speech request
-            response = self.client.synthesize_speech(
-                input=synthesis_input, voice=voice, audio_config=audio_config
-            )
-
-            print(
-                f"Received response from API, audio content length: {len(response.audio_content)} bytes"
-            )
-            return response.audio_content
-
+            key = AudioCacheService.make_key(text, VOICE_PARAMS, AUDIO_CONFIG_PARAMS)
+            with tracer.start_as_current_span(
+                "tts.text_to_speech", attributes={"tts.text_chars": len(text)}
+            ):
+                return await self.audio_cache.get_or_synthesize(
+                    key, lambda: self._synthesize(text)
+                )
         except Exception as e:
-            print(f"Error converting text to speech: {str(e)}")
+            logger.exception("Error converting text to speech: %s", e)
             return None
+
+    def get_cache_stats(self) -> dict:
+        """Returns the hit and miss counters of the audio cache"""
+        return self.audio_cache.get_stats()
+
+    async def _synthesize(self, text: str) -> Optional[bytes]:
+        logger.debug("Attempting to convert text to speech: %.100s...", text)
+
+        # Set the text input to be synthesized
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+
+        # Build the voice request
+        voice = texttospeech.VoiceSelectionParams(**VOICE_PARAMS)
+
+        # Select the type of audio file
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding[
+                AUDIO_CONFIG_PARAMS["audio_encoding"]
+            ],
+            speaking_rate=AUDIO_CONFIG_PARAMS["speaking_rate"],
+            pitch=AUDIO_CONFIG_PARAMS["pitch"],
+        )
+
+        # Perform the text-to-speech request, a cache hit has no such span
+        start = time.perf_counter()
+        with tracer.start_as_current_span("tts.synthesize") as span:
+            with TTS_DURATION.time():
+                # The client is resolved on the executor, creating it blocks
+                response = await self.backend.run(
+                    lambda: self.client.synthesize_speech(
+                        input=synthesis_input,
+                        voice=voice,
+                        audio_config=audio_config,
+                    )
+                )
+            span.set_attribute("tts.audio_bytes", len(response.audio_content))
+        TTS_AUDIO_BYTES.observe(len(response.audio_content))
+        capture_recorder.record(
+            "tts",
+            text=text,
+            audio_bytes=len(response.audio_content),
+            seconds=time.perf_counter() - start,
+            audio=encode_bytes(response.audio_content)
+            if capture_recorder.include_tts_audio
+            else None,
+        )
+
+        logger.debug(
+            "Received response from API, audio content length: %d bytes",
+            len(response.audio_content),
+        )
+        return response.audio_content
@@ -0,0 +1,175 @@
+import importlib
+import inspect
+import logging
+import pkgutil
+from types import ModuleType
+from typing import Callable
+
+from google.adk.tools import FunctionTool
+
+from server.models.agent_model import AgentPydantic
+from server.tracing import traced_tool
+
+logger = logging.getLogger(__name__)
+
+PATH_TO_TOOLS = "server.tools"
+
+# Parameters ADK fills in itself rather than the model
+INJECTED_PARAMETERS = {"tool_context"}
+
+
+class ToolRegistryError(ValueError):
+    """Raised when a tool is invalid or an agent references an unknown tool"""
+
+
+class ToolRegistry:
+    """Every tool of server.tools, imported and wrapped once at startup.
+
+    Tools are the public functions defined in the modules of the tools package.
+    Agents reference them by name, or as module.name when several modules define a
+    tool with the same name, and share the same FunctionTool instances, so
+    building an agent never imports or inspects anything.
+    """
+
+    def __init__(self, package: str = PATH_TO_TOOLS):
+        """
+        Args:
+            package: The package whose modules are scanned for tools
+
+        Raises:
+            ToolRegistryError: If a tool has a signature ADK cannot call
+        """
+        self.package = package
+        self._tools: dict[str, FunctionTool] = {}
+        self._modules: dict[str, str] = {}
+        self._ambiguous: set[str] = set()
+        for module in self._import_modules():
+            for name, function in self._find_tools(module):
+                self._register(module, name, function)
+
+    def get_tool(self, tool_name: str, module_name: str | None = None) -> FunctionTool:
+        """Returns the tool with the given name
+
+        Args:
+            tool_name: The name of the tool, optionally prefixed with its module
+            module_name: The module the tool is expected to be defined in
+
+        Raises:
+            ToolRegistryError: If there is no such tool or the name is ambiguous
+        """
+        if module_name and "." not in tool_name:
+            tool_name = f"{module_name}.{tool_name}"
+        if tool_name in self._ambiguous:
+            raise ToolRegistryError(
+                f"Tool {tool_name} is defined in several modules, reference it "
+                "as module.name"
+            )
+        if tool_name not in self._tools:
+            raise ToolRegistryError(f"Tool {tool_name} not found in {self.package}")
+        return self._tools[tool_name]
+
+    def get_tools(self, agent_pydantic: AgentPydantic) -> list[FunctionTool]:
+        """Returns the tools referenced by an agent
+
+        The comma separated tools of the agent are resolved by name. The modules
+        field is optional, when it is set it must either name a single module for
+        all tools or one module per tool.
+
+        Raises:
+            ToolRegistryError: If a tool is unknown or the modules do not match
+        """
+        tool_names = self._split(agent_pydantic.tools)
+        module_names = self._split(agent_pydantic.modules)
+        if len(module_names) == 1:
+            module_names = module_names * len(tool_names)
+        elif module_names and len(module_names) != len(tool_names):
+            raise ToolRegistryError(
+                f"Agent {agent_pydantic.name} lists {len(tool_names)} tools but "
+                f"{len(module_names)} modules"
+            )
+
+        try:
+            return [
+                self.get_tool(tool_name, module_names[i] if module_names else None)
+                for i, tool_name in enumerate(tool_names)
+            ]
+        except ToolRegistryError as e:
+            raise ToolRegistryError(f"Agent {agent_pydantic.name}: {e}")
+
+    def validate_agent(self, agent_pydantic: AgentPydantic) -> None:
+        """Checks that every tool referenced by the agent exists
+
+        Raises:
+            ToolRegistryError: If a tool is unknown or the modules do not match
+        """
+        self.get_tools(agent_pydantic)
+
+    def list_tools(self) -> list[str]:
+        """Returns the qualified module.name of every tool"""
+        return sorted(name for name in self._tools if "." in name)
+
+    def _import_modules(self) -> list[ModuleType]:
+        package = importlib.import_module(self.package)
+        return [
+            importlib.import_module(f"{self.package}.{module_info.name}")
+            for module_info in pkgutil.iter_modules(package.__path__)
+            if not module_info.name.startswith("_")
+        ]
+
+    def _find_tools(self, module: ModuleType) -> list[tuple[str, Callable]]:
+        """Returns the public functions defined in the module itself"""
+        return [
+            (name, function)
+            for name, function in inspect.getmembers(module, inspect.isfunction)
+            if not name.startswith("_") and function.__module__ == module.__name__
+        ]
+
+    def _register(self, module: ModuleType, name: str, function: Callable) -> None:
+        module_name = module.__name__.rsplit(".", 1)[-1]
+        self._validate_signature(module_name, name, function)
+        logger.info("Registering tool %s from module %s", name, module_name)
+
+        # The wrapper records a span per call and keeps the signature for ADK
+        tool = FunctionTool(func=traced_tool(f"{module_name}.{name}", function))
+        self._tools[f"{module_name}.{name}"] = tool
+        if name in self._modules:
+            self._ambiguous.add(name)
+            self._tools.pop(name, None)
+        else:
+            self._modules[name] = module_name
+            self._tools[name] = tool
+
+    def _validate_signature(
+        self, module_name: str, name: str, function: Callable
+    ) -> None:
+        """Checks that ADK can build a function declaration for the tool
+
+        ADK does not support default values, and the model can only fill in
+        parameters whose type it knows.
+        """
+        if not inspect.getdoc(function):
+            raise ToolRegistryError(
+                f"Tool {module_name}.{name} needs a docstring, the model uses it "
+                "to decide when to call the tool"
+            )
+        for parameter in inspect.signature(function).parameters.values():
+            if parameter.name in INJECTED_PARAMETERS:
+                continue
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                raise ToolRegistryError(
+                    f"Tool {module_name}.{name} cannot take *args or **kwargs"
+                )
+            if parameter.annotation is parameter.empty:
+                raise ToolRegistryError(
+                    f"Parameter {parameter.name} of tool {module_name}.{name} "
+                    "needs a type annotation"
+                )
+            if parameter.default is not parameter.empty:
+                raise ToolRegistryError(
+                    f"Parameter {parameter.name} of tool {module_name}.{name} "
+                    "cannot have a default value"
+                )
+
+    @staticmethod
+    def _split(value: str | None) -> list[str]:
+        return [item.strip() for item in (value or "").split(",") if item.strip()]
@@ -0,0 +1,199 @@
+import os
+
+import numpy as np
+from pydantic import BaseModel
+
+from server.service.audio_codecs import MODEL_INPUT_RATE, SAMPLE_WIDTH
+
+DEFAULT_THRESHOLD_DBFS = -45.0
+DEFAULT_FRAME_MS = 20
+# Long enough for the model to notice the end of the utterance itself
+DEFAULT_HANGOVER_MS = 1000
+DEFAULT_PREROLL_MS = 200
+DEFAULT_KEEPALIVE_MS = 0
+
+
+class VoiceActivityStats(BaseModel):
+    connection_id: str
+    frames_in: int
+    frames_sent: int
+    frames_dropped: int
+    bytes_sent: int
+    bytes_dropped: int
+
+
+class VoiceActivityDetector:
+    """Energy based voice activity detection on the audio sent to the model.
+
+    The audio is cut into fixed frames and the RMS level of all frames of a chunk
+    is computed at once. Frames above the threshold are speech, the frames
+    within the hangover after speech and the preroll before it are kept too, so
+    words are not clipped and the model still hears the pause that ends a turn.
+    Longer silences are dropped, or thinned to one frame per keepalive interval.
+    """
+
+    def __init__(
+        self,
+        connection_id: str = "",
+        sample_rate: int = MODEL_INPUT_RATE,
+        threshold_dbfs: float | None = None,
+        frame_ms: int | None = None,
+        hangover_ms: int | None = None,
+        preroll_ms: int | None = None,
+        keepalive_ms: int | None = None,
+    ):
+        """
+        Args:
+            connection_id: Identifies the connection in the stats
+            sample_rate: The sample rate of the 16 bit mono PCM
+            threshold_dbfs: The level above which a frame is speech
+            frame_ms: The length of a frame
+            hangover_ms: How long to keep sending after the last speech frame
+            preroll_ms: How much audio before speech to keep
+            keepalive_ms: Send one silent frame per interval, 0 drops all silence
+        """
+        self.connection_id = connection_id
+        self.threshold_dbfs = (
+            threshold_dbfs
+            if threshold_dbfs is not None
+            else float(os.getenv("VAD_THRESHOLD_DBFS", DEFAULT_THRESHOLD_DBFS))
+        )
+        frame_ms = frame_ms or int(os.getenv("VAD_FRAME_MS", DEFAULT_FRAME_MS))
+        hangover_ms = self._get_ms(hangover_ms, "VAD_HANGOVER_MS", DEFAULT_HANGOVER_MS)
+        preroll_ms = self._get_ms(preroll_ms, "VAD_PREROLL_MS", DEFAULT_PREROLL_MS)
+        keepalive_ms = self._get_ms(
+            keepalive_ms, "VAD_KEEPALIVE_MS", DEFAULT_KEEPALIVE_MS
+        )
+
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * SAMPLE_WIDTH
+        self.hangover_frames = hangover_ms // frame_ms
+        self.preroll_frames = preroll_ms // frame_ms
+        self.keepalive_frames = keepalive_ms // frame_ms
+
+        self._remainder = b""
+        # Frames since the last speech frame, starts out as a long silence
+        self._silent_frames = self.hangover_frames + 1
+        self._frame_index = 0
+        self._preroll = b""
+
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def process(self, pcm: bytes) -> bytes:
+        """Returns the audio of the chunk that should reach the model
+
+        Partial frames are held back until the next chunk completes them.
+
+        Args:
+            pcm: The next chunk of 16 bit mono PCM
+
+        Returns:
+            The kept frames, empty when the whole chunk is silence
+        """
+        pcm = self._remainder + pcm
+        frame_count = len(pcm) // self.frame_bytes
+        self._remainder = pcm[frame_count * self.frame_bytes :]
+        if not frame_count:
+            return b""
+
+        frames = np.frombuffer(
+            pcm, dtype="<i2", count=frame_count * self.frame_samples
+        ).reshape(frame_count, self.frame_samples)
+        is_speech = self._is_speech(frames)
+        keep = self._select_frames(is_speech)
+        audio = frames[keep].tobytes()
+        kept_count = int(keep.sum())
+
+        # Speech close to the start of the chunk also needs the preroll from the
+        # silence that ended the previous chunk
+        if is_speech.any() and self._preroll:
+            missing_frames = self.preroll_frames - int(np.argmax(is_speech))
+            if missing_frames > 0:
+                preroll = self._preroll[-missing_frames * self.frame_bytes :]
+                audio = preroll + audio
+                recovered = len(preroll) // self.frame_bytes
+                self.frames_sent += recovered
+                self.frames_dropped -= recovered
+        self._preroll = self._trailing_silence(frames, keep)
+
+        self.frames_in += frame_count
+        self.frames_sent += kept_count
+        self.frames_dropped += frame_count - kept_count
+        return audio
+
+    def get_stats(self) -> VoiceActivityStats:
+        return VoiceActivityStats(
+            connection_id=self.connection_id,
+            frames_in=self.frames_in,
+            frames_sent=self.frames_sent,
+            frames_dropped=self.frames_dropped,
+            bytes_sent=self.frames_sent * self.frame_bytes,
+            bytes_dropped=self.frames_dropped * self.frame_bytes,
+        )
+
+    def _is_speech(self, frames: np.ndarray) -> np.ndarray:
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        dbfs = 20 * np.log10(np.maximum(rms, 1.0) / 32768)
+        return dbfs > self.threshold_dbfs
+
+    def _select_frames(self, is_speech: np.ndarray) -> np.ndarray:
+        """Marks speech frames plus their hangover, preroll and keepalive frames"""
+        frame_count = len(is_speech)
+        positions = np.arange(frame_count)
+
+        # Distance to the previous speech frame, continuing from the last chunk
+        previous_speech = np.maximum.accumulate(
+            np.where(is_speech, positions, -self._silent_frames - 1)
+        )
+        since_speech = positions - previous_speech
+        keep = since_speech <= self.hangover_frames
+
+        # Distance to the next speech frame within the chunk
+        next_speech = np.minimum.accumulate(
+            np.where(is_speech, positions, frame_count + self.preroll_frames)[::-1]
+        )[::-1]
+        keep |= next_speech - positions <= self.preroll_frames
+
+        if self.keepalive_frames:
+            keep |= (self._frame_index + positions) % self.keepalive_frames == 0
+
+        self._silent_frames = int(since_speech[-1])
+        self._frame_index += frame_count
+        return keep
+
+    def _trailing_silence(self, frames: np.ndarray, keep: np.ndarray) -> bytes:
+        """Returns the dropped frames at the end of the chunk, at most the preroll"""
+        if not self.preroll_frames or keep[-1]:
+            return b""
+        preroll_bytes = self.preroll_frames * self.frame_bytes
+        if not keep.any():
+            return (self._preroll + frames.tobytes())[-preroll_bytes:]
+        last_kept = len(keep) - 1 - int(np.argmax(keep[::-1]))
+        return frames[last_kept + 1 :].tobytes()[-preroll_bytes:]
+
+    @staticmethod
+    def _get_ms(value: int | None, env_var: str, default: int) -> int:
+        return value if value is not None else int(os.getenv(env_var, default))
+
+
+class VoiceActivityRegistry:
+    """Keeps the detectors of the open websockets for the stats endpoint"""
+
+    def __init__(self):
+        self._detectors: dict[str, VoiceActivityDetector] = {}
+
+    def add(self, detector: VoiceActivityDetector) -> None:
+        self._detectors[detector.connection_id] = detector
+
+    def remove(self, detector: VoiceActivityDetector) -> None:
+        if self._detectors.get(detector.connection_id) is detector:
+            del self._detectors[detector.connection_id]
+
+    def get_stats(self) -> list[VoiceActivityStats]:
+        return [detector.get_stats() for detector in self._detectors.values()]
+
+
+voice_activity_registry = VoiceActivityRegistry()
@@ -0,0 +1,135 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from server.service.audio_codecs import (
+    AudioTranscoder,
+    CodecName,
+    MulawCodec,
+    Pcm16Codec,
+    Resampler,
+)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+needs_audioop = pytest.mark.skipif(audioop is None, reason="audioop was removed")
+
+ALL_SAMPLES = np.arange(-32768, 32768, dtype="<i2").tobytes()
+
+
+def sine(frequency: float, rate: int, seconds: float, amplitude: int = 8000):
+    times = np.arange(int(rate * seconds)) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * times)).astype("<i2")
+
+
+def split(data: bytes, sizes: list[int]) -> list[bytes]:
+    chunks, start = [], 0
+    while start < len(data):
+        size = sizes[len(chunks) % len(sizes)]
+        chunks.append(data[start : start + size])
+        start += size
+    return chunks
+
+
+def to_samples(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<i2").astype(np.int32)
+
+
+@needs_audioop
+def test_mulaw_encode_matches_audioop():
+    assert MulawCodec().encode(ALL_SAMPLES) == audioop.lin2ulaw(ALL_SAMPLES, 2)
+
+
+@needs_audioop
+def test_mulaw_decode_matches_audioop():
+    codes = bytes(range(256))
+
+    assert MulawCodec().decode(codes) == audioop.ulaw2lin(codes, 2)
+
+
+@needs_audioop
+def test_mulaw_round_trip_matches_audioop_within_one_lsb():
+    codec = MulawCodec()
+    expected = to_samples(audioop.ulaw2lin(audioop.lin2ulaw(ALL_SAMPLES, 2), 2))
+
+    decoded = to_samples(codec.decode(codec.encode(ALL_SAMPLES)))
+
+    assert np.abs(decoded - expected).max() <= 1
+
+
+def test_pcm16_passes_audio_through():
+    codec = Pcm16Codec()
+
+    assert codec.decode(codec.encode(ALL_SAMPLES)) == ALL_SAMPLES
+
+
+@pytest.mark.parametrize("from_rate, to_rate", [(48000, 16000), (16000, 24000)])
+def test_resampler_output_does_not_depend_on_the_chunks(from_rate, to_rate):
+    pcm = sine(440, from_rate, 0.5).tobytes()
+    whole = Resampler(from_rate, to_rate).process(pcm)
+
+    resampler = Resampler(from_rate, to_rate)
+    chunked = b"".join(
+        resampler.process(chunk) for chunk in split(pcm, [321, 1000, 77, 4096])
+    )
+
+    assert len(chunked) == len(whole)
+    assert np.abs(to_samples(chunked) - to_samples(whole)).max() <= 1
+
+
+def test_resampler_keeps_an_odd_byte_for_the_next_chunk():
+    pcm = sine(440, 16000, 0.1).tobytes()
+    resampler = Resampler(16000, 16000)
+
+    first = resampler.process(pcm[:101])
+    second = resampler.process(pcm[101:])
+
+    assert len(first) == 100
+    assert first + second == pcm
+
+
+@pytest.mark.parametrize("from_rate, to_rate", [(48000, 16000), (16000, 24000)])
+def test_resampler_changes_the_length_by_the_rate_ratio(from_rate, to_rate):
+    pcm = sine(440, from_rate, 1.0).tobytes()
+
+    resampled = Resampler(from_rate, to_rate).process(pcm)
+
+    assert abs(len(resampled) // 2 - to_rate) <= 1
+
+
+def test_resampler_round_trip_keeps_speech_frequencies():
+    original = sine(300, 16000, 0.5)
+    upsampled = Resampler(16000, 24000).process(original.tobytes())
+
+    round_trip = to_samples(Resampler(24000, 16000).process(upsampled))
+
+    # The two tap average of the downsampler delays the signal by half a sample
+    # at 24 kHz, a third of a sample at 16 kHz
+    delayed = 8000 * np.sin(
+        2 * np.pi * 300 * (np.arange(len(round_trip)) - 1 / 3) / 16000
+    )
+    error = np.abs(round_trip - delayed)[100:-100]
+    assert error.max() < 80
+
+
+def test_transcoder_falls_back_to_pcm16_for_unknown_codecs():
+    transcoder = AudioTranscoder("opus")
+
+    assert transcoder.codec_name == CodecName.PCM16
+
+
+def test_transcoder_round_trips_mulaw_at_the_model_rates():
+    transcoder = AudioTranscoder(CodecName.MULAW)
+    pcm = sine(440, 24000, 0.1).tobytes()
+
+    encoded = transcoder.encode_output(pcm)
+
+    assert len(encoded) == len(pcm) // 2
+    decoded = to_samples(MulawCodec().decode(encoded))
+    assert np.abs(decoded - to_samples(pcm)).max() < 300
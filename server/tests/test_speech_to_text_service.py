@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import io
+from typing import AsyncIterator
+
+import pytest
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from server.service.speech_to_text_service import (
+    LocalSpeechToTextBackend,
+    SpeechToTextBackend,
+    SpeechToTextService,
+    UploadTooLargeError,
+)
+
+
+def make_service(**kwargs) -> SpeechToTextService:
+    return SpeechToTextService(
+        backend=LocalSpeechToTextBackend(latency_seconds=0), **kwargs
+    )
+
+
+def make_upload(data: bytes, declare_size: bool = True) -> UploadFile:
+    return UploadFile(
+        file=io.BytesIO(data),
+        size=len(data) if declare_size else None,
+        headers=Headers({"content-type": "audio/wav"}),
+    )
+
+
+async def stream(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+def test_backend_without_transcribe_cannot_be_created():
+    class IncompleteBackend(SpeechToTextBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_transcribe_stream_returns_text_audio_as_its_transcript():
+    service = make_service()
+
+    transcript = asyncio.run(
+        service.transcribe_stream(stream(b"What is ", b"a fraction?"))
+    )
+
+    assert transcript == "What is a fraction?"
+
+
+def test_transcribe_stream_uses_the_recorded_transcript_of_the_audio():
+    audio = bytes(range(256)) * 4
+    backend = LocalSpeechToTextBackend(
+        latency_seconds=0,
+        transcripts={hashlib.sha256(audio).hexdigest(): "Recorded words"},
+    )
+    service = SpeechToTextService(backend=backend)
+
+    transcript = asyncio.run(
+        service.transcribe_stream(stream(audio[:100], audio[100:]))
+    )
+
+    assert transcript == "Recorded words"
+
+
+def test_transcribe_stream_derives_the_transcript_of_other_audio_from_its_hash():
+    audio = bytes(range(256)) * 4
+    service = make_service()
+
+    transcript = asyncio.run(service.transcribe_stream(stream(audio)))
+
+    assert transcript == f"Transcript {hashlib.sha256(audio).hexdigest()[:12]}"
+
+
+def test_transcribe_stream_returns_none_without_audio():
+    service = make_service()
+
+    assert asyncio.run(service.transcribe_stream(stream())) is None
+
+
+def test_transcribe_stream_rejects_audio_over_the_limit():
+    service = make_service(max_upload_bytes=10)
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(service.transcribe_stream(stream(b"123456", b"789012")))
+
+
+def test_transcribe_upload_reads_the_upload_in_chunks():
+    service = make_service(chunk_bytes=4)
+    upload = make_upload(b"Read in small chunks")
+
+    transcript = asyncio.run(service.transcribe_upload(upload))
+
+    assert transcript == "Read in small chunks"
+
+
+def test_transcribe_upload_rejects_a_declared_size_over_the_limit():
+    service = make_service(max_upload_bytes=10)
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(service.transcribe_upload(make_upload(b"Far too long to accept")))
+
+
+def test_transcribe_upload_rejects_an_undeclared_size_over_the_limit():
+    service = make_service(max_upload_bytes=10, chunk_bytes=4)
+    upload = make_upload(b"Far too long to accept", declare_size=False)
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(service.transcribe_upload(upload))
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from server.service.voice_activity import VoiceActivityDetector
+
+RATE = 16000
+
+
+def make_detector(**kwargs) -> VoiceActivityDetector:
+    settings = dict(
+        threshold_dbfs=-45.0,
+        frame_ms=20,
+        hangover_ms=1000,
+        preroll_ms=200,
+        keepalive_ms=0,
+    )
+    settings.update(kwargs)
+    return VoiceActivityDetector(connection_id="test", sample_rate=RATE, **settings)
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(RATE * seconds), dtype="<i2")
+
+
+def speech(seconds: float) -> np.ndarray:
+    times = np.arange(int(RATE * seconds)) / RATE
+    return (8000 * np.sin(2 * np.pi * 220 * times)).astype("<i2")
+
+
+def utterance() -> bytes:
+    return np.concatenate([silence(2), speech(1), silence(2)]).tobytes()
+
+
+def split(data: bytes, sizes: list[int]) -> list[bytes]:
+    chunks, start = [], 0
+    while start < len(data):
+        size = sizes[len(chunks) % len(sizes)]
+        chunks.append(data[start : start + size])
+        start += size
+    return chunks
+
+
+def seconds_of(audio: bytes) -> float:
+    return len(audio) / 2 / RATE
+
+
+def test_speech_keeps_the_preroll_and_the_hangover():
+    audio = utterance()
+
+    kept = make_detector().process(audio)
+
+    # 200 ms of preroll, 1 s of speech and 1 s of hangover
+    assert seconds_of(kept) == pytest.approx(2.2)
+    assert kept == audio[int(1.8 * RATE) * 2 : int(4.0 * RATE) * 2]
+
+
+@pytest.mark.parametrize("sizes", [[640], [333, 1001, 77], [1, 6399, 12345]])
+def test_chunked_audio_gives_the_same_output_as_whole_audio(sizes):
+    audio = utterance()
+    whole = make_detector().process(audio)
+
+    detector = make_detector()
+    chunked = b"".join(detector.process(chunk) for chunk in split(audio, sizes))
+
+    assert chunked == whole
+
+
+def test_preroll_is_recovered_from_the_previous_chunk():
+    detector = make_detector()
+
+    first = detector.process(silence(1).tobytes())
+    second = detector.process(speech(0.5).tobytes())
+
+    assert first == b""
+    assert seconds_of(second) == pytest.approx(0.7)
+
+
+def test_partial_frames_are_held_back():
+    detector = make_detector()
+    frame = speech(0.02).tobytes()
+
+    assert detector.process(frame[:100]) == b""
+    assert detector.process(frame[100:]) == frame
+
+
+def test_keepalive_sends_one_frame_per_interval_of_silence():
+    detector = make_detector(keepalive_ms=500, preroll_ms=0)
+
+    kept = detector.process(silence(2).tobytes())
+
+    assert seconds_of(kept) == pytest.approx(0.08)
+
+
+def test_stats_count_the_sent_and_dropped_frames():
+    detector = make_detector()
+    audio = utterance()
+
+    for chunk in split(audio, [1000]):
+        detector.process(chunk)
+    stats = detector.get_stats()
+
+    assert stats.frames_in == 250
+    assert stats.frames_sent == 110
+    assert stats.frames_dropped == 140
+    assert stats.bytes_sent == 110 * detector.frame_bytes
@@ -12,7 +12,7 @@ async def generate_text(prompt: str, tool_context: "ToolContext") -> dict:
     file_name = "text.md"
 
     text_service = TextService()
-    text_response = text_service.generate_markdown_text(prompt)
+    text_response = await text_service.generate_markdown_text(prompt)
     if text_response is None:
         await tool_context.save_artifact(
             file_name,
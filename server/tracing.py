@@ -0,0 +1,174 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Callable, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "timetoteach-server"
+DEFAULT_TRACE_FILE = "traces.jsonl"
+# Spans kept by the memory exporter, the oldest are dropped first
+DEFAULT_MEMORY_SPANS = 5000
+
+tracer = trace.get_tracer("server")
+
+_provider: Optional[TracerProvider] = None
+_memory_exporter: Optional["BoundedMemorySpanExporter"] = None
+
+
+class BoundedMemorySpanExporter(InMemorySpanExporter):
+    """Keeps the most recent finished spans in memory for the traces endpoint"""
+
+    def __init__(self, max_spans: int = DEFAULT_MEMORY_SPANS):
+        super().__init__()
+        self._finished_spans = deque(maxlen=max_spans)
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends every finished span as one line of JSON to a file"""
+
+    def __init__(self, path: str = DEFAULT_TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(lines)
+        except OSError as e:
+            logger.error("Could not write spans to %s: %s", self.path, e)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+
+def setup_tracing() -> None:
+    """Installs a tracer provider with the exporter named by TRACE_EXPORTER.
+
+    none (the default) leaves tracing off, memory keeps the recent spans for
+    /traces, file appends them as JSON lines to TRACE_FILE and console prints
+    them. Several exporters can be combined, like "memory,file". ADK records its
+    own spans for LLM and tool calls, these end up in the same traces. Calling
+    this again is a no-op.
+    """
+    global _provider, _memory_exporter
+    exporters = [
+        name.strip().lower()
+        for name in os.getenv("TRACE_EXPORTER", "none").split(",")
+        if name.strip() and name.strip().lower() != "none"
+    ]
+    if _provider is not None or not exporters:
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    for name in exporters:
+        if name == "memory":
+            _memory_exporter = BoundedMemorySpanExporter(
+                int(os.getenv("TRACE_MEMORY_SPANS", DEFAULT_MEMORY_SPANS))
+            )
+            provider.add_span_processor(SimpleSpanProcessor(_memory_exporter))
+        elif name == "file":
+            file_exporter = JsonLinesSpanExporter(
+                os.getenv("TRACE_FILE", DEFAULT_TRACE_FILE)
+            )
+            provider.add_span_processor(BatchSpanProcessor(file_exporter))
+        elif name == "console":
+            provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+        else:
+            raise ValueError(f"Unknown trace exporter {name}")
+    trace.set_tracer_provider(provider)
+    _provider = provider
+    logger.info("Tracing enabled with exporters %s", ", ".join(exporters))
+
+
+def shutdown_tracing() -> None:
+    """Exports the pending spans and shuts the tracer provider down"""
+    global _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+
+
+def get_memory_exporter() -> Optional[BoundedMemorySpanExporter]:
+    """Returns the memory exporter if TRACE_EXPORTER includes memory"""
+    return _memory_exporter
+
+
+def traced_tool(name: str, function: Callable) -> Callable:
+    """Wraps a tool so every call is recorded as a span named tool.<name>
+
+    The wrapper keeps the signature and docstring of the tool, so ADK builds the
+    same function declaration from it.
+
+    Args:
+        name: The qualified module.name of the tool
+        function: The tool function, sync or async
+    """
+    attributes = {"tool.name": name}
+
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(f"tool.{name}", attributes=attributes):
+                return await function(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with tracer.start_as_current_span(f"tool.{name}", attributes=attributes):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+async def traces_endpoint(limit: int = 50) -> JSONResponse:
+    """Serves the most recent traces of the memory exporter, newest first
+
+    Args:
+        limit: The maximum number of traces to return
+    """
+    if _memory_exporter is None:
+        return JSONResponse(
+            content={"error": "Set TRACE_EXPORTER=memory to keep traces"},
+            status_code=404,
+        )
+
+    traces: dict[str, list[dict]] = {}
+    for span in reversed(_memory_exporter.get_finished_spans()):
+        trace_id = format(span.context.trace_id, "032x")
+        if trace_id not in traces:
+            if len(traces) == limit:
+                continue
+            traces[trace_id] = []
+        traces[trace_id].append(json.loads(span.to_json(indent=None)))
+
+    return JSONResponse(
+        content=[
+            {
+                "trace_id": trace_id,
+                "spans": sorted(spans, key=lambda span: span["start_time"]),
+            }
+            for trace_id, spans in traces.items()
+        ]
+    )